@@ -8,6 +8,7 @@ import { createRoot } from 'react-dom/client';
 import SolidHexTileLayer from './SolidHexTileLayer'
 import IconHexTileLayer from './IconHexTileLayer'
 import allData from './process/combine_hex_med_res_norm.json'
+import layerStats from './process/combine_hex_med_res_norm_layer_stats.json'
 // import groundwaterData from './Baseline_Groundwater.json'
 import { Map } from 'react-map-gl';
 import { interpolateBlues, interpolatePRGn, interpolateReds } from 'd3';
@@ -234,7 +235,9 @@ function getTooltip({ object }) {
   );
 }
 
-const _elevScale = d3.scaleLinear(d3.extent(Object.values(allData[allData.length - 1]).map(e => e.Elevation)), [0, 50000])
+// Elevation extent of the finest resolution, precomputed by process_combine.py
+const finestStats = layerStats.resolutions[layerStats.resolutions.length - 1].layers.Elevation
+const _elevScale = d3.scaleLinear([finestStats.min, finestStats.max], [0, 50000])
 
 const elevScale = elev => Math.min(_elevScale(elev), 20000)
 
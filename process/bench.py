@@ -0,0 +1,277 @@
+import argparse
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import ujson
+import process_hex, process_combine
+import synthetic
+from raster import geojsonToGridPointsVectorized
+from weights import buildHexOperators
+from groundwater import readGroundwater
+
+# Offline benchmarks of the processing stages on synthetic inputs (synthetic.py),
+# no API or Baseline_Groundwater.json needed. Every stage runs for each point of
+# the sweep sizes x vertices x holes and records
+#
+#   seconds     best wall time of --repeat untraced runs
+#   peakBytes   peak traced allocation (tracemalloc) of one extra run
+#
+# Results are written as JSON; --compare checks them against an earlier file and
+# exits with status 1 if any stage got slower (or hungrier) than --threshold.
+#
+#   python bench.py --out bench.json
+#   python bench.py --quick --compare bench.json
+#   python bench.py --stages avgArrOfArr maxCounter --sizes 100 1000
+
+# lattice sampling stages, run on the demand unit features
+def benchPolygonToPoints(fixture):
+    points = 0
+    for feature in fixture["du"]:
+        points += len(process_hex.polygonToPoints(feature))
+    return { "points": points }
+
+def benchGeojsonToGridPoints(fixture):
+    fixture["gridPoints"] = process_hex.geojsonToGridPoints(fixture["du"])
+    return { "points": len(fixture["gridPoints"]) }
+
+def benchGridPointsVectorized(fixture):
+    return { "points": len(geojsonToGridPointsVectorized(fixture["du"], process_hex.scale)) }
+
+def gridPoints(fixture):
+    if "gridPoints" not in fixture:
+        fixture["gridPoints"] = geojsonToGridPointsVectorized(fixture["du"], process_hex.scale)
+    return fixture["gridPoints"]
+
+def benchGridPointsToHexPoints(fixture):
+    resPoints = process_hex.gridPointsToHexPoints(fixture["du"], gridPoints(fixture), process_hex.avgDiffUnmet, fixture["resRange"])
+    return { "hexes": [len(points) for points in resPoints] }
+
+# the averaging functions on their own, over every demand unit at once (what
+# one hex covering all of them would cost)
+def benchAvgArrOfArr(fixture):
+    return { "timesteps": len(process_hex.avgArrOfArr([f["properties"]["UnmetDemand"] for f in fixture["du"]])) }
+
+def benchMaxCounter(fixture):
+    # one entry per lattice point, as aggLandUse sees them
+    codes = [fixture["du"][ind]["properties"]["LandUse"] for _, _, ind in gridPoints(fixture)]
+    return { "categories": len(process_hex.maxCounter(codes)), "points": len(codes) }
+
+def benchColumnar(fixture):
+    resPoints = process_hex.geojsonToHexPoints(fixture["du"], process_hex.avgDiffUnmet, fixture["resRange"], engine="columnar")
+    return { "hexes": [len(points) for points in resPoints] }
+
+def benchOperator(fixture):
+    # built directly rather than through hexOperators, so no cached operator is reused
+    operators = buildHexOperators(fixture["du"], list(range(fixture["resRange"][0], fixture["resRange"][1] + 1)), "lattice", process_hex.scale)
+    resPoints = process_hex.operatorsToHexPoints(fixture["du"], operators, process_hex.avgDiffUnmet)
+    return { "hexes": [len(points) for points in resPoints] }
+
+def benchReadGroundwater(fixture):
+    fixture["gw"] = readGroundwater(fixture["gwPath"])
+    return { "features": len(fixture["gw"]) }
+
+def benchCombine(fixture):
+    outputName = os.path.join(fixture["workDir"], "combine")
+    stats = process_combine.combineLayers(combineLayers(fixture), outputName, ["json", "binary"])
+    return { "hexes": [s["hexes"] for s in stats] }
+
+# layer files for the combine stage, written once per fixture
+def combineLayers(fixture):
+    if "layers" in fixture:
+        return fixture["layers"]
+
+    resRange = fixture["resRange"]
+    if "gw" not in fixture:
+        fixture["gw"] = readGroundwater(fixture["gwPath"])
+
+    outputs = [
+        ("groundwater.json", fixture["gw"], process_hex.avgGroundwater, None),
+        ("diff.json", fixture["du"], process_hex.avgDiffUnmet, ["UnmetDemand", "Difference"]),
+        ("landuse.json", fixture["du"], process_hex.aggLandUse, ["LandUse"]),
+    ]
+
+    fixture["layers"] = []
+    for filename, features, avgFn, props in outputs:
+        operators = buildHexOperators(features, list(range(resRange[0], resRange[1] + 1)), "lattice", process_hex.scale)
+        path = os.path.join(fixture["workDir"], filename)
+        with open(path, "w") as outfile:
+            ujson.dump(process_hex.operatorsToHexPoints(features, operators, avgFn), outfile)
+        fixture["layers"].append((path, props))
+
+    return fixture["layers"]
+
+# name -> function, in the order they run
+allStages = {
+    "polygonToPoints": benchPolygonToPoints,
+    "geojsonToGridPoints": benchGeojsonToGridPoints,
+    "gridPointsVectorized": benchGridPointsVectorized,
+    "gridPointsToHexPoints": benchGridPointsToHexPoints,
+    "avgArrOfArr": benchAvgArrOfArr,
+    "maxCounter": benchMaxCounter,
+    "columnar": benchColumnar,
+    "operator": benchOperator,
+    "readGroundwater": benchReadGroundwater,
+    "combine": benchCombine,
+}
+
+# inputs a stage needs that are not part of what it measures, prepared before timing
+setups = {
+    "gridPointsToHexPoints": gridPoints,
+    "maxCounter": gridPoints,
+    "combine": combineLayers,
+}
+
+# /**
+#  *
+#  * returns (seconds, peakBytes, counters) of fn(fixture): the best of repeat
+#  * untraced runs, and the tracemalloc peak of one more run
+#  */
+def measure(fn, fixture, repeat=1):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        counters = fn(fixture)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    tracemalloc.start()
+    try:
+        fn(fixture)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak, counters
+
+def makeFixture(size, vertices, holes, timesteps, seed, resRange, workDir):
+    du = synthetic.demandUnitFeatures(size, seed, vertices, holes, timesteps)
+    gw = synthetic.groundwaterFeatures(size, seed + 1, vertices, holes, timesteps + 1)
+
+    gwPath = os.path.join(workDir, "groundwater_features.json")
+    with open(gwPath, "w") as outfile:
+        ujson.dump(synthetic.featureCollection(gw), outfile)
+
+    return { "du": du, "gwPath": gwPath, "resRange": resRange, "workDir": workDir }
+
+# /**
+#  *
+#  * runs stages over the sweep, returns the result rows
+#  * [{ stage, size, vertices, holes, seconds, peakBytes, counters }, ...]
+#  */
+def runSweep(stages, sizes, vertices, holes, timesteps=1200, seed=0, resRange=(5, 6), repeat=1, log=print):
+    results = []
+
+    for size in sizes:
+        for nVertices in vertices:
+            for withHoles in holes:
+                with tempfile.TemporaryDirectory() as workDir:
+                    fixture = makeFixture(size, nVertices, withHoles, timesteps, seed, list(resRange), workDir)
+
+                    for name in stages:
+                        if name in setups:
+                            setups[name](fixture)
+                        seconds, peak, counters = measure(allStages[name], fixture, repeat)
+                        results.append({
+                            "stage": name, "size": size, "vertices": nVertices, "holes": withHoles,
+                            "seconds": seconds, "peakBytes": peak, "counters": counters,
+                        })
+                        log("%-22s size %5d  vertices %4d  holes %-5s  %9.3fs  %9.1f MB" % (name, size, nVertices, withHoles, seconds, peak / 2**20))
+
+    return results
+
+def resultKey(row):
+    return (row["stage"], row["size"], row["vertices"], row["holes"])
+
+# /**
+#  *
+#  * returns rows of { key, seconds ratio, memory ratio, regressed } for the
+#  * results also present in baseline; timings under minSeconds in both runs are
+#  * too noisy to flag
+#  */
+def compareResults(results, baseline, threshold=0.25, minSeconds=0.05):
+    previous = { resultKey(row): row for row in baseline }
+    rows = []
+
+    for row in results:
+        old = previous.get(resultKey(row))
+        if old is None:
+            continue
+
+        timeRatio = row["seconds"] / old["seconds"] if old["seconds"] > 0 else float("inf")
+        memoryRatio = row["peakBytes"] / old["peakBytes"] if old["peakBytes"] > 0 else float("inf")
+        slower = timeRatio > 1 + threshold and max(row["seconds"], old["seconds"]) >= minSeconds
+        hungrier = memoryRatio > 1 + threshold
+
+        rows.append({ "key": resultKey(row), "timeRatio": timeRatio, "memoryRatio": memoryRatio, "regressed": slower or hungrier })
+
+    return rows
+
+def printComparison(rows):
+    for row in rows:
+        stage, size, vertices, holes = row["key"]
+        print("%-22s size %5d  vertices %4d  holes %-5s  time x%.2f  memory x%.2f%s" % (
+            stage, size, vertices, holes, row["timeRatio"], row["memoryRatio"], "  REGRESSION" if row["regressed"] else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="offline benchmarks of the processing stages on synthetic inputs")
+    parser.add_argument("--stages", nargs="+", choices=list(allStages), default=list(allStages))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 40, 160], help="polygon counts")
+    parser.add_argument("--vertices", nargs="+", type=int, default=[12, 96], help="outer ring vertex counts")
+    parser.add_argument("--holes", nargs="+", choices=["no", "yes"], default=["no", "yes"], help="polygons without / with holes")
+    parser.add_argument("--timesteps", type=int, default=1200)
+    parser.add_argument("--res", nargs=2, type=int, default=[5, 6], metavar=("MIN", "MAX"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="untraced runs per stage, the fastest is kept")
+    parser.add_argument("--quick", action="store_true", help="one small fixture, for a smoke test")
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--compare", help="earlier results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown / memory growth before flagging, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out) if args.out else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+
+    # the reference engine reads elevcorr.png relative to the scripts
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    sizes, vertices, holes = args.sizes, args.vertices, [h == "yes" for h in args.holes]
+    if args.quick:
+        sizes, vertices, holes = [5], [12], [False]
+
+    results = runSweep(args.stages, sizes, vertices, holes, args.timesteps, args.seed, args.res, args.repeat)
+
+    report = {
+        "meta": {
+            "createdAt": time.time(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "scale": process_hex.scale,
+            "timesteps": args.timesteps,
+            "resRange": args.res,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    if out:
+        with open(out, "w") as outfile:
+            ujson.dump(report, outfile, indent=2)
+
+    if compare:
+        with open(compare) as infile:
+            baseline = ujson.load(infile)["results"]
+
+        rows = compareResults(results, baseline, args.threshold)
+        printComparison(rows)
+
+        if any(row["regressed"] for row in rows):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
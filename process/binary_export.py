@@ -0,0 +1,379 @@
+import os
+import h3
+import numpy as np
+import ujson
+from pyramid import temporalPyramid, levelIndex, levelStats
+
+# Binary export of the per-resolution hex objects written by process_hex.py /
+# process_combine.py. Instead of one nested JSON document the output directory
+# holds
+#
+#   manifest.json                  hex ids per resolution and per-layer metadata
+#   <layer>_r<res>.bin             one contiguous little-endian buffer per layer
+#                                  and resolution, hex-major: value t of hex i
+#                                  is at index i * timesteps + t
+#
+# so a browser can fetch a buffer and wrap it in a Float32Array (or a Uint16Array
+# decoded as float16) without parsing. Hexes missing a layer are NaN, and
+# categorical layers (LandUse) store the dominant class as uint8 with 255 missing.
+# Vector layers (LandUseFractions) are fixed-width numeric rows stored like a
+# series, with "timesteps" the vector width.
+#
+# With levels (see pyramid.py) every series layer also gets its temporal levels
+# of detail,
+#
+#   <layer>_<level>_<stat>_r<res>.bin   mean / min / max of every group of months
+#
+# listed per resolution under "levels", and per layer in the manifest as
+# "levels" [{ name, factor, timesteps }, ...] (monthly first), for picking one
+# with pyramid.levelForRate.
+
+seriesLayers = ["Groundwater", "UnmetDemand", "Difference"]
+scalarLayers = ["Elevation"]
+categoryLayers = ["LandUse"]
+vectorLayers = ["LandUseFractions"]
+
+missingCategory = 255
+
+def hexItems(hexObjects):
+    # process_gw.py writes [[hexId, obj], ...] instead of {hexId: obj}
+    return hexObjects.items() if isinstance(hexObjects, dict) else hexObjects
+
+def resolutionOf(hexObjects):
+    for hexId, _ in hexItems(hexObjects):
+        return h3.get_resolution(hexId)
+    return None
+
+def seriesLength(hexObjects, layer):
+    for _, obj in hexItems(hexObjects):
+        if layer in obj:
+            return len(obj[layer])
+    return 0
+
+# /**
+#  *
+#  * returns (hexes x timesteps) array of one layer, NaN where a hex lacks it
+#  */
+def layerMatrix(hexObjects, layer, dtype=np.float32):
+    items = list(hexItems(hexObjects))
+
+    if layer in categoryLayers:
+        matrix = np.full((len(items), 1), missingCategory, dtype=np.uint8)
+        for i, (_, obj) in enumerate(items):
+            if len(obj.get(layer, [])) != 0:
+                matrix[i, 0] = obj[layer][0]
+        return matrix
+
+    if layer in scalarLayers:
+        matrix = np.full((len(items), 1), np.nan, dtype=dtype)
+        for i, (_, obj) in enumerate(items):
+            if layer in obj:
+                matrix[i, 0] = obj[layer]
+        return matrix
+
+    matrix = np.full((len(items), seriesLength(hexObjects, layer)), np.nan, dtype=dtype)
+    for i, (_, obj) in enumerate(items):
+        if layer in obj:
+            matrix[i] = obj[layer]
+    return matrix
+
+def layerFilename(layer, res):
+    return "%s_r%d.bin" % (layer, res)
+
+def levelFilename(layer, level, stat, res):
+    return "%s_%s_%s_r%d.bin" % (layer, level, stat, res)
+
+# writes the levels of one series layer x resolution, adds them to resEntry["levels"]
+def writeLevels(matrix, outDir, layer, res, levels, resEntry, numericType):
+    layerLevels = resEntry.setdefault("levels", {}).setdefault(layer, {})
+
+    for name, stats in temporalPyramid(matrix, levels).items():
+        layerLevels[name] = {}
+
+        for stat in levelStats:
+            block = np.ascontiguousarray(stats[stat].astype(numericType))
+            filename = levelFilename(layer, name, stat, res)
+
+            with open(os.path.join(outDir, filename), "wb") as outfile:
+                outfile.write(block.tobytes())
+
+            layerLevels[name][stat] = { "file": filename, "byteLength": block.nbytes, "timesteps": block.shape[1] }
+
+def layerMeta(layer, dtype):
+    return {
+        "dtype": "uint8" if layer in categoryLayers else np.dtype(dtype).name,
+        "kind": "category" if layer in categoryLayers else ("scalar" if layer in scalarLayers else ("vector" if layer in vectorLayers else "series")),
+        "missing": missingCategory if layer in categoryLayers else "NaN",
+    }
+
+def presentLayers(resObjects):
+    found = set()
+    for hexObjects in resObjects:
+        for _, obj in hexItems(hexObjects):
+            found.update(obj)
+    return [layer for layer in seriesLayers + scalarLayers + categoryLayers + vectorLayers if layer in found]
+
+def newManifest():
+    return {
+        "version": 1,
+        "byteOrder": "little",
+        "layout": "hex-major",
+        "resolutions": [],
+        "layers": {},
+    }
+
+# writes the buffers (and levels, if given) of one resolution and adds it to manifest
+def writeBinaryResolution(hexObjects, outDir, layers, manifest, dtype="float32", levels=None):
+    res = resolutionOf(hexObjects)
+    if res is None:
+        return
+
+    numericType = np.dtype(dtype).newbyteorder("<")
+
+    hexIds = [hexId for hexId, _ in hexItems(hexObjects)]
+
+    resEntry = { "resolution": res, "hexIds": hexIds, "buffers": {} }
+
+    for layer in layers:
+        if layer in categoryLayers:
+            matrix = layerMatrix(hexObjects, layer)
+        else:
+            values = layerMatrix(hexObjects, layer, np.float32)
+            matrix = values.astype(numericType)
+
+        filename = layerFilename(layer, res)
+        with open(os.path.join(outDir, filename), "wb") as outfile:
+            outfile.write(np.ascontiguousarray(matrix).tobytes())
+
+        resEntry["buffers"][layer] = { "file": filename, "byteLength": matrix.nbytes, "timesteps": matrix.shape[1] }
+
+        if levels and layer in seriesLayers:
+            # from the float32 values, not from the possibly float16 buffer
+            writeLevels(values, outDir, layer, res, levels, resEntry, numericType)
+
+        if layer not in manifest["layers"]:
+            manifest["layers"][layer] = layerMeta(layer, dtype)
+            if levels and layer in seriesLayers:
+                manifest["layers"][layer]["levels"] = levelIndex(matrix.shape[1], levels)
+
+    manifest["resolutions"].append(resEntry)
+
+def writeManifest(manifest, outDir, filename="manifest.json"):
+    with open(os.path.join(outDir, filename), "w") as outfile:
+        ujson.dump(manifest, outfile)
+
+# /**
+#  *
+#  * writes the manifest and one buffer per layer x resolution to outDir,
+#  * returns the manifest
+#  *
+#  * resObjects: array ordered by resolution, as written by process_combine.py
+#  * dtype: "float32" or "float16" for the numeric layers
+#  * levels: temporal levels of the series layers, [(name, factor), ...] as in
+#  *         pyramid.levels, None for none
+#  */
+def writeBinary(resObjects, outDir, layers=None, dtype="float32", levels=None):
+    os.makedirs(outDir, exist_ok=True)
+
+    if layers is None:
+        layers = presentLayers(resObjects)
+
+    manifest = newManifest()
+
+    for hexObjects in resObjects:
+        writeBinaryResolution(hexObjects, outDir, layers, manifest, dtype, levels)
+
+    writeManifest(manifest, outDir)
+
+    return manifest
+
+# /**
+#  *
+#  * same output as writeBinary, written from batches as they are produced so
+#  * the full resObjects never has to be in memory
+#  *
+#  * resBatches: (res, [[hexId, obj], ...]) in resolution order, any number of
+#  *             batches per resolution
+#  */
+def writeBinaryStream(resBatches, outDir, layers, dtype="float32"):
+    os.makedirs(outDir, exist_ok=True)
+
+    numericType = np.dtype(dtype).newbyteorder("<")
+
+    manifest = newManifest()
+    manifest["layers"] = { layer: layerMeta(layer, dtype) for layer in layers }
+
+    resEntry, outfiles = None, {}
+
+    def closeRes():
+        for layer, outfile in outfiles.items():
+            resEntry["buffers"][layer]["byteLength"] = outfile.tell()
+            outfile.close()
+        outfiles.clear()
+
+    for res, batch in resBatches:
+        if resEntry is None or resEntry["resolution"] != res:
+            if resEntry is not None:
+                closeRes()
+            resEntry = { "resolution": res, "hexIds": [], "buffers": {} }
+            manifest["resolutions"].append(resEntry)
+            for layer in layers:
+                outfiles[layer] = open(os.path.join(outDir, layerFilename(layer, res)), "wb")
+                resEntry["buffers"][layer] = { "file": layerFilename(layer, res), "byteLength": 0, "timesteps": 1 }
+
+        resEntry["hexIds"].extend(hexId for hexId, _ in batch)
+
+        for layer in layers:
+            if layer in categoryLayers:
+                matrix = layerMatrix(batch, layer)
+            else:
+                matrix = layerMatrix(batch, layer, np.float32).astype(numericType)
+
+            if len(batch) != 0:
+                resEntry["buffers"][layer]["timesteps"] = matrix.shape[1]
+            outfiles[layer].write(np.ascontiguousarray(matrix).tobytes())
+
+    if resEntry is not None:
+        closeRes()
+
+    writeManifest(manifest, outDir)
+
+    return manifest
+
+# /**
+#  *
+#  * reads one layer x resolution buffer back as a (hexes x timesteps) array
+#  */
+def readLayer(outDir, manifest, layer, resIndex):
+    entry = manifest["resolutions"][resIndex]["buffers"][layer]
+    dtype = np.dtype(manifest["layers"][layer]["dtype"]).newbyteorder("<")
+
+    matrix = np.fromfile(os.path.join(outDir, entry["file"]), dtype=dtype)
+    return matrix.reshape(-1, entry["timesteps"])
+
+# Time-chunked variant for playback: every series layer x resolution is split
+# into blocks of chunkSize timesteps,
+#
+#   index.json                     hex ids per resolution, chunk boundaries and files
+#   <layer>_r<res>_t<start>.bin    hex-major block [start, start + chunkSize)
+#
+# so a client only fetches the block around its current timestep (and prefetches
+# the next). Scalar, categorical and vector layers are small and written whole,
+# as in writeBinary, and so are the temporal levels (at most a third of the
+# monthly length).
+
+def chunkFilename(layer, res, start):
+    return "%s_r%d_t%04d.bin" % (layer, res, start)
+
+def chunkStarts(timesteps, chunkSize):
+    return list(range(0, timesteps, chunkSize))
+
+def newIndex(chunkSize):
+    return {
+        "version": 1,
+        "byteOrder": "little",
+        "layout": "hex-major",
+        "chunkSize": chunkSize,
+        "resolutions": [],
+        "layers": {},
+    }
+
+# writes the chunks (and levels, if given) of one resolution and adds it to index
+def writeChunkResolution(hexObjects, outDir, chunkSize, layers, index, dtype="float32", levels=None):
+    res = resolutionOf(hexObjects)
+    if res is None:
+        return
+
+    numericType = np.dtype(dtype).newbyteorder("<")
+
+    hexIds = [hexId for hexId, _ in hexItems(hexObjects)]
+
+    resEntry = { "resolution": res, "hexIds": hexIds, "buffers": {}, "chunks": {} }
+
+    for layer in layers:
+        if layer in seriesLayers:
+            values = layerMatrix(hexObjects, layer, np.float32)
+            matrix = values.astype(numericType)
+            timesteps = matrix.shape[1]
+            chunks = []
+
+            for start in chunkStarts(timesteps, chunkSize):
+                block = np.ascontiguousarray(matrix[:, start:start + chunkSize])
+                filename = chunkFilename(layer, res, start)
+
+                with open(os.path.join(outDir, filename), "wb") as outfile:
+                    outfile.write(block.tobytes())
+
+                chunks.append({ "start": start, "end": start + block.shape[1], "file": filename, "byteLength": block.nbytes })
+
+            resEntry["chunks"][layer] = chunks
+
+            if levels:
+                writeLevels(values, outDir, layer, res, levels, resEntry, numericType)
+        else:
+            if layer in categoryLayers:
+                matrix = layerMatrix(hexObjects, layer)
+            else:
+                matrix = layerMatrix(hexObjects, layer, np.float32).astype(numericType)
+            timesteps = matrix.shape[1]
+
+            filename = layerFilename(layer, res)
+            with open(os.path.join(outDir, filename), "wb") as outfile:
+                outfile.write(np.ascontiguousarray(matrix).tobytes())
+
+            resEntry["buffers"][layer] = { "file": filename, "byteLength": matrix.nbytes, "timesteps": timesteps }
+
+        if layer not in index["layers"]:
+            index["layers"][layer] = dict(layerMeta(layer, dtype), timesteps=timesteps)
+            if levels and layer in seriesLayers:
+                index["layers"][layer]["levels"] = levelIndex(timesteps, levels)
+
+    index["resolutions"].append(resEntry)
+
+# /**
+#  *
+#  * writes index.json and the chunked buffers to outDir, returns the index
+#  */
+def writeTimeChunks(resObjects, outDir, chunkSize=120, layers=None, dtype="float32", levels=None):
+    os.makedirs(outDir, exist_ok=True)
+
+    if layers is None:
+        layers = presentLayers(resObjects)
+
+    index = newIndex(chunkSize)
+
+    for hexObjects in resObjects:
+        writeChunkResolution(hexObjects, outDir, chunkSize, layers, index, dtype, levels)
+
+    writeManifest(index, outDir, "index.json")
+
+    return index
+
+# entry of the chunk holding timestep t
+def chunkForTimestep(index, layer, resIndex, t):
+    for chunk in index["resolutions"][resIndex]["chunks"][layer]:
+        if chunk["start"] <= t < chunk["end"]:
+            return chunk
+    return None
+
+# /**
+#  *
+#  * reads one chunk back as a (hexes x chunk length) array
+#  */
+def readChunk(outDir, index, layer, chunk):
+    dtype = np.dtype(index["layers"][layer]["dtype"]).newbyteorder("<")
+
+    matrix = np.fromfile(os.path.join(outDir, chunk["file"]), dtype=dtype)
+    return matrix.reshape(-1, chunk["end"] - chunk["start"])
+
+# /**
+#  *
+#  * reads one stat ("mean", "min" or "max") of a temporal level back as a
+#  * (hexes x level timesteps) array, from a manifest or an index
+#  */
+def readLevel(outDir, manifest, layer, resIndex, level, stat="mean"):
+    entry = manifest["resolutions"][resIndex]["levels"][layer][level][stat]
+    dtype = np.dtype(manifest["layers"][layer]["dtype"]).newbyteorder("<")
+
+    matrix = np.fromfile(os.path.join(outDir, entry["file"]), dtype=dtype)
+    return matrix.reshape(-1, entry["timesteps"])
@@ -0,0 +1,104 @@
+import math
+import h3
+import numpy as np
+from columnar import rollupSums
+from geoarea import WGS84_RADIUS
+
+# Vectorized aggregation of categorical layers (LandUse). Instead of one
+# maxCounter dict per hex, the totals of every (hex, category) pair come from one
+# bincount over integer category codes,
+#
+#   counts[h, c]     total weight of the lattice points in hex h whose feature is in c
+#   firstSeen[h, c]  lowest index of a feature in c among hex h's features
+#
+# and each hex is written as
+#
+#   <prop>            categories present, most weight first and equal weights in
+#                     order of first appearance, as maxCounter ranks them
+#   <prop>Fractions   fixed-width vector of each category's share of the hex
+#   <prop>Dominant    the first category of <prop>
+#
+# Coarser resolutions can be derived from a finer one by summing the children's
+# counts into their parents (columnar.rollupSums), and taking the lowest of
+# their firstSeen.
+
+# /**
+#  *
+#  * returns the area in m^2 each lattice point stands for, the 1 / scale degree
+#  * cell around it, for weighting categories by area instead of by point count
+#  */
+def latticeCellAreas(lats, scale):
+    side = WGS84_RADIUS * math.pi / 180 / scale
+    return side * side * np.cos(np.radians(lats))
+
+# /**
+#  *
+#  * returns (nGroups x nCategories) total weight per category, given the group
+#  * of every (point, feature) pair and an integer category code per feature
+#  */
+def categoryCounts(codes, groups, inds, nGroups, nCategories, weights=None):
+    codes = np.asarray(codes, dtype=np.int64)
+    cells = groups * nCategories + codes[inds]
+
+    counts = np.bincount(cells, weights=weights, minlength=nGroups * nCategories)
+    return counts.reshape(nGroups, nCategories).astype(np.float64)
+
+# firstSeen entry of a category a hex has no feature of
+NOT_SEEN = np.iinfo(np.int64).max
+
+# /**
+#  *
+#  * returns (nGroups x nCategories) lowest feature index of each category in
+#  * each group, NOT_SEEN where absent; the reference engine bins features in
+#  * index order, so this is the order maxCounter sees categories in
+#  */
+def categoryFirstSeen(codes, groups, inds, nGroups, nCategories):
+    codes = np.asarray(codes, dtype=np.int64)
+    inds = np.asarray(inds, dtype=np.int64)
+
+    firstSeen = np.full(nGroups * nCategories, NOT_SEEN, dtype=np.int64)
+    np.minimum.at(firstSeen, groups * nCategories + codes[inds], inds)
+    return firstSeen.reshape(nGroups, nCategories)
+
+def categoryFractions(counts):
+    totals = counts.sum(axis=1)
+    fractions = np.zeros_like(counts)
+    np.divide(counts, totals[:, None], out=fractions, where=totals[:, None] > 0)
+    return fractions
+
+def dominantCategories(counts):
+    return np.argmax(counts, axis=1)
+
+def rankedCategories(counts, firstSeen):
+    # present categories by decreasing weight, ties by first appearance as
+    # maxCounter breaks them
+    order = np.lexsort((firstSeen, -counts), axis=1)
+    present = np.take_along_axis(firstSeen, order, axis=1) != NOT_SEEN
+    return [row[keep].tolist() for row, keep in zip(order, present)]
+
+# /**
+#  *
+#  * returns [{ prop, propFractions, propDominant }, ...], one per row of counts
+#  * and firstSeen (categoryFirstSeen); fractions are rounded to digits decimals
+#  * unless digits is None
+#  */
+def categoryValues(counts, firstSeen, prop, digits=None):
+    fractions = categoryFractions(counts)
+    if digits is not None:
+        fractions = np.round(fractions, digits)
+
+    ranked = rankedCategories(counts, firstSeen)
+    # the first ranked category, so a tie picks the same one as prop[0]
+    dominant = [r[0] if r else int(d) for r, d in zip(ranked, dominantCategories(counts).tolist())]
+
+    return [{ prop: r, prop + "Fractions": f, prop + "Dominant": d } for r, f, d in zip(ranked, fractions.tolist(), dominant)]
+
+def rollupCounts(hexIds, counts, firstSeen, res):
+    parentIds, parentCounts, _ = rollupSums(hexIds, counts, counts.sum(axis=1), res)
+
+    parentIndex = { hexId: p for p, hexId in enumerate(parentIds) }
+    groups = np.array([parentIndex[h3.cell_to_parent(hexId, res)] for hexId in hexIds], dtype=np.int64)
+
+    parentFirst = np.full((len(parentIds), counts.shape[1]), NOT_SEEN, dtype=np.int64)
+    np.minimum.at(parentFirst, groups, firstSeen)
+    return parentIds, parentCounts, parentFirst
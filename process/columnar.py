@@ -0,0 +1,118 @@
+import numpy as np
+import h3
+
+# Columnar engine for the time-series layers. Each feature's series is loaded
+# once into a dense (features x timesteps) matrix, and a resolution is then
+# aggregated as one grouped reduction over (hex, feature) rows instead of
+# averaging lists element by element (avgArrOfArr in process_hex.py).
+
+# The Groundwater dicts carry one non-timestep entry, keyed "" (the feature's
+# id), after the monthly values
+ID_KEY = ""
+
+# the timestep values of a series; the only place the "" entry of a dict series
+# is dropped, lists and arrays are all timesteps whatever their length
+def seriesValues(series):
+    # already numeric, e.g. a row from groundwater.readSeriesFeatures
+    if isinstance(series, np.ndarray):
+        return series
+    if isinstance(series, dict):
+        return [value for key, value in series.items() if key != ID_KEY]
+    return series
+
+# /**
+#  *
+#  * returns (features x timesteps) matrix of one series property
+#  */
+def featureMatrix(dataFeatures, prop, dtype=np.float64):
+    # streamed feature lists carry the matrix already (groundwater.FeatureList)
+    matrices = getattr(dataFeatures, "matrices", {})
+    if prop in matrices:
+        return matrices[prop].astype(dtype, copy=False)
+
+    if len(dataFeatures) == 0:
+        return np.empty((0, 0), dtype=dtype)
+
+    first = seriesValues(dataFeatures[0]["properties"][prop])
+    matrix = np.empty((len(dataFeatures), len(first)), dtype=dtype)
+
+    for ind, feature in enumerate(dataFeatures):
+        matrix[ind] = np.asarray(seriesValues(feature["properties"][prop]), dtype=np.float64)
+
+    return matrix
+
+# /**
+#  *
+#  * returns hex ids in first-seen order and the group code of every grid point
+#  */
+def binLattice(lons, lats, res):
+    codes = {}
+    groups = np.empty(len(lons), dtype=np.int64)
+
+    for i, (lon, lat) in enumerate(zip(lons.tolist(), lats.tolist())):
+        groups[i] = codes.setdefault(h3.latlng_to_cell(lat, lon, res), len(codes))
+
+    return list(codes), groups
+
+# /**
+#  *
+#  * flattens { hexId: [ind1, ...] } (and optional weights) into parallel arrays
+#  */
+def binnedToArrays(binnedPoints, binnedWeights=None):
+    hexIds = list(binnedPoints)
+    groups, inds, weights = [], [], []
+
+    for code, hexId in enumerate(hexIds):
+        groups.extend([code] * len(binnedPoints[hexId]))
+        inds.extend(binnedPoints[hexId])
+        weights.extend(binnedWeights[hexId] if binnedWeights is not None else [1.0] * len(binnedPoints[hexId]))
+
+    return hexIds, np.asarray(groups, dtype=np.int64), np.asarray(inds, dtype=np.int64), np.asarray(weights, dtype=np.float64)
+
+def groupStarts(sortedGroups):
+    return np.flatnonzero(np.r_[True, sortedGroups[1:] != sortedGroups[:-1]])
+
+# /**
+#  *
+#  * returns (nGroups x timesteps) sums and (nGroups) counts of the matrix rows
+#  * selected by inds, grouped by groups and scaled by weights
+#  */
+def groupedSums(matrix, groups, inds, nGroups, weights=None):
+    order = np.argsort(groups, kind="stable")
+    sortedGroups = groups[order]
+
+    rows = matrix[inds[order]]
+    if weights is not None:
+        rows = rows * weights[order][:, None]
+        counts = np.bincount(groups, weights=weights, minlength=nGroups)
+    else:
+        counts = np.bincount(groups, minlength=nGroups).astype(np.float64)
+
+    sums = np.zeros((nGroups, matrix.shape[1]), dtype=matrix.dtype)
+    if len(order) != 0:
+        starts = groupStarts(sortedGroups)
+        sums[sortedGroups[starts]] = np.add.reduceat(rows, starts, axis=0)
+
+    return sums, counts
+
+def groupedMeans(matrix, groups, inds, nGroups, weights=None):
+    sums, counts = groupedSums(matrix, groups, inds, nGroups, weights)
+    return sums / counts[:, None]
+
+# /**
+#  *
+#  * merges per-hex sums/counts into their parents at resolution res, returns
+#  * parent ids, parent sums and parent counts
+#  */
+def rollupSums(hexIds, sums, counts, res):
+    groups = np.empty(len(hexIds), dtype=np.int64)
+    codes = {}
+
+    for i, hexId in enumerate(hexIds):
+        groups[i] = codes.setdefault(h3.cell_to_parent(hexId, res), len(codes))
+    parentIds = list(codes)
+
+    parentSums, _ = groupedSums(sums, groups, np.arange(len(hexIds)), len(parentIds))
+    parentCounts = np.bincount(groups, weights=counts, minlength=len(parentIds))
+
+    return parentIds, parentSums, parentCounts
@@ -0,0 +1,112 @@
+import h3
+import shapely
+import shapely.geometry
+
+# Polygon -> H3 coverage computed straight from each feature's geometry, as an
+# alternative to sampling a lat/lon lattice (raster.py) and binning the points.
+# Coverage does not depend on the lattice `scale`, and polygons smaller than a
+# lattice step still land in at least one hex.
+
+def featureGeometry(dataFeature):
+    geom = shapely.geometry.shape(dataFeature["geometry"])
+    if not geom.is_valid:
+        geom = shapely.make_valid(geom)
+    return geom
+
+def cellPolygon(hexId):
+    # h3 boundaries are (lat, lng) pairs
+    return shapely.geometry.Polygon([(lng, lat) for lat, lng in h3.cell_to_boundary(hexId)])
+
+def centerCells(geom, res):
+    # geom is the repaired geometry of featureGeometry; make_valid may return a
+    # collection with lines or points next to the polygons, which have no inside
+    parts = geom.geoms if geom.geom_type == "GeometryCollection" else [geom]
+    cells = {}
+
+    for part in parts:
+        if part.geom_type in ("Polygon", "MultiPolygon"):
+            cells.update(dict.fromkeys(h3.geo_to_cells(part, res)))
+
+    return list(cells)
+
+def boundaryCells(geom, res):
+    # densify the boundary to well under a cell's width so every cell the
+    # boundary passes through gets at least one sample
+    step = h3.average_hexagon_edge_length(res, unit="km") / 111.32 / 4
+    boundary = shapely.segmentize(geom.boundary, step)
+    coords = shapely.get_coordinates(boundary)
+
+    return { h3.latlng_to_cell(lat, lng, res) for lng, lat in coords.tolist() }
+
+# /**
+#  *
+#  * returns the cells of one feature at a resolution, as
+#  * { hexId1: weight1, hexId2: weight2, ... }
+#  *
+#  * unweighted: cells whose center is inside the feature, each with weight 1
+#  *             (or the cell holding the feature's representative point if no
+#  *             center is inside). A feature only touching a cell's center
+#  *             with a sliver counts as much as one filling the cell
+#  * weighted:   every cell the feature overlaps, weighted by the fraction of
+#  *             the cell's area the feature covers; use it whenever features
+#  *             sharing cells should count by the area they cover
+#  */
+def featureToCells(dataFeature, res, weighted=False, geom=None):
+    if geom is None:
+        geom = featureGeometry(dataFeature)
+
+    if geom.is_empty:
+        return {}
+
+    inside = centerCells(geom, res)
+
+    if not weighted:
+        if len(inside) == 0:
+            pt = geom.representative_point()
+            inside = [h3.latlng_to_cell(pt.y, pt.x, res)]
+        return { hexId: 1 for hexId in inside }
+
+    shapely.prepare(geom)
+    cells = {}
+
+    for hexId in set(inside) | boundaryCells(geom, res):
+        cell = cellPolygon(hexId)
+        if shapely.contains(geom, cell):
+            cells[hexId] = 1.0
+            continue
+        frac = geom.intersection(cell).area / cell.area
+        if frac > 0:
+            cells[hexId] = frac
+
+    return cells
+
+# /**
+#  *
+#  * returns array of binned feature indices and weights, ordered by resolution
+#  * [
+#  *  [{hexId1: [ind1, ind2, ...], ...}, {hexId1: [w1, w2, ...], ...}],    // lowest resolution
+#  *  ...
+#  * ]
+#  */
+def geojsonToHexCoverage(dataFeatures, resRange, weighted=False):
+    minRes, maxRes = resRange
+
+    geoms = [featureGeometry(feature) for feature in dataFeatures]
+    resCoverage = []
+
+    for res in range(minRes, maxRes + 1):
+        binnedPoints = {}
+        binnedWeights = {}
+
+        for ind, feature in enumerate(dataFeatures):
+            for hexId, weight in featureToCells(feature, res, weighted, geoms[ind]).items():
+                if hexId in binnedPoints:
+                    binnedPoints[hexId].append(ind)
+                    binnedWeights[hexId].append(weight)
+                else:
+                    binnedPoints[hexId] = [ ind ]
+                    binnedWeights[hexId] = [ weight ]
+
+        resCoverage.append([binnedPoints, binnedWeights])
+
+    return resCoverage
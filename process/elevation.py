@@ -0,0 +1,202 @@
+import collections
+import functools
+import math
+import os
+import h3
+import numpy as np
+from PIL import Image
+
+# Vectorized elevation lookup on a NumPy view of an elevation raster, used by
+# every engine of process_hex.py and by process_gw.py. Positions are projected
+# like the original per-point latlngToMerc lookups (web mercator at zoom 5,
+# fractional part of the tile coordinate).
+#
+# decode: "terrain-rgb"  elevation = r * 256 + g + b / 256 - 32768 (elevcorr.png)
+#         "red"          elevation = red channel (elev.png)
+#
+# TileMosaic samples a directory of z/x/y tiles instead of a single image, so
+# positions spilling into a neighbouring tile read the right pixels and higher
+# zoom DEMs can be used; tiles are decoded lazily and kept in a bounded LRU.
+# Positions on tiles missing from the directory read missingElevation, so the
+# written layers never hold NaN (which JSON.parse rejects).
+
+# elevation of positions on missing tiles (sea level)
+missingElevation = 0.0
+
+def latlngToMercArrays(lats, lons, z=5):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    latRad = lats * 3.141593 / 180
+    n = pow(2, z)
+    xTile = n * ((lons + 180) / 360)
+    yTile = n * (1 - (np.log(np.tan(latRad) + 1 / np.cos(latRad)) / 3.141593)) / 2
+
+    return xTile - np.floor(xTile), yTile - np.floor(yTile)
+
+# full (not fractional) web mercator tile coordinates at zoom z
+def latlngToTileArrays(lats, lons, z):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    latRad = lats * math.pi / 180
+    n = pow(2, z)
+    xTile = n * ((lons + 180) / 360)
+    yTile = n * (1 - (np.log(np.tan(latRad) + 1 / np.cos(latRad)) / math.pi)) / 2
+
+    return xTile, yTile
+
+def decodePixels(pixels, decode):
+    pixels = pixels.astype(np.float64)
+
+    if decode == "terrain-rgb":
+        return (pixels[..., 0] * 256 + pixels[..., 1] * 1 + pixels[..., 2] * 1 / 256) - 32768
+    if decode == "red":
+        return pixels[..., 0]
+
+    raise ValueError("unknown elevation encoding %r" % decode)
+
+def bilinearSample(lookup, fx, fy):
+    # fx, fy: pixel coordinates, pixel centers at half-integers
+    fx = fx - 0.5
+    fy = fy - 0.5
+
+    x0 = np.floor(fx).astype(np.int64)
+    y0 = np.floor(fy).astype(np.int64)
+
+    tx = fx - x0
+    ty = fy - y0
+
+    top = lookup(x0, y0) * (1 - tx) + lookup(x0 + 1, y0) * tx
+    bottom = lookup(x0, y0 + 1) * (1 - tx) + lookup(x0 + 1, y0 + 1) * tx
+
+    return top * (1 - ty) + bottom * ty
+
+class ElevationSource:
+    # elevation at the center of every hex
+    def hexElevations(self, hexIds, bilinear=False):
+        if len(hexIds) == 0:
+            return np.empty(0)
+
+        centers = np.array([h3.cell_to_latlng(hexId) for hexId in hexIds])
+        return self.sample(centers[:, 0], centers[:, 1], bilinear)
+
+class RasterSampler(ElevationSource):
+    def __init__(self, pixels, decode="terrain-rgb"):
+        self.pixels = pixels
+        self.height, self.width = pixels.shape[:2]
+        self.decode = decode
+        # decoded once, so bilinear lookups interpolate elevations, not colors
+        self.elevations = decodePixels(pixels, decode)
+
+    @classmethod
+    def open(cls, path, decode="terrain-rgb"):
+        im = Image.open(path, 'r').convert("RGBA")
+        return cls(np.asarray(im), decode)
+
+    # /**
+    #  *
+    #  * returns the elevations at arrays of lats / lons
+    #  */
+    def sample(self, lats, lons, bilinear=False):
+        x, y = latlngToMercArrays(lats, lons)
+
+        if not bilinear:
+            px = np.floor(x * self.width).astype(np.int64)
+            py = np.floor(y * self.height).astype(np.int64)
+            return self.elevations[py, px]
+
+        def lookup(px, py):
+            return self.elevations[np.clip(py, 0, self.height - 1), np.clip(px, 0, self.width - 1)]
+
+        return bilinearSample(lookup, x * self.width, y * self.height)
+
+class TileMosaic(ElevationSource):
+    def __init__(self, tileDir, zoom, decode="terrain-rgb", maxTiles=64, pattern="{z}/{x}/{y}.png", fill=missingElevation):
+        self.tileDir = tileDir
+        self.fill = fill
+        self.zoom = zoom
+        self.decode = decode
+        self.maxTiles = maxTiles
+        self.pattern = pattern
+        self.tiles = collections.OrderedDict()
+        self.tileSize = None
+
+    def tilePath(self, x, y):
+        return os.path.join(self.tileDir, self.pattern.format(z=self.zoom, x=x, y=y))
+
+    # decoded elevations of one tile, or None if the tile doesn't exist
+    def tile(self, x, y):
+        key = (x, y)
+
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        path = self.tilePath(x, y)
+        elevations = None
+        if os.path.exists(path):
+            elevations = decodePixels(np.asarray(Image.open(path, 'r').convert("RGBA")), self.decode)
+            self.tileSize = elevations.shape[0]
+
+        self.tiles[key] = elevations
+        if len(self.tiles) > self.maxTiles:
+            self.tiles.popitem(last=False)
+
+        return elevations
+
+    def size(self):
+        if self.tileSize is None:
+            for root, _, files in os.walk(os.path.join(self.tileDir, str(self.zoom))):
+                for name in files:
+                    self.tileSize = Image.open(os.path.join(root, name)).size[0]
+                    return self.tileSize
+            self.tileSize = 256
+        return self.tileSize
+
+    # /**
+    #  *
+    #  * returns the elevations at global pixel coordinates, fill where the
+    #  * tile is missing
+    #  */
+    def pixels(self, px, py):
+        size = self.size()
+        n = pow(2, self.zoom) * size
+
+        px = np.mod(px, n)
+        py = np.clip(py, 0, n - 1)
+
+        tx, lx = np.divmod(px, size)
+        ty, ly = np.divmod(py, size)
+
+        out = np.full(px.shape, float(self.fill))
+        keys = tx * pow(2, self.zoom) + ty
+
+        for key in np.unique(keys).tolist():
+            elevations = self.tile(*divmod(key, pow(2, self.zoom)))
+            if elevations is None:
+                continue
+            sel = keys == key
+            out[sel] = elevations[ly[sel], lx[sel]]
+
+        return out
+
+    def sample(self, lats, lons, bilinear=False):
+        xTile, yTile = latlngToTileArrays(lats, lons, self.zoom)
+        size = self.size()
+
+        if not bilinear:
+            return self.pixels(np.floor(xTile * size).astype(np.int64), np.floor(yTile * size).astype(np.int64))
+
+        return bilinearSample(self.pixels, xTile * size, yTile * size)
+
+# a directory is read as a TileMosaic at the given zoom (default: the deepest
+# zoom level present), anything else as a single RasterSampler image
+@functools.lru_cache(maxsize=None)
+def openSampler(path, decode="terrain-rgb", zoom=None):
+    if os.path.isdir(path):
+        if zoom is None:
+            zoom = max(int(name) for name in os.listdir(path) if name.isdigit())
+        return TileMosaic(path, zoom, decode)
+
+    return RasterSampler.open(path, decode)
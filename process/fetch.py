@@ -0,0 +1,306 @@
+import codecs
+import hashlib
+import http.client
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import ujson
+from jsonstream import JsonStream
+
+# Fetch layer for the scenario API with a content-addressed disk cache.
+#
+#   <cacheDir>/objects/<sha256 of body>    response bodies
+#   <cacheDir>/urls/<sha1 of url>.json     url -> body hash, ETag, Last-Modified
+#
+# A cached url is revalidated with If-None-Match / If-Modified-Since, so an
+# unchanged payload costs one 304 round trip. If the server can't be reached the
+# cached copy is served, and in offline mode (offline=True or PROCESS_OFFLINE=1)
+# the network is never touched at all.
+
+cacheDir = "http_cache"
+
+timeout = 60
+
+apiRoot = "http://infovis.cs.ucdavis.edu/geospatial/api"
+
+class CacheMiss(Exception):
+    pass
+
+def isOffline():
+    return os.environ.get("PROCESS_OFFLINE", "") not in ("", "0")
+
+def urlKey(url):
+    return hashlib.sha1(url.encode()).hexdigest()
+
+def entryPath(url, cacheDir):
+    return os.path.join(cacheDir, "urls", urlKey(url) + ".json")
+
+def objectPath(digest, cacheDir):
+    return os.path.join(cacheDir, "objects", digest)
+
+# every writer gets its own temporary file, so threads (fetchScenarios) or
+# processes storing the same path never write into each other's
+def writeAtomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    outfile = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False)
+    try:
+        with outfile:
+            outfile.write(data)
+        os.replace(outfile.name, path)
+    except BaseException:
+        if os.path.exists(outfile.name):
+            os.remove(outfile.name)
+        raise
+
+def readEntry(url, cacheDir):
+    path = entryPath(url, cacheDir)
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as infile:
+        entry = ujson.load(infile)
+
+    if not os.path.exists(objectPath(entry["sha256"], cacheDir)):
+        return None
+
+    return entry
+
+def readObject(entry, cacheDir):
+    with open(objectPath(entry["sha256"], cacheDir), "rb") as infile:
+        return infile.read()
+
+def storeResponse(url, body, headers, cacheDir):
+    digest = hashlib.sha256(body).hexdigest()
+
+    if not os.path.exists(objectPath(digest, cacheDir)):
+        writeAtomic(objectPath(digest, cacheDir), body)
+
+    entry = {
+        "url": url,
+        "sha256": digest,
+        "etag": headers.get("ETag"),
+        "lastModified": headers.get("Last-Modified"),
+        "fetchedAt": time.time(),
+    }
+    writeAtomic(entryPath(url, cacheDir), ujson.dumps(entry).encode())
+
+    return entry
+
+def conditionalRequest(url, entry):
+    request = urllib.request.Request(url)
+
+    if entry is not None:
+        if entry.get("etag"):
+            request.add_header("If-None-Match", entry["etag"])
+        if entry.get("lastModified"):
+            request.add_header("If-Modified-Since", entry["lastModified"])
+
+    return request
+
+# /**
+#  *
+#  * returns the body of url, from the cache when it is still current
+#  */
+def fetchBytes(url, offline=None, cacheDir=cacheDir):
+    if offline is None:
+        offline = isOffline()
+
+    entry = readEntry(url, cacheDir)
+
+    if offline:
+        if entry is None:
+            raise CacheMiss("offline and %s is not cached in %s" % (url, cacheDir))
+        return readObject(entry, cacheDir)
+
+    try:
+        with urllib.request.urlopen(conditionalRequest(url, entry), timeout=timeout) as response:
+            body = response.read()
+            storeResponse(url, body, response.headers, cacheDir)
+            return body
+    except urllib.error.HTTPError as e:
+        # 304 Not Modified, or a server error while we hold a copy
+        if entry is not None and (e.code == 304 or e.code >= 500):
+            return readObject(entry, cacheDir)
+        raise
+    except (urllib.error.URLError, OSError):
+        # server unreachable, fall back to the last copy we have
+        if entry is not None:
+            return readObject(entry, cacheDir)
+        raise
+
+def fetchJson(url, offline=None, cacheDir=cacheDir):
+    return ujson.loads(fetchBytes(url, offline, cacheDir))
+
+# Bulk scenario loader. Requests run on a bounded thread pool and every worker
+# thread keeps one persistent (keep-alive) connection per host, so fetching N
+# scenarios opens at most `workers` connections (all closed once the pool shuts
+# down). Bodies are decoded with JsonStream while they download, go through the
+# same disk cache as fetchBytes, and failed requests are retried with
+# exponential backoff.
+
+def scenarioUrl(scenarioId, root=apiRoot):
+    return root + "/data/scenario/" + scenarioId + "/unmetdemand"
+
+# one kept-alive connection per thread and host; close() closes the
+# connections of every thread, once none of them makes requests any more
+class ConnectionPool:
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.opened = []
+
+    def get(self, parts):
+        pool = self.local.__dict__.setdefault("pool", {})
+        key = (parts.scheme, parts.netloc)
+
+        if key not in pool:
+            if parts.scheme == "https":
+                pool[key] = http.client.HTTPSConnection(parts.netloc, timeout=timeout)
+            else:
+                pool[key] = http.client.HTTPConnection(parts.netloc, timeout=timeout)
+            with self.lock:
+                self.opened.append(pool[key])
+
+        return pool[key]
+
+    def drop(self, parts):
+        pool = self.local.__dict__.get("pool", {})
+        conn = pool.pop((parts.scheme, parts.netloc), None)
+        if conn is not None:
+            conn.close()
+            with self.lock:
+                self.opened.remove(conn)
+
+    def close(self):
+        with self.lock:
+            opened, self.opened = self.opened, []
+        for conn in opened:
+            conn.close()
+
+class RetryableStatus(Exception):
+    pass
+
+# one GET over the pooled connection, returns (status, decoded object, bytes, seconds to first byte)
+def streamRequest(url, entry, cacheDir, connections, chunkSize=1 << 16):
+    parts = urllib.parse.urlsplit(url)
+    conn = connections.get(parts)
+
+    request = conditionalRequest(url, entry)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+
+    start = time.perf_counter()
+    conn.request("GET", path or "/", headers=dict(request.header_items()))
+    response = conn.getresponse()
+    firstByte = time.perf_counter() - start
+
+    if response.status == 304 and entry is not None:
+        response.read()
+        body = readObject(entry, cacheDir)
+        return 304, ujson.loads(body), len(body), firstByte
+
+    if response.status != 200:
+        response.read()
+        if response.status >= 500:
+            raise RetryableStatus("%s returned %d" % (url, response.status))
+        raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+    stream = JsonStream()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    members = {}
+    chunks = []
+
+    while True:
+        chunk = response.read(chunkSize)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        # scenario payloads are objects keyed by DU_ID
+        members.update(stream.feed(utf8.decode(chunk)))
+    stream.feed(utf8.decode(b"", final=True))
+    members.update(stream.close())
+
+    body = b"".join(chunks)
+    storeResponse(url, body, response.headers, cacheDir)
+
+    return 200, members, len(body), firstByte
+
+def fetchScenario(scenarioId, root, retries, backoff, offline, cacheDir, connections):
+    url = scenarioUrl(scenarioId, root)
+    entry = readEntry(url, cacheDir)
+    timing = { "scenario": scenarioId, "url": url, "attempts": 0, "bytes": 0 }
+    start = time.perf_counter()
+
+    if offline:
+        if entry is None:
+            raise CacheMiss("offline and %s is not cached in %s" % (url, cacheDir))
+        body = readObject(entry, cacheDir)
+        timing.update(status="cache", bytes=len(body), seconds=time.perf_counter() - start)
+        return ujson.loads(body), timing
+
+    for attempt in range(retries + 1):
+        timing["attempts"] = attempt + 1
+        try:
+            status, obj, nbytes, firstByte = streamRequest(url, entry, cacheDir, connections)
+            timing.update(status=status, bytes=nbytes, firstByte=firstByte, seconds=time.perf_counter() - start)
+            return obj, timing
+        except urllib.error.HTTPError:
+            raise
+        except (RetryableStatus, http.client.HTTPException, OSError) as e:
+            # the kept-alive connection may have been closed by the server
+            connections.drop(urllib.parse.urlsplit(url))
+            if attempt == retries:
+                if entry is not None:
+                    body = readObject(entry, cacheDir)
+                    timing.update(status="stale", bytes=len(body), error=str(e), seconds=time.perf_counter() - start)
+                    return ujson.loads(body), timing
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+# /**
+#  *
+#  * returns ({ scenarioId: unmetdemand object }, [per-request timing, ...])
+#  *
+#  * timing: { scenario, url, status (200, 304, "cache", "stale" or "error"),
+#  *           attempts, bytes, firstByte, seconds[, error] }
+#  * strict: raise the first failure after all requests finished, otherwise
+#  *         failed scenarios are only reported in the timings
+#  */
+def fetchScenarios(scenarioIds, workers=8, retries=3, backoff=0.5, offline=None, cacheDir=cacheDir, root=apiRoot, strict=True):
+    if offline is None:
+        offline = isOffline()
+
+    results = {}
+    timings = []
+    errors = []
+    connections = ConnectionPool()
+
+    def run(scenarioId):
+        try:
+            return fetchScenario(scenarioId, root, retries, backoff, offline, cacheDir, connections), None
+        except Exception as e:
+            return None, e
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for scenarioId, (done, error) in zip(scenarioIds, pool.map(run, scenarioIds)):
+                if error is not None:
+                    errors.append(error)
+                    timings.append({ "scenario": scenarioId, "url": scenarioUrl(scenarioId, root), "status": "error", "error": str(error) })
+                    continue
+
+                obj, timing = done
+                results[scenarioId] = obj
+                timings.append(timing)
+    finally:
+        # the worker threads have exited, their kept-alive connections go with them
+        connections.close()
+
+    if strict and errors:
+        raise errors[0]
+
+    return results, timings
@@ -0,0 +1,147 @@
+import hashlib
+import itertools
+import numpy as np
+
+# Batched port of area.area (the spherical ring formula of Chamberlain &
+# Duquette, "Some Algorithms for Polygons on a Sphere", also used by
+# @mapbox/geojson-area). All rings of all geometries are flattened into one
+# coordinate array, and every ring's
+#
+#   sum_i (lon[i + 2] - lon[i]) * sin(lat[i + 1]) * R^2 / 2     (indices mod n)
+#
+# is one vectorized pass with a segmented sum. A polygon's area is |outer ring|
+# minus |holes|, as in area.polygon__area. Results are kept in areaCache keyed by
+# a hash of each geometry's coordinates, so the demand units shared by several
+# layers or scripts are only measured once per process.
+
+WGS84_RADIUS = 6378137
+
+# demand unit areas are divided by this before normalizing series (m^2 -> "units")
+areaUnit = 6e8
+
+areaCache = {}
+
+def geometryRings(geometry):
+    # (ring, is outer ring) for every ring, like area.area walks them
+    if geometry["type"] == "Polygon":
+        for r, ring in enumerate(geometry["coordinates"]):
+            yield ring, r == 0
+    elif geometry["type"] == "MultiPolygon":
+        for polygon in geometry["coordinates"]:
+            for r, ring in enumerate(polygon):
+                yield ring, r == 0
+    elif geometry["type"] == "GeometryCollection":
+        for child in geometry["geometries"]:
+            yield from geometryRings(child)
+
+def ringCoords(ring):
+    if len(ring) == 0:
+        return np.empty((0, 2))
+    if len(ring[0]) == 2:
+        # much faster than np.asarray on the nested lists
+        return np.fromiter(itertools.chain.from_iterable(ring), np.float64, 2 * len(ring)).reshape(-1, 2)
+    # positions carrying an altitude
+    return np.asarray(ring, dtype=np.float64)[:, :2]
+
+# /**
+#  *
+#  * returns flat arrays of all rings of geometries:
+#  * coords (points x 2), ringLengths, ringOuter, and ringsPerGeometry
+#  */
+def flatRings(geometries):
+    rings, ringOuter, ringsPerGeometry = [], [], []
+
+    for geometry in geometries:
+        before = len(rings)
+        for ring, outer in geometryRings(geometry):
+            rings.append(ringCoords(ring))
+            ringOuter.append(outer)
+        ringsPerGeometry.append(len(rings) - before)
+
+    coords = np.concatenate(rings) if rings else np.empty((0, 2))
+    ringLengths = np.array([len(ring) for ring in rings], dtype=np.int64)
+    return coords, ringLengths, np.array(ringOuter, dtype=bool), np.array(ringsPerGeometry, dtype=np.int64)
+
+# /**
+#  *
+#  * returns the signed area in m^2 of every ring, area.ring__area for rings
+#  * given as flat coords and lengths
+#  */
+def ringAreas(coords, ringLengths):
+    areas = np.zeros(len(ringLengths))
+    if len(coords) == 0:
+        return areas
+
+    starts = np.concatenate([[0], np.cumsum(ringLengths)[:-1]])
+    ringOf = np.repeat(np.arange(len(ringLengths)), ringLengths)
+    k = np.arange(len(coords)) - starts[ringOf]
+    n = ringLengths[ringOf]
+
+    lons = np.radians(coords[:, 0])
+    lats = np.radians(coords[:, 1])
+
+    # (lower, middle, upper) = (i, i + 1, i + 2) wrapping around the ring
+    middle = starts[ringOf] + (k + 1) % n
+    upper = starts[ringOf] + (k + 2) % n
+    terms = (lons[upper] - lons) * np.sin(lats[middle])
+
+    sums = np.bincount(ringOf, weights=terms, minlength=len(ringLengths))
+
+    # rings of fewer than 3 points have no area
+    valid = ringLengths > 2
+    areas[valid] = sums[valid] * WGS84_RADIUS * WGS84_RADIUS / 2
+    return areas
+
+def geometryKeys(coords, ringLengths, ringOuter, ringsPerGeometry):
+    keys = []
+    ringStarts = np.concatenate([[0], np.cumsum(ringsPerGeometry)])
+    pointStarts = np.concatenate([[0], np.cumsum(ringLengths)])
+
+    for g in range(len(ringsPerGeometry)):
+        r0, r1 = ringStarts[g], ringStarts[g + 1]
+        digest = hashlib.sha1()
+        digest.update(ringLengths[r0:r1].tobytes())
+        digest.update(ringOuter[r0:r1].tobytes())
+        digest.update(coords[pointStarts[r0]:pointStarts[r1]].tobytes())
+        keys.append(digest.hexdigest())
+
+    return keys
+
+# /**
+#  *
+#  * returns the geodesic area in m^2 of every geometry, same values as
+#  * [area.area(g) for g in geometries] up to floating point rounding
+#  */
+def geodesicAreas(geometries, cache=areaCache):
+    coords, ringLengths, ringOuter, ringsPerGeometry = flatRings(geometries)
+    keys = geometryKeys(coords, ringLengths, ringOuter, ringsPerGeometry)
+
+    areas = np.array([cache.get(key, np.nan) for key in keys], dtype=np.float64)
+    missing = np.isnan(areas)
+
+    if missing.any():
+        ringGeometry = np.repeat(np.arange(len(ringsPerGeometry)), ringsPerGeometry)
+        ringMissing = missing[ringGeometry]
+        pointMissing = np.repeat(ringMissing, ringLengths)
+
+        rings = np.abs(ringAreas(coords[pointMissing], ringLengths[ringMissing]))
+        # outer rings add, holes subtract
+        signed = np.where(ringOuter[ringMissing], rings, -rings)
+        areas[missing] = np.bincount(ringGeometry[ringMissing], weights=signed, minlength=len(ringsPerGeometry))[missing]
+
+        for g in np.flatnonzero(missing).tolist():
+            cache[keys[g]] = areas[g]
+
+    return areas
+
+# /**
+#  *
+#  * returns the total area of each DU_ID in duIds over its features, in areaUnit,
+#  * the tot_areas series are normalized by
+#  */
+def demandUnitAreas(du_fs, duIds):
+    duIndex = { idd: d for d, idd in enumerate(duIds) }
+    featureDu = np.array([duIndex[f["properties"]["DU_ID"]] for f in du_fs], dtype=np.int64)
+
+    areas = geodesicAreas([f["geometry"] for f in du_fs]) / areaUnit
+    return np.bincount(featureDu, weights=areas, minlength=len(duIds))
@@ -0,0 +1,348 @@
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import ujson
+import process_hex, process_gw
+import synthetic
+from groundwater import readGroundwater
+
+# Equivalence checks of the alternative engines against the reference
+# implementations (engine "reference" of process_hex.py, and process_gw.py), run
+# on the same synthetic fixtures (synthetic.py). For every layer, candidate and
+# resolution it reports
+#
+#   onlyReference / onlyCandidate   hexes found by one side only
+#   maxAbsError                     per numeric property, over the hexes both found
+#   mismatched                      per property, hexes outside the tolerance (or,
+#                                   for LandUse, with a different ranking)
+#   speedup                         reference seconds / candidate seconds
+#
+# and a candidate passes a layer when the hex sets match and no hex is mismatched,
+# numbers being equal within --atol + --rtol * |reference|.
+#
+#   python golden.py                                  default candidates
+#   python golden.py --candidates operator+hierarchical columnar+workers=2
+#   python golden.py --layers diff --size 20 --out golden.json
+#
+# A candidate is an engine name followed by options joined with "+":
+# "hierarchical" rolls coarser resolutions up, "workers=N" runs N processes,
+# "coverage" / "coverage-weighted" use that hexMode instead of "lattice" (the
+# reference then runs in the same mode). process_gw.py only samples a lattice,
+# so coverage candidates are skipped for the "gw" layer.
+#
+# Rolling up is approximate (H3 children are not nested in their parents, see
+# rollup.py), so hierarchical candidates are compared against the reference
+# engine rolled up the same way, and how far the rolled up levels are from the
+# per-level reference is reported apart as "nonNested", without failing them.
+# They are left out of the default candidates.
+
+defaultCandidates = [
+    "columnar", "operator",
+    "columnar+coverage", "operator+coverage", "columnar+coverage-weighted", "operator+coverage-weighted",
+]
+
+hexModes = ["lattice", "coverage", "coverage-weighted"]
+
+# layer -> (function averaging it in process_hex, compared properties)
+hexLayers = {
+    "diff": (process_hex.avgDiffUnmet, ["UnmetDemand", "Difference", "Elevation"]),
+    "landuse": (process_hex.aggLandUse, ["LandUse", "Elevation"]),
+    # equal-weight categories sharing hexes (synthetic.tiedLandUseFeatures)
+    "landuse-ties": (process_hex.aggLandUse, ["LandUse", "Elevation"]),
+    "groundwater": (process_hex.avgGroundwater, ["Groundwater", "Elevation"]),
+}
+
+# process_gw.py samples Elevation per lattice point of elev.png, which no
+# process_hex engine does, so only Groundwater is compared for it
+gwProps = ["Groundwater"]
+
+allLayers = list(hexLayers) + ["gw"]
+
+categoricalProps = ["LandUse"]
+
+# /**
+#  *
+#  * returns { engine, mode, hierarchical, workers } of a candidate such as
+#  * "operator+coverage+hierarchical+workers=2"
+#  */
+def parseCandidate(spec):
+    engine, *options = spec.split("+")
+    if engine not in ("reference", "columnar", "operator"):
+        raise ValueError("unknown engine " + engine)
+
+    candidate = { "engine": engine, "mode": "lattice", "hierarchical": False, "workers": 1 }
+    for option in options:
+        if option == "hierarchical":
+            candidate["hierarchical"] = True
+        elif option in hexModes:
+            candidate["mode"] = option
+        elif option.startswith("workers="):
+            candidate["workers"] = int(option[len("workers="):])
+        else:
+            raise ValueError("unknown option " + option)
+
+    return candidate
+
+@contextlib.contextmanager
+def settings(module, **values):
+    previous = { name: getattr(module, name) for name in values }
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(module, name, value)
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+# [{hexId: obj}, ...] for either output format, process_gw.py writes [[hexId, obj], ...]
+def asDicts(resPoints):
+    return [points if isinstance(points, dict) else dict(points) for points in resPoints]
+
+# /**
+#  *
+#  * returns the reference output of layer in hexMode mode and its run time,
+#  * with hierarchical the reference engine's rolled up output
+#  */
+def runReference(layer, features, resRange, mode="lattice", hierarchical=False):
+    if layer == "gw" and not hierarchical:
+        return timed(process_gw.geojsonToHexPoints, features, process_gw.avgObject, resRange)
+
+    avgFn = process_hex.avgGroundwater if layer == "gw" else hexLayers[layer][0]
+    scale = process_gw.scale if layer == "gw" else process_hex.scale
+    with settings(process_hex, workers=1, scale=scale):
+        return timed(process_hex.geojsonToHexPoints, features, avgFn, resRange, mode, hierarchical, "reference")
+
+# /**
+#  *
+#  * returns { resolution, rolledUp, onlyPerLevel, onlyRolledUp } per resolution,
+#  * the hexes rolling up gains / loses against binning every level
+#  */
+def nonNestedHexes(perLevel, rolledUp, resRange):
+    return [{
+        "resolution": res,
+        "rolledUp": len(rolled),
+        "onlyPerLevel": sum(1 for hexId in level if hexId not in rolled),
+        "onlyRolledUp": sum(1 for hexId in rolled if hexId not in level),
+    } for res, level, rolled in zip(range(resRange[0], resRange[1] + 1), perLevel, rolledUp)]
+
+def runCandidate(layer, features, resRange, candidate, operatorCache):
+    avgFn = process_hex.avgGroundwater if layer == "gw" else hexLayers[layer][0]
+    # process_gw.py samples on its own, coarser lattice
+    scale = process_gw.scale if layer == "gw" else process_hex.scale
+
+    with settings(process_hex, workers=candidate["workers"], scale=scale, operatorCache=operatorCache):
+        return timed(process_hex.geojsonToHexPoints, features, avgFn, resRange, candidate["mode"],
+                     candidate["hierarchical"], candidate["engine"])
+
+# /**
+#  *
+#  * compares one resolution, returns { hexes, onlyReference, onlyCandidate,
+#  * maxAbsError, mismatched, withinTolerance, sample }
+#  */
+def compareResolution(refPoints, candPoints, props, atol, rtol, sampleSize=5):
+    common = [hexId for hexId in refPoints if hexId in candPoints]
+    onlyRef = [hexId for hexId in refPoints if hexId not in candPoints]
+    onlyCand = [hexId for hexId in candPoints if hexId not in refPoints]
+
+    report = {
+        "hexes": len(refPoints),
+        "onlyReference": len(onlyRef),
+        "onlyCandidate": len(onlyCand),
+        "maxAbsError": {},
+        "mismatched": {},
+        "withinTolerance": True,
+        "sample": { "onlyReference": onlyRef[:sampleSize], "onlyCandidate": onlyCand[:sampleSize] },
+    }
+
+    for prop in props:
+        if prop in categoricalProps:
+            mismatched = [hexId for hexId in common if refPoints[hexId][prop] != candPoints[hexId][prop]]
+        else:
+            maxError, mismatched = 0.0, []
+
+            for hexId in common:
+                ref = np.atleast_1d(np.asarray(refPoints[hexId][prop], dtype=np.float64))
+                cand = np.atleast_1d(np.asarray(candPoints[hexId][prop], dtype=np.float64))
+
+                if ref.shape != cand.shape:
+                    maxError = float("inf")
+                    mismatched.append(hexId)
+                    continue
+
+                error = np.abs(ref - cand)
+                # NaN on both sides counts as equal
+                bothNan = np.isnan(ref) & np.isnan(cand)
+                error[bothNan] = 0
+                if error.size:
+                    maxError = max(maxError, float(np.nanmax(error)) if not np.isnan(error).all() else float("inf"))
+                if np.any(~(error <= atol + rtol * np.abs(ref))):
+                    mismatched.append(hexId)
+
+            report["maxAbsError"][prop] = maxError
+
+        report["mismatched"][prop] = len(mismatched)
+        if mismatched:
+            report["sample"][prop] = mismatched[:sampleSize]
+            report["withinTolerance"] = False
+
+    return report
+
+# /**
+#  *
+#  * runs the reference and every candidate on layer, returns one result per
+#  * candidate { layer, candidate, referenceSeconds, seconds, speedup, passed,
+#  * resolutions: [compareResolution ...] }, or { layer, candidate, skipped }
+#  */
+def checkLayer(layer, features, resRange, candidates, atol, rtol, workDir):
+    props = gwProps if layer == "gw" else hexLayers[layer][1]
+
+    # reference output and time per (hexMode, hierarchical), run once for all
+    # candidates of that kind
+    references = {}
+
+    def reference(mode, hierarchical):
+        if (mode, hierarchical) not in references:
+            refOutput, refSeconds = runReference(layer, features, resRange, mode, hierarchical)
+            references[(mode, hierarchical)] = (asDicts(refOutput), refSeconds)
+        return references[(mode, hierarchical)]
+
+    results = []
+    for spec in candidates:
+        candidate = parseCandidate(spec)
+
+        if layer == "gw" and candidate["mode"] != "lattice":
+            results.append({ "layer": layer, "candidate": spec, "passed": True, "skipped": "process_gw.py has no " + candidate["mode"] + " mode" })
+            continue
+
+        refOutput, refSeconds = reference(candidate["mode"], candidate["hierarchical"])
+
+        # fresh operators for every run, so the operator engine's time includes building them
+        operatorCache = tempfile.mkdtemp(dir=workDir)
+        candOutput, seconds = runCandidate(layer, features, resRange, candidate, operatorCache)
+        candOutput = asDicts(candOutput)
+
+        resolutions = []
+        for res, (refPoints, candPoints) in zip(range(resRange[0], resRange[1] + 1), zip(refOutput, candOutput)):
+            report = compareResolution(refPoints, candPoints, props, atol, rtol)
+            report["resolution"] = res
+            resolutions.append(report)
+
+        passed = len(refOutput) == len(candOutput) and all(
+            r["withinTolerance"] and r["onlyReference"] == 0 and r["onlyCandidate"] == 0 for r in resolutions)
+
+        result = {
+            "layer": layer,
+            "candidate": spec,
+            "referenceSeconds": refSeconds,
+            "seconds": seconds,
+            "speedup": refSeconds / seconds if seconds > 0 else float("inf"),
+            "passed": passed,
+            "resolutions": resolutions,
+        }
+
+        if candidate["hierarchical"]:
+            result["nonNested"] = nonNestedHexes(reference(candidate["mode"], False)[0], refOutput, resRange)
+
+        results.append(result)
+
+    return results
+
+# /**
+#  *
+#  * returns the features each layer runs on, built from one seed
+#  */
+def makeFixtures(layers, size, vertices, holes, timesteps, seed, workDir):
+    fixtures = {}
+    du = synthetic.demandUnitFeatures(size, seed, vertices, holes, timesteps)
+
+    if "diff" in layers:
+        fixtures["diff"] = du
+    if "landuse" in layers:
+        fixtures["landuse"] = du
+    if "landuse-ties" in layers:
+        fixtures["landuse-ties"] = synthetic.tiedLandUseFeatures(size, seed, timesteps)
+
+    if "groundwater" in layers or "gw" in layers:
+        # through the streaming reader, as process_hex.py and process_gw.py read it
+        path = os.path.join(workDir, "groundwater_features.json")
+        with open(path, "w") as outfile:
+            ujson.dump(synthetic.featureCollection(synthetic.groundwaterFeatures(size, seed + 1, vertices, holes, timesteps + 1)), outfile)
+
+        for layer in ("groundwater", "gw"):
+            if layer in layers:
+                fixtures[layer] = readGroundwater(path)
+
+    return fixtures
+
+def printResults(results):
+    for result in results:
+        if "skipped" in result:
+            print("%-12s %-26s skipped, %s" % (result["layer"], result["candidate"], result["skipped"]))
+            continue
+
+        print("%-12s %-26s %-4s  x%.1f speed-up (%.2fs -> %.2fs)" % (
+            result["layer"], result["candidate"], "ok" if result["passed"] else "FAIL",
+            result["speedup"], result["referenceSeconds"], result["seconds"]))
+
+        for r in result["resolutions"]:
+            errors = "  ".join("%s %.3g" % (prop, error) for prop, error in r["maxAbsError"].items())
+            mismatched = "  ".join("%s %d mismatched" % (prop, n) for prop, n in r["mismatched"].items() if n)
+            print(("    res %d: %d hexes, %d only in reference, %d only in candidate, max error %s  %s" % (
+                r["resolution"], r["hexes"], r["onlyReference"], r["onlyCandidate"], errors, mismatched)).rstrip())
+
+        for r in result.get("nonNested", []):
+            if r["onlyPerLevel"] or r["onlyRolledUp"]:
+                print("    res %d rolled up (approximate): %d hexes, %d only per level, %d only rolled up" % (
+                    r["resolution"], r["rolledUp"], r["onlyPerLevel"], r["onlyRolledUp"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="checks the alternative engines against the reference implementations")
+    parser.add_argument("--layers", nargs="+", choices=allLayers, default=allLayers)
+    parser.add_argument("--candidates", nargs="+", default=defaultCandidates, help="engine[+hierarchical][+workers=N]")
+    parser.add_argument("--size", type=int, default=10, help="polygons per fixture")
+    parser.add_argument("--vertices", type=int, default=12)
+    parser.add_argument("--holes", action="store_true")
+    parser.add_argument("--timesteps", type=int, default=1200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--res", nargs=2, type=int, default=process_hex.resRange, metavar=("MIN", "MAX"))
+    parser.add_argument("--atol", type=float, default=1e-9)
+    parser.add_argument("--rtol", type=float, default=1e-7)
+    parser.add_argument("--out", help="write the full report to this JSON file")
+    args = parser.parse_args()
+
+    for spec in args.candidates:
+        parseCandidate(spec)
+
+    out = os.path.abspath(args.out) if args.out else None
+
+    # the reference engines read elevcorr.png / elev.png relative to the scripts
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    results = []
+    with tempfile.TemporaryDirectory() as workDir:
+        fixtures = makeFixtures(args.layers, args.size, args.vertices, args.holes, args.timesteps, args.seed, workDir)
+
+        for layer in args.layers:
+            resRange = process_gw.resRange if layer == "gw" else args.res
+            results.extend(checkLayer(layer, fixtures[layer], resRange, args.candidates, args.atol, args.rtol, workDir))
+
+    printResults(results)
+
+    if out:
+        with open(out, "w") as outfile:
+            ujson.dump({ "settings": vars(args), "results": results }, outfile, indent=2)
+
+    if not all(result["passed"] for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import numpy as np
+from jsonstream import iterJson
+from columnar import ID_KEY, seriesValues
+
+# Streaming reader for Baseline_Groundwater.json. Features are decoded one at a
+# time (jsonstream.iterJson), and each feature's Groundwater dict
+#
+#   { "0": "12.3", "1": "12.1", ..., "": id, ... }
+#
+# is written straight into a row of a preallocated (features x timesteps)
+# float matrix and dropped, so the string-keyed dicts and the input text never
+# live in memory all at once. The "" entry (columnar.ID_KEY, the id
+# geo_to_temporal.py keys on) is dropped from the row by seriesValues and kept
+# separately as GroundwaterId.
+
+groundwaterFile = "../Baseline_Groundwater.json"
+
+# list of features that also carries the (features x timesteps) matrices of
+# their series properties, see columnar.featureMatrix
+class FeatureList(list):
+    def __init__(self, features=(), matrices=None):
+        super().__init__(features)
+        self.matrices = matrices or {}
+
+# /**
+#  *
+#  * yields the features of a GeoJSON file one by one
+#  */
+def iterFeatures(path=groundwaterFile):
+    with open(path, "rb") as infile:
+        yield from iterJson(infile, "features")
+
+# /**
+#  *
+#  * returns a FeatureList whose features hold their prop series as rows of
+#  * features.matrices[prop]; rows grow by doubling, so the only full-size
+#  * allocation is the matrix itself
+#  */
+def readSeriesFeatures(path=groundwaterFile, prop="Groundwater", dtype=np.float64, capacity=1024):
+    features = []
+    matrix = None
+
+    for ind, feature in enumerate(iterFeatures(path)):
+        properties = feature["properties"]
+        series = properties.pop(prop)
+        values = seriesValues(series)
+
+        if matrix is None:
+            matrix = np.empty((capacity, len(values)), dtype=dtype)
+        elif ind == len(matrix):
+            grown = np.empty((2 * len(matrix), matrix.shape[1]), dtype=dtype)
+            grown[:ind] = matrix
+            matrix = grown
+
+        matrix[ind] = np.asarray(values, dtype=np.float64)
+
+        if isinstance(series, dict) and ID_KEY in series:
+            properties[prop + "Id"] = series[ID_KEY]
+
+        features.append(feature)
+
+    if matrix is None:
+        matrix = np.empty((0, 0), dtype=dtype)
+    else:
+        # shrink in place to the rows actually read
+        matrix.resize((len(features), matrix.shape[1]), refcheck=False)
+
+    for ind, feature in enumerate(features):
+        feature["properties"][prop] = matrix[ind]
+
+    return FeatureList(features, { prop: matrix })
+
+def readGroundwater(path=groundwaterFile, dtype=np.float64):
+    return readSeriesFeatures(path, "Groundwater", dtype)
+
+# position of the "" entry in the Groundwater dicts, which the reference
+# avgArrOfArr skips by index
+REFERENCE_SKIP_INDEX = 1201
+
+# series as the reference averaging functions index it: a dict's values, or a
+# streamed row with a placeholder back at REFERENCE_SKIP_INDEX
+def referenceSeries(series):
+    if isinstance(series, dict):
+        return [series[k] for k in series]
+
+    values = series.tolist()
+    if len(values) >= REFERENCE_SKIP_INDEX:
+        values = values[:REFERENCE_SKIP_INDEX] + [None] + values[REFERENCE_SKIP_INDEX:]
+    return values
@@ -0,0 +1,283 @@
+import argparse
+import os
+import time
+import numpy as np
+import scipy.sparse
+import ujson
+from fetch import fetchJson, apiRoot
+from elevation import openSampler
+from geoarea import demandUnitAreas
+import process_hex
+
+# Incremental update of the UnmetDemand / Difference layer
+# (diff_unmet_hex_med_res_norm.json) when the scenario API revises a few
+# demand units. A full build saves, per resolution,
+#
+#   W        the (hexes x features) operator over all demand units (weights.py);
+#            its columns are the reverse index feature -> hexes it feeds
+#   totals   running per-hex weight of the demand units present in the scenario
+#
+# plus the raw scenario / baseline series and area of every DU_ID. An update
+# compares freshly fetched payloads to the saved series (or takes a list of
+# DU_IDs), and only the hexes fed by changed units are recomputed and patched
+# into the stored output. Affected rows are recomputed from the feature rows
+# rather than adjusted by deltas, so the patched file is exactly what a full
+# rebuild writes.
+
+stateDir = "incremental"
+
+outputPath = "diff_unmet_hex_med_res_norm.json"
+
+props = ["UnmetDemand", "Difference"]
+
+def statePath(stateDir=stateDir):
+    return os.path.join(stateDir, "diff_state.npz")
+
+def seriesRows(temporal_object, duIds, timesteps):
+    rows = np.zeros((len(duIds), len(timesteps)))
+    present = np.zeros(len(duIds), dtype=bool)
+
+    for d, idd in enumerate(duIds):
+        if idd in temporal_object:
+            series = temporal_object[idd]
+            rows[d] = [series[t] for t in timesteps]
+            present[d] = True
+
+    return rows, present
+
+class DiffState:
+    def __init__(self, duIds, featureDu, areas, timesteps, scenarioRows, baselineRows, present, hexIds, operators):
+        self.duIds = duIds
+        self.featureDu = featureDu
+        self.areas = areas
+        self.timesteps = timesteps
+        self.scenarioRows = scenarioRows
+        self.baselineRows = baselineRows
+        self.present = present
+        self.hexIds = hexIds
+        self.operators = operators
+        self.reverse = [W.tocsc() for W in operators]
+        self.totals = [W @ self.featureMask() for W in operators]
+
+    def featureMask(self):
+        return self.present[self.featureDu].astype(np.float64)
+
+    # /**
+    #  *
+    #  * returns (features x timesteps) rows of prop, zero for absent demand units,
+    #  * normalized like process_hex.diffUnmetFeatures
+    #  */
+    def featureRows(self, prop, features=None):
+        du = self.featureDu if features is None else self.featureDu[features]
+
+        if prop == "UnmetDemand":
+            rows = self.scenarioRows[du] / self.areas[du, None]
+        else:
+            rows = (self.scenarioRows[du] - self.baselineRows[du]) / self.areas[du, None]
+
+        return rows * self.present[du, None]
+
+    # hexes (row indices per resolution) fed by any feature of the given demand units
+    def affectedHexes(self, duInds):
+        features = np.flatnonzero(np.isin(self.featureDu, duInds))
+        return [np.unique(R[:, features].indices) for R in self.reverse]
+
+    def save(self, stateDir=stateDir):
+        os.makedirs(stateDir, exist_ok=True)
+
+        arrays = {
+            "duIds": np.asarray(self.duIds),
+            "featureDu": self.featureDu,
+            "areas": self.areas,
+            "timesteps": np.asarray(self.timesteps),
+            "scenarioRows": self.scenarioRows,
+            "baselineRows": self.baselineRows,
+            "present": self.present,
+        }
+        for r, (hexIds, W) in enumerate(zip(self.hexIds, self.operators)):
+            arrays["hexIds_%d" % r] = np.asarray(hexIds)
+            arrays["data_%d" % r] = W.data
+            arrays["indices_%d" % r] = W.indices
+            arrays["indptr_%d" % r] = W.indptr
+            arrays["shape_%d" % r] = np.asarray(W.shape)
+
+        np.savez(statePath(stateDir), resolutions=len(self.operators), **arrays)
+
+    @classmethod
+    def load(cls, stateDir=stateDir):
+        with np.load(statePath(stateDir)) as f:
+            hexIds, operators = [], []
+            for r in range(int(f["resolutions"])):
+                hexIds.append(f["hexIds_%d" % r].tolist())
+                operators.append(scipy.sparse.csr_matrix((f["data_%d" % r], f["indices_%d" % r], f["indptr_%d" % r]), shape=tuple(f["shape_%d" % r])))
+
+            return cls(f["duIds"].tolist(), f["featureDu"], f["areas"], f["timesteps"].tolist(),
+                       f["scenarioRows"], f["baselineRows"], f["present"], hexIds, operators)
+
+# /**
+#  *
+#  * builds the state from the demand unit shapes and both scenario payloads
+#  */
+def buildState(region_object, temporal_object, temporal_bl_object):
+    du_fs = [f for f in region_object["features"] if f["properties"]["DU_ID"]]
+    duIds = list(dict.fromkeys(f["properties"]["DU_ID"] for f in du_fs))
+    duIndex = { idd: d for d, idd in enumerate(duIds) }
+    featureDu = np.array([duIndex[f["properties"]["DU_ID"]] for f in du_fs], dtype=np.int64)
+
+    # same normalization as tot_areas in process_hex.diffUnmetFeatures
+    areas = demandUnitAreas(du_fs, duIds)
+
+    timesteps = list(next(temporal_object[idd] for idd in duIds if idd in temporal_object))
+    scenarioRows, present = seriesRows(temporal_object, duIds, timesteps)
+    baselineRows, _ = seriesRows(temporal_bl_object, duIds, timesteps)
+
+    operators = process_hex.geojsonToHexOperators(du_fs, process_hex.resRange, process_hex.hexMode, process_hex.hierarchical)
+
+    return DiffState(duIds, featureDu, areas, timesteps, scenarioRows, baselineRows, present,
+                     [list(hexIds) for hexIds, _ in operators], [W for _, W in operators])
+
+# /**
+#  *
+#  * returns [{hexId: {UnmetDemand, Difference, Elevation}}, ...] for the hex rows
+#  * given per resolution (all hexes if rows is None); hexes no present demand
+#  * unit feeds map to None
+#  */
+def hexValues(state, rows=None, sampler=None):
+    resPoints = []
+
+    for r, (hexIds, W) in enumerate(zip(state.hexIds, state.operators)):
+        sel = np.flatnonzero(state.totals[r] > 0) if rows is None else rows[r]
+        Wsel = W[sel]
+
+        # only the features feeding the selected hexes are materialized
+        features = np.unique(Wsel.indices)
+        Wsel = Wsel[:, features]
+        totals = state.totals[r][sel]
+
+        # hexes left without any present demand unit have zero totals, they map to None below
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = [((Wsel @ state.featureRows(prop, features)) / totals[:, None]).tolist() for prop in props]
+        selIds = [hexIds[h] for h in sel.tolist()]
+        elevations = sampler.hexElevations(selIds).tolist() if sampler is not None else [None] * len(selIds)
+
+        points = {}
+        for i, hexId in enumerate(selIds):
+            if totals[i] > 0:
+                points[hexId] = { "UnmetDemand": means[0][i], "Difference": means[1][i], "Elevation": elevations[i] }
+            else:
+                points[hexId] = None
+        resPoints.append(points)
+
+    return resPoints
+
+# /**
+#  *
+#  * returns indices of the demand units whose series or presence differ from
+#  * the saved state
+#  */
+def changedUnits(state, temporal_object, temporal_bl_object):
+    scenarioRows, present = seriesRows(temporal_object, state.duIds, state.timesteps)
+    baselineRows, _ = seriesRows(temporal_bl_object, state.duIds, state.timesteps)
+
+    changed = (present != state.present) | np.any(scenarioRows != state.scenarioRows, axis=1) | np.any(baselineRows != state.baselineRows, axis=1)
+    return np.flatnonzero(changed)
+
+# /**
+#  *
+#  * updates the state for the demand units duInds, returns the affected hex rows
+#  * per resolution
+#  */
+def applyChanges(state, duInds, temporal_object, temporal_bl_object):
+    duIds = [state.duIds[d] for d in duInds]
+    scenarioRows, present = seriesRows(temporal_object, duIds, state.timesteps)
+    baselineRows, _ = seriesRows(temporal_bl_object, duIds, state.timesteps)
+
+    state.scenarioRows[duInds] = scenarioRows
+    state.baselineRows[duInds] = baselineRows
+    state.present[duInds] = present
+
+    affected = state.affectedHexes(duInds)
+    mask = state.featureMask()
+
+    # running totals of the affected hexes
+    for r, rows in enumerate(affected):
+        state.totals[r][rows] = state.operators[r][rows] @ mask
+
+    return affected
+
+# patches the affected hexes into the stored layer file, elevation is only
+# sampled for hexes new to it
+def patchOutput(path, updates, sampler):
+    with open(path) as infile:
+        resObjects = ujson.load(infile)
+
+    for points, patch in zip(resObjects, updates):
+        new = [hexId for hexId, value in patch.items() if value is not None and hexId not in points]
+        elevations = dict(zip(new, sampler.hexElevations(new).tolist()))
+
+        for hexId, value in patch.items():
+            if value is None:
+                points.pop(hexId, None)
+            else:
+                value["Elevation"] = elevations[hexId] if hexId in elevations else points[hexId]["Elevation"]
+                points[hexId] = value
+
+    with open(path, "w") as outfile:
+        ujson.dump(resObjects, outfile)
+
+def fetchScenarios():
+    temporal_object = fetchJson(apiRoot + "/data/scenario/" + process_hex.scenario + "/unmetdemand")
+    temporal_bl_object = fetchJson(apiRoot + "/data/scenario/" + process_hex.baseline + "/unmetdemand")
+    return temporal_object, temporal_bl_object
+
+def build(outputPath=outputPath, stateDir=stateDir):
+    region_object = fetchJson(apiRoot + "/shapes/demand_units")
+    state = buildState(region_object, *fetchScenarios())
+
+    with open(outputPath, "w") as outfile:
+        ujson.dump(hexValues(state, sampler=openSampler(process_hex.elevationSource)), outfile)
+
+    state.save(stateDir)
+
+# /**
+#  *
+#  * patches outputPath for the demand units that changed (or only units, a
+#  * list of DU_IDs), returns the number of hexes updated per resolution
+#  */
+def update(units=None, outputPath=outputPath, stateDir=stateDir):
+    state = DiffState.load(stateDir)
+    temporal_object, temporal_bl_object = fetchScenarios()
+
+    if units is None:
+        duInds = changedUnits(state, temporal_object, temporal_bl_object)
+    else:
+        duIndex = { idd: d for d, idd in enumerate(state.duIds) }
+        duInds = np.array([duIndex[idd] for idd in units if idd in duIndex], dtype=np.int64)
+
+    if len(duInds) == 0:
+        return [0] * len(state.operators)
+
+    affected = applyChanges(state, duInds, temporal_object, temporal_bl_object)
+
+    patchOutput(outputPath, hexValues(state, affected), openSampler(process_hex.elevationSource))
+    state.save(stateDir)
+
+    return [len(rows) for rows in affected]
+
+def main():
+    parser = argparse.ArgumentParser(description="incremental updates of " + outputPath)
+    parser.add_argument("command", choices=["build", "update"])
+    parser.add_argument("--units", nargs="+", help="DU_IDs to update, by default the ones whose series changed")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    if args.command == "build":
+        build()
+        print("built %s and %s in %.2fs" % (outputPath, statePath(), time.perf_counter() - start))
+    else:
+        counts = update(args.units)
+        print("updated %s hexes per resolution in %.2fs" % (counts, time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
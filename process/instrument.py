@@ -0,0 +1,193 @@
+import collections
+import contextlib
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import ujson
+
+# Run reports for the processing scripts. A run (one output file) collects
+#
+#   spans      wall time, calls and peak traced memory per nested stage, keyed by
+#              path, e.g. "geojsonToHexPoints/latlng_to_cell"
+#   counters   features, lattice points tested / kept, hexes per resolution, ...
+#
+# and is written next to the output as <output>_report.json when it finishes
+# (also when it fails), so a slow run can be diagnosed afterwards.
+#
+#   with instrument.run("landuse_hex_med_res_norm.json"):
+#       with instrument.span("fetch"):
+#           ...
+#       instrument.count("features", len(features))
+#
+# Spans and counters outside of a run are ignored, and work done in worker
+# processes (parallel.py) is only seen as the span around it.
+
+# trace allocations for per-span peak memory; off by default as tracemalloc slows
+# pure Python code down noticeably, the report always has the process's max RSS.
+# Can also be turned on with PROCESS_TRACE_MEMORY=1
+traceMemory = False
+
+# "sampling" samples the running stack every profileInterval seconds and writes
+# collapsed stacks (flamegraph.pl / speedscope input) to <output>_profile.txt,
+# None turns it off; can also be set with PROCESS_PROFILE=sampling
+profiler = None
+profileInterval = 0.005
+
+class Run:
+    def __init__(self, output):
+        self.output = output
+        self.spans = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+        self.stack = []
+        # per open span (and the run itself at [0]), the highest traced peak seen
+        # before tracemalloc.reset_peak was called for a nested span
+        self.peaks = [0]
+        self.start = time.perf_counter()
+        self.startedAt = time.time()
+
+    def enter(self, name):
+        if tracemalloc.is_tracing():
+            self.peaks[-1] = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        self.stack.append(name)
+        self.peaks.append(0)
+
+    def exit(self, seconds):
+        path = "/".join(self.stack)
+        peak = None
+
+        if tracemalloc.is_tracing():
+            peak = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+            self.peaks[-2] = max(self.peaks[-2], peak)
+
+        self.stack.pop()
+        self.peaks.pop()
+
+        entry = self.spans.setdefault(path, { "calls": 0, "seconds": 0.0, "peakBytes": None })
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        if peak is not None:
+            entry["peakBytes"] = max(entry["peakBytes"] or 0, peak)
+
+    def peakTraced(self):
+        return max(self.peaks[0], tracemalloc.get_traced_memory()[1])
+
+    def report(self, status):
+        return {
+            "output": self.output,
+            "status": status,
+            "startedAt": self.startedAt,
+            "seconds": time.perf_counter() - self.start,
+            "maxRssBytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+            "spans": self.spans,
+            "counters": self.counters,
+        }
+
+current = None
+
+@contextlib.contextmanager
+def span(name):
+    if current is None:
+        yield
+        return
+
+    current.enter(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.exit(time.perf_counter() - start)
+
+def count(name, n=1):
+    if current is not None:
+        current.counters[name] = current.counters.get(name, 0) + n
+
+def setCounter(name, value):
+    if current is not None:
+        current.counters[name] = value
+
+def reportPath(output, suffix="_report.json"):
+    return os.path.splitext(output)[0] + suffix
+
+# samples the stack of one thread from a daemon thread
+class SamplingProfiler:
+    def __init__(self, interval=profileInterval, threadId=None):
+        self.interval = interval
+        self.threadId = threadId or threading.get_ident()
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w") as outfile:
+            for stack, samples in self.stacks.most_common():
+                outfile.write("%s %d\n" % (stack, samples))
+
+def traceSetting():
+    return traceMemory or os.environ.get("PROCESS_TRACE_MEMORY", "") not in ("", "0")
+
+def profilerSetting():
+    return profiler or os.environ.get("PROCESS_PROFILE") or None
+
+# /**
+#  *
+#  * collects spans and counters for the code run inside it and writes the
+#  * report (and profile) next to output when it exits
+#  */
+@contextlib.contextmanager
+def run(output):
+    global current
+
+    previous = current
+    current = Run(output)
+
+    startedTracing = traceSetting() and not tracemalloc.is_tracing()
+    if startedTracing:
+        tracemalloc.start()
+
+    sampler = None
+    if profilerSetting() == "sampling":
+        sampler = SamplingProfiler(profileInterval)
+        sampler.start()
+
+    status = "failed"
+    try:
+        yield current
+        status = "ok"
+    finally:
+        report = current.report(status)
+
+        if sampler is not None:
+            sampler.stop()
+            sampler.write(reportPath(output, "_profile.txt"))
+            report["profile"] = reportPath(output, "_profile.txt")
+        if startedTracing:
+            report["peakTracedBytes"] = current.peakTraced()
+            tracemalloc.stop()
+
+        with open(reportPath(output), "w") as outfile:
+            ujson.dump(report, outfile, indent=2)
+
+        current = previous
@@ -0,0 +1,173 @@
+import codecs
+import json
+
+# Incremental JSON reader. Text is fed in chunks as it arrives (from a socket or
+# a file) and every member of the top-level container is decoded as soon as it
+# is complete, so a caller never needs the whole document in memory at once:
+#
+#   top-level object           -> (key, value) pairs
+#   top-level array            -> values
+#   key="features" on object   -> the values of the array under that key, other
+#                                 top-level members are skipped
+#
+# Members are decoded with json's raw_decode, so each single member (one feature,
+# one DU_ID series) still has to fit in memory.
+
+decoder = json.JSONDecoder()
+
+whitespace = " \t\n\r"
+
+class JsonStreamError(ValueError):
+    pass
+
+class JsonStream:
+    def __init__(self, key=None):
+        self.key = key
+        self.buf = ""
+        self.pos = 0
+        self.state = "start"
+        self.closed = False
+        # chunks not yet appended to buf, and how much pending text an
+        # incomplete member needs before it is retried, so small chunks don't
+        # reparse a large member over and over
+        self.pending = []
+        self.pendingLen = 0
+        self.wait = 0
+
+    def skip(self, pos, chars=whitespace):
+        while pos < len(self.buf) and self.buf[pos] in chars:
+            pos += 1
+        return pos
+
+    # returns (value, end) or None if the buffer doesn't hold the whole value yet
+    def value(self, pos):
+        try:
+            val, end = decoder.raw_decode(self.buf, pos)
+        except json.JSONDecodeError:
+            if self.closed:
+                raise JsonStreamError("invalid JSON at offset %d" % pos)
+            return None
+
+        # a number at the end of the buffer may continue in the next chunk
+        if not self.closed and self.skip(end) == len(self.buf):
+            return None
+
+        return val, end
+
+    def step(self):
+        pos = self.skip(self.pos, whitespace + ("," if self.state != "start" else ""))
+        if pos == len(self.buf):
+            return None
+
+        ch = self.buf[pos]
+
+        if self.state == "start":
+            if ch == "{":
+                self.state = "object"
+            elif ch == "[" and self.key is None:
+                self.state = "array"
+            else:
+                raise JsonStreamError("expected %s at offset %d" % ("an object" if self.key else "an object or array", pos))
+            self.pos = pos + 1
+            return ()
+
+        if self.state in ("array", "inner") and ch == "]":
+            self.state = "done" if self.state == "array" else "object"
+            self.pos = pos + 1
+            return ()
+
+        if self.state == "object" and ch == "}":
+            self.state = "done"
+            self.pos = pos + 1
+            return ()
+
+        if self.state in ("array", "inner"):
+            decoded = self.value(pos)
+            if decoded is None:
+                return None
+            self.pos = decoded[1]
+            return (decoded[0],)
+
+        # object member: key, colon, value
+        decodedKey = self.value(pos)
+        if decodedKey is None:
+            return None
+        memberKey, end = decodedKey
+
+        end = self.skip(end)
+        if end == len(self.buf):
+            return None
+        if self.buf[end] != ":":
+            raise JsonStreamError("expected ':' at offset %d" % end)
+
+        end = self.skip(end + 1)
+        if end == len(self.buf):
+            return None
+
+        if self.key is not None and memberKey == self.key and self.buf[end] == "[":
+            self.state = "inner"
+            self.pos = end + 1
+            return ()
+
+        decoded = self.value(end)
+        if decoded is None:
+            return None
+        self.pos = decoded[1]
+
+        if self.key is not None:
+            return ()
+        return ((memberKey, decoded[0]),)
+
+    def drain(self):
+        items = []
+
+        if not self.closed and self.pendingLen < self.wait:
+            return items
+
+        # drop consumed text so the buffer only holds the member being read
+        self.buf = self.buf[self.pos:] + "".join(self.pending)
+        self.pos = 0
+        self.pending = []
+        self.pendingLen = 0
+
+        while self.state != "done":
+            progress = self.step()
+            if progress is None:
+                self.wait = len(self.buf) - self.pos
+                break
+            items.extend(progress)
+
+        return items
+
+    def feed(self, text):
+        self.pending.append(text)
+        self.pendingLen += len(text)
+        return self.drain()
+
+    def close(self):
+        self.closed = True
+        items = self.drain()
+
+        if self.state != "done":
+            raise JsonStreamError("truncated JSON document")
+
+        return items
+
+# /**
+#  *
+#  * yields the members of a JSON document read from a binary or text file
+#  * object, see JsonStream
+#  */
+def iterJson(fp, key=None, chunkSize=1 << 16):
+    stream = JsonStream(key)
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    while True:
+        chunk = fp.read(chunkSize)
+        if not chunk:
+            break
+        text = utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        yield from stream.feed(text)
+
+    stream.feed(utf8.decode(b"", final=True))
+    yield from stream.close()
@@ -0,0 +1,154 @@
+import numpy as np
+from binary_export import resolutionOf, layerMatrix, presentLayers, scalarLayers, categoryLayers, vectorLayers, missingCategory
+
+# Per-layer statistics of the hex objects, computed while the layers are written
+# so a client can build its scales without a pass over the data. For every
+# resolution and layer:
+#
+#   series, scalar   count, min, max, mean and percentiles of all values (every
+#                    hex and timestep), plus for series the extent of every
+#                    timestep (timestepMin / timestepMax)
+#   category         hexes per dominant class
+#   vector           min, max and mean of each component
+#
+# and per layer over all resolutions, "extent" [min, max] and "robustExtent"
+# [lowest first percentile, highest last percentile], so a scale built from them
+# is the same whichever resolution is on screen. Missing values are null.
+#
+#   stats = newLayerStats()
+#   for hexObjects in resObjects:
+#       addResolutionStats(stats, hexObjects)
+#   finishLayerStats(stats)
+
+percentiles = [1, 5, 25, 50, 75, 95, 99]
+
+def finiteOrNone(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+def listOrNone(values):
+    return [finiteOrNone(v) for v in values]
+
+# /**
+#  *
+#  * returns { count, min, max, mean, percentiles } of the values of matrix,
+#  * NaN being missing, and with perTimestep the extent of every column
+#  */
+def numericStats(matrix, percentiles=percentiles, perTimestep=False):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    values = matrix[~np.isnan(matrix)]
+
+    stats = { "count": int(values.size), "min": None, "max": None, "mean": None, "percentiles": [None] * len(percentiles) }
+
+    if values.size:
+        stats["min"] = finiteOrNone(values.min())
+        stats["max"] = finiteOrNone(values.max())
+        stats["mean"] = finiteOrNone(values.mean())
+        stats["percentiles"] = listOrNone(np.percentile(values, percentiles))
+
+    if perTimestep:
+        # fmin / fmax skip NaN, and give NaN (null) for a timestep no hex has
+        stats["timestepMin"] = listOrNone(np.fmin.reduce(matrix, axis=0)) if len(matrix) else [None] * matrix.shape[1]
+        stats["timestepMax"] = listOrNone(np.fmax.reduce(matrix, axis=0)) if len(matrix) else [None] * matrix.shape[1]
+
+    return stats
+
+def categoryStats(matrix, missing):
+    codes = matrix[:, 0].astype(np.int64)
+    present = codes[codes != missing]
+    classes = np.bincount(present)
+    return { "count": int(present.size), "classes": { str(c): int(n) for c, n in enumerate(classes.tolist()) if n } }
+
+def vectorStats(matrix):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    rows = matrix[~np.isnan(matrix).any(axis=1)]
+
+    if len(rows) == 0:
+        return { "count": 0, "min": [None] * matrix.shape[1], "max": [None] * matrix.shape[1], "mean": [None] * matrix.shape[1] }
+
+    return { "count": len(rows), "min": listOrNone(rows.min(axis=0)), "max": listOrNone(rows.max(axis=0)), "mean": listOrNone(rows.mean(axis=0)) }
+
+def layerKind(layer):
+    if layer in categoryLayers:
+        return "category"
+    if layer in scalarLayers:
+        return "scalar"
+    if layer in vectorLayers:
+        return "vector"
+    return "series"
+
+# /**
+#  *
+#  * returns the stats of one layer of one resolution
+#  */
+def layerStats(hexObjects, layer, percentiles=percentiles):
+    kind = layerKind(layer)
+
+    if kind == "category":
+        return categoryStats(layerMatrix(hexObjects, layer), missingCategory)
+
+    matrix = layerMatrix(hexObjects, layer, np.float64)
+
+    if kind == "vector":
+        return vectorStats(matrix)
+
+    return numericStats(matrix, percentiles, perTimestep=kind == "series")
+
+def newLayerStats(percentiles=percentiles):
+    return {
+        "version": 1,
+        "percentiles": list(percentiles),
+        "layers": {},
+        "resolutions": [],
+    }
+
+# adds the stats of one resolution (a {hexId: obj} or [[hexId, obj], ...]) to stats
+def addResolutionStats(stats, hexObjects, layers=None):
+    res = resolutionOf(hexObjects)
+    if res is None:
+        return
+
+    if layers is None:
+        layers = presentLayers([hexObjects])
+
+    resEntry = { "resolution": res, "hexes": len(hexObjects), "layers": {} }
+
+    for layer in layers:
+        resEntry["layers"][layer] = layerStats(hexObjects, layer, stats["percentiles"])
+        stats["layers"].setdefault(layer, { "kind": layerKind(layer) })
+
+    stats["resolutions"].append(resEntry)
+
+def combinedExtent(values, fn):
+    values = [v for v in values if v is not None]
+    return fn(values) if values else None
+
+# /**
+#  *
+#  * sets the extents over all resolutions of every numeric layer, returns stats
+#  */
+def finishLayerStats(stats):
+    for layer, entry in stats["layers"].items():
+        if entry["kind"] not in ("series", "scalar"):
+            continue
+
+        perRes = [r["layers"][layer] for r in stats["resolutions"] if layer in r["layers"]]
+
+        entry["extent"] = [combinedExtent([s["min"] for s in perRes], min), combinedExtent([s["max"] for s in perRes], max)]
+        entry["robustExtent"] = [
+            combinedExtent([s["percentiles"][0] for s in perRes], min),
+            combinedExtent([s["percentiles"][-1] for s in perRes], max),
+        ]
+
+    return stats
+
+# /**
+#  *
+#  * returns the finished stats of resObjects, ordered by resolution as
+#  * written by process_hex.py / process_combine.py
+#  */
+def computeLayerStats(resObjects, layers=None, percentiles=percentiles):
+    stats = newLayerStats(percentiles)
+    for hexObjects in resObjects:
+        addResolutionStats(stats, hexObjects, layers)
+    return finishLayerStats(stats)
@@ -0,0 +1,104 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import h3
+import numpy as np
+import shapely
+from h3.api import basic_int as h3int
+from raster import flatten, polygonToPointArrays
+
+# Process-pool versions of the two per-item loops of the lattice path:
+# rasterizing features (geojsonToGridArrays) and binning grid points into hexes
+# (binLattice). Work is split into contiguous shards and workers only receive
+# compact NumPy arrays (polygon coordinates, point lats/lons) instead of GeoJSON
+# dicts; shards are merged back in order, so results are identical to the
+# serial path no matter how many workers run.
+
+def defaultWorkers():
+    return os.cpu_count() or 1
+
+def shardBounds(n, shards):
+    shards = max(1, min(shards, n))
+    edges = np.linspace(0, n, shards + 1).astype(np.int64)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+def polygonCoords(dataFeature):
+    # same ring-concatenating polygon as raster.featurePolygon, as an (n x 2)
+    # array; positions may carry an altitude, only lon / lat are kept
+    flattenedCoords = flatten(dataFeature["geometry"]["coordinates"])
+    return np.array([(polycoord[0], polycoord[1]) for polycoord in flattenedCoords], dtype=np.float64).reshape(-1, 2)
+
+def rasterizeShard(coordsList, start, scale):
+    lons, lats, inds = [], [], []
+
+    for offset, coords in enumerate(coordsList):
+        shardLons, shardLats = polygonToPointArrays(shapely.geometry.polygon.Polygon(coords), scale)
+        lons.append(shardLons)
+        lats.append(shardLats)
+        inds.append(np.full(len(shardLons), start + offset, dtype=np.int64))
+
+    if len(lons) == 0:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+
+    return np.concatenate(lons), np.concatenate(lats), np.concatenate(inds)
+
+# /**
+#  *
+#  * same result as raster.geojsonToGridArrays, rasterized on a process pool
+#  */
+def geojsonToGridArraysParallel(dataFeatures, scale=50, workers=None):
+    workers = workers or defaultWorkers()
+    coords = [polygonCoords(feature) for feature in dataFeatures]
+
+    # a few shards per worker keeps the pool busy when feature sizes vary
+    bounds = shardBounds(len(coords), workers * 4)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(rasterizeShard, coords[start:end], start, scale) for start, end in bounds]
+        shards = [future.result() for future in futures]
+
+    if len(shards) == 0:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+
+    return tuple(np.concatenate([shard[i] for shard in shards]) for i in range(3))
+
+# rows as raster.geojsonToGridPointsVectorized
+def geojsonToGridPointsParallel(dataFeatures, scale=50, workers=None):
+    lons, lats, inds = geojsonToGridArraysParallel(dataFeatures, scale, workers)
+    return [[lon, lat, ind] for lon, lat, ind in zip(lons.tolist(), lats.tolist(), inds.tolist())]
+
+def cellShard(lats, lons, res):
+    return np.fromiter((h3int.latlng_to_cell(lat, lon, res) for lat, lon in zip(lats.tolist(), lons.tolist())), dtype=np.uint64, count=len(lats))
+
+# integer cells -> (hex ids in first-seen order, group code per point), as binLattice
+def firstSeenCodes(cells):
+    uniques, firstIndex, inverse = np.unique(cells, return_index=True, return_inverse=True)
+
+    order = np.argsort(firstIndex, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    return [h3.int_to_str(int(cell)) for cell in uniques[order]], rank[inverse.ravel()]
+
+# /**
+#  *
+#  * returns array of (hexIds, groups) for every resolution in resolutions, the
+#  * same as calling columnar.binLattice per resolution
+#  */
+def binLatticeParallel(lons, lats, resolutions, workers=None):
+    workers = workers or defaultWorkers()
+    bounds = shardBounds(len(lons), workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            res: [pool.submit(cellShard, lats[start:end], lons[start:end], res) for start, end in bounds]
+            for res in resolutions
+        }
+        resCells = { res: [future.result() for future in shardFutures] for res, shardFutures in futures.items() }
+
+    binned = []
+
+    for res in resolutions:
+        cells = np.concatenate(resCells[res]) if len(resCells[res]) else np.empty(0, dtype=np.uint64)
+        binned.append(firstSeenCodes(cells))
+
+    return binned
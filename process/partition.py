@@ -0,0 +1,241 @@
+import os
+import shutil
+import h3
+import numpy as np
+import ujson
+from raster import featurePolygon, polygonToPointArrays
+from columnar import binLattice, featureMatrix
+from weights import toOperator, operatorCategories, operatorFirstSeen
+from binary_export import writeBinaryStream
+from categorical import NOT_SEEN, categoryValues
+
+# Out-of-core hex aggregation for high resolutions (res 8-9), where the binned
+# points and per-hex lists of gridPointsToHexPoints no longer fit in memory.
+# The state is processed one coarse parent cell (partitionRes) at a time:
+#
+#   1. spill      every feature is rasterized on its own and its lattice points
+#                 are appended to <workDir>/points/<parent cell>.bin
+#   2. aggregate  one partition at a time, points are binned at every output
+#                 resolution and the per-hex sums / counts (or category counts)
+#                 are saved as <workDir>/shards/<parent cell>_r<res>.npz
+#   3. stitch     shards are merged into the usual per-resolution output, JSON or
+#                 binary (binary_export.py), written as it is produced
+#
+# H3 cells aren't exactly nested, so a fine hex near a parent's edge can get
+# points from two partitions; such hexes are merged in the stitch pass by adding
+# their sums and counts, which gives the same means as one unpartitioned pass.
+
+# lattice points are stored as their integer lattice indices, so lon = i / scale
+# reproduces raster.polygonToPointArrays exactly
+pointType = np.dtype([("lon", "<i4"), ("lat", "<i4"), ("ind", "<i4")])
+
+def pointsDir(workDir):
+    return os.path.join(workDir, "points")
+
+def shardsDir(workDir):
+    return os.path.join(workDir, "shards")
+
+def shardPath(workDir, partition, res):
+    return os.path.join(shardsDir(workDir), "%s_r%d.npz" % (partition, res))
+
+# /**
+#  *
+#  * rasterizes features one by one and appends their lattice points to one
+#  * spill file per parent cell, returns the sorted parent cells
+#  */
+def spillGridPoints(dataFeatures, workDir, scale=50, partitionRes=3):
+    os.makedirs(pointsDir(workDir), exist_ok=True)
+    outfiles = {}
+
+    try:
+        for ind, feature in enumerate(dataFeatures):
+            lons, lats = polygonToPointArrays(featurePolygon(feature), scale)
+            if len(lons) == 0:
+                continue
+
+            parents = np.array([h3.latlng_to_cell(lat, lon, partitionRes) for lon, lat in zip(lons.tolist(), lats.tolist())])
+
+            points = np.empty(len(lons), dtype=pointType)
+            points["lon"] = np.rint(lons * scale)
+            points["lat"] = np.rint(lats * scale)
+            points["ind"] = ind
+
+            for parent in np.unique(parents).tolist():
+                if parent not in outfiles:
+                    outfiles[parent] = open(os.path.join(pointsDir(workDir), parent + ".bin"), "ab")
+                points[parents == parent].tofile(outfiles[parent])
+    finally:
+        for outfile in outfiles.values():
+            outfile.close()
+
+    return sorted(outfiles)
+
+def readPartition(workDir, partition, scale):
+    points = np.fromfile(os.path.join(pointsDir(workDir), partition + ".bin"), dtype=pointType)
+    return points["lon"] / scale, points["lat"] / scale, points["ind"].astype(np.int64)
+
+# /**
+#  *
+#  * bins one partition's points at every resolution and saves its shards
+#  *
+#  * matrices: { prop: (features x timesteps) matrix } of the series layers
+#  * codes: integer category per feature (LandUse), or None
+#  * nCategories: number of categories, the same for every partition
+#  */
+def aggregatePartition(workDir, partition, resolutions, nFeatures, matrices, codes=None, nCategories=0, scale=50):
+    lons, lats, inds = readPartition(workDir, partition, scale)
+    weights = np.ones(len(inds))
+
+    for res in resolutions:
+        hexIds, groups = binLattice(lons, lats, res)
+        W = toOperator(hexIds, groups, inds, weights, nFeatures)
+
+        cells = np.array([h3.str_to_int(hexId) for hexId in hexIds], dtype=np.uint64)
+        arrays = { "cells": cells, "counts": np.asarray(W.sum(axis=1)).ravel() }
+        for prop, matrix in matrices.items():
+            arrays["sum_" + prop] = W @ matrix
+        if codes is not None:
+            arrays["categories"] = operatorCategories(W, codes, nCategories)
+            arrays["firstSeen"] = operatorFirstSeen(W, codes, nCategories)
+
+        np.savez(shardPath(workDir, partition, res), **arrays)
+
+# /**
+#  *
+#  * yields (res, [[hexId, obj], ...]) batches with obj like the output of
+#  * geojsonToHexPoints: means of each series prop, ranked categories with their
+#  * fractions (categorical.py), Elevation
+#  */
+def stitchShards(workDir, partitions, resolutions, props, categoryProp=None, sampler=None, batchSize=4096, fractionDigits=4):
+    # batches of at most batchSize hexes, so only that many output objects exist at once
+    def finalize(hexIds, counts, sums, categories, firstSeen):
+        for start in range(0, len(hexIds), batchSize):
+            end = start + batchSize
+            batchIds = hexIds[start:end]
+
+            elevations = sampler.hexElevations(batchIds).tolist() if sampler is not None else None
+            means = [(s[start:end] / counts[start:end, None]).tolist() for s in sums]
+            values = categoryValues(categories[start:end], firstSeen[start:end], categoryProp, fractionDigits) if categories is not None else None
+            batch = []
+
+            for code, hexId in enumerate(batchIds):
+                obj = { prop: means[p][code] for p, prop in enumerate(props) }
+                if values is not None:
+                    obj.update(values[code])
+                if elevations is not None:
+                    obj["Elevation"] = elevations[code]
+                batch.append([hexId, obj])
+
+            yield res, batch
+
+    for res in resolutions:
+        # every resolution appears in the output, even if it has no hexes
+        yield res, []
+
+        # hexes fed by more than one partition, merged once all shards are read
+        cells = []
+        for partition in partitions:
+            with np.load(shardPath(workDir, partition, res)) as shard:
+                cells.append(shard["cells"])
+        uniques, counts = np.unique(np.concatenate(cells) if cells else np.empty(0, dtype=np.uint64), return_counts=True)
+        shared = uniques[counts > 1]
+        del cells, uniques, counts
+
+        merged = {}
+
+        for partition in partitions:
+            with np.load(shardPath(workDir, partition, res)) as shard:
+                cells = shard["cells"]
+                counts = shard["counts"]
+                sums = [shard["sum_" + prop] for prop in props]
+                categories = shard["categories"] if categoryProp is not None else None
+                firstSeen = shard["firstSeen"] if categoryProp is not None else None
+
+            isShared = np.isin(cells, shared)
+
+            for i in np.flatnonzero(isShared).tolist():
+                acc = merged.setdefault(int(cells[i]), [0.0, [0.0] * len(props), 0.0, NOT_SEEN])
+                acc[0] += counts[i]
+                acc[1] = [a + s[i] for a, s in zip(acc[1], sums)]
+                if categories is not None:
+                    acc[2] = acc[2] + categories[i]
+                    acc[3] = np.minimum(acc[3], firstSeen[i])
+
+            own = np.flatnonzero(~isShared)
+
+            yield from finalize(
+                [h3.int_to_str(int(cell)) for cell in cells[own]],
+                counts[own],
+                [s[own] for s in sums],
+                categories[own] if categories is not None else None,
+                firstSeen[own] if firstSeen is not None else None,
+            )
+
+        if merged:
+            accs = list(merged.values())
+
+            yield from finalize(
+                [h3.int_to_str(cell) for cell in merged],
+                np.array([acc[0] for acc in accs]),
+                [np.array([acc[1][p] for acc in accs]) for p in range(len(props))],
+                np.array([acc[2] for acc in accs]) if categoryProp is not None else None,
+                np.array([acc[3] for acc in accs]) if categoryProp is not None else None,
+            )
+
+# writes the batches as [ {hexId: obj, ...}, ... ] (one object per resolution),
+# the same document ujson.dump writes for geojsonToHexPoints output
+def writeJsonStream(resBatches, path):
+    with open(path, "w") as outfile:
+        outfile.write("[")
+        current, first = None, True
+
+        for res, batch in resBatches:
+            if res != current:
+                outfile.write(("" if current is None else "},") + "{")
+                current, first = res, True
+
+            for hexId, obj in batch:
+                outfile.write(("" if first else ",") + ujson.dumps(hexId) + ":" + ujson.dumps(obj))
+                first = False
+
+        outfile.write(("" if current is None else "}") + "]")
+
+# /**
+#  *
+#  * runs spill, aggregate and stitch for one layer and writes it to outPath,
+#  * a JSON file (format "json") or a binary_export directory (format "binary")
+#  *
+#  * props: series properties averaged per hex
+#  * categoryProp: categorical property ranked per hex (LandUse), or None
+#  * nCategories: width of the category fractions, at least the largest code + 1
+#  */
+def partitionedHexPoints(dataFeatures, props, resRange, outPath, workDir, categoryProp=None, sampler=None,
+                         scale=50, partitionRes=3, outputFormat="json", dtype="float32", keep=False,
+                         nCategories=0, fractionDigits=4):
+    minRes, maxRes = resRange
+    resolutions = list(range(minRes, maxRes + 1))
+
+    shutil.rmtree(workDir, ignore_errors=True)
+    os.makedirs(shardsDir(workDir))
+
+    partitions = spillGridPoints(dataFeatures, workDir, scale, partitionRes)
+
+    matrices = { prop: featureMatrix(dataFeatures, prop) for prop in props }
+    codes = [feature["properties"][categoryProp] for feature in dataFeatures] if categoryProp is not None else None
+    nCategories = max(nCategories, max(codes, default=0) + 1) if codes is not None else 0
+
+    for partition in partitions:
+        aggregatePartition(workDir, partition, resolutions, len(dataFeatures), matrices, codes, nCategories, scale)
+        # the partition's points are only needed until its shards exist
+        os.remove(os.path.join(pointsDir(workDir), partition + ".bin"))
+
+    resBatches = stitchShards(workDir, partitions, resolutions, props, categoryProp, sampler, fractionDigits=fractionDigits)
+
+    if outputFormat == "binary":
+        layers = props + ([categoryProp, categoryProp + "Fractions"] if categoryProp is not None else []) + (["Elevation"] if sampler is not None else [])
+        writeBinaryStream(resBatches, outPath, layers, dtype)
+    else:
+        writeJsonStream(resBatches, outPath)
+
+    if not keep:
+        shutil.rmtree(workDir, ignore_errors=True)
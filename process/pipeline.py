@@ -0,0 +1,301 @@
+import argparse
+import hashlib
+import inspect
+import os
+import runpy
+import time
+import ujson
+import raster, coverage, rollup, columnar, categorical, weights, elevation, parallel, groundwater, jsonstream, binary_export, geoarea, layerstats, pyramid
+import process_hex, process_combine
+from fetch import fetchBytes, apiRoot
+
+# Stage runner for the processing scripts. Every stage declares what its output
+# depends on:
+#
+#   files    input files (content hashed, a directory hashes all its files)
+#   urls     API payloads (fetched through the cache of fetch.py and hashed)
+#   params   settings such as scale or resRange
+#   code     the functions / modules it runs, hashed by source, so editing
+#            idToVal only invalidates the land use stage
+#
+# and a stage is skipped when the fingerprint of all that matches the one saved
+# with its outputs in stateDir (and the outputs are still what it wrote).
+#
+#   python pipeline.py                     run the stages whose inputs changed
+#   python pipeline.py --only landuse      run only some stages
+#   python pipeline.py --force [stage ...] rerun even if up to date
+#   python pipeline.py --list              show stages and whether they are up to date
+
+stateDir = ".pipeline"
+
+class Stage:
+    def __init__(self, name, run, outputs, files=(), urls=(), params=None, code=()):
+        self.name = name
+        self.run = run
+        self.outputs = outputs
+        self.files = files
+        self.urls = urls
+        # evaluated when fingerprinting, so changed settings are picked up
+        self.params = params or (lambda: {})
+        self.code = code
+
+# content hashes of files, reused while a file's size and mtime are unchanged
+class FileDigests:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as infile:
+                self.entries = ujson.load(infile)
+
+    def file(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as infile:
+            for block in iter(lambda: infile.read(1 << 20), b""):
+                digest.update(block)
+
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    # None for a missing path
+    def digest(self, path):
+        if os.path.isdir(path):
+            digest = hashlib.sha256()
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    digest.update((os.path.relpath(full, path) + "\0" + self.file(full) + "\0").encode())
+            return digest.hexdigest()
+
+        if os.path.exists(path):
+            return self.file(path)
+
+        return None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as outfile:
+            ujson.dump(self.entries, outfile)
+
+def codeDigest(obj):
+    # a path is hashed as a file, anything else by its source
+    if isinstance(obj, str):
+        with open(obj, "rb") as infile:
+            source = infile.read()
+    else:
+        source = inspect.getsource(obj).encode()
+
+    return hashlib.sha256(source).hexdigest()
+
+def fingerprint(stage, digests):
+    inputs = {
+        "files": { path: digests.digest(path) for path in stage.files },
+        "urls": { url: hashlib.sha256(fetchBytes(url)).hexdigest() for url in stage.urls },
+        "params": stage.params(),
+        "code": [codeDigest(obj) for obj in stage.code],
+    }
+
+    return hashlib.sha256(ujson.dumps(inputs, sort_keys=True).encode()).hexdigest(), inputs
+
+def statePath(stage):
+    return os.path.join(stateDir, stage.name + ".json")
+
+def loadState(stage):
+    if not os.path.exists(statePath(stage)):
+        return None
+    with open(statePath(stage)) as infile:
+        return ujson.load(infile)
+
+def upToDate(stage, state, current, digests):
+    if state is None or state["fingerprint"] != current:
+        return False
+    # outputs deleted or changed since the stage wrote them
+    return all(digests.digest(path) == digest for path, digest in state["outputs"].items())
+
+# the modules / functions each stage's output depends on
+libraryCode = [raster, coverage, rollup, columnar, categorical, weights, elevation, parallel]
+
+hexCode = libraryCode + [
+    process_hex.avg, process_hex.avgArrOfArr, process_hex.sumArrOfArr, process_hex.binGridPoints,
+    process_hex.gridPointsToHexPoints, process_hex.gridPointsToHexPointsHierarchical,
+    process_hex.gridPointsToHexPointsColumnar, process_hex.binResolutions, process_hex.hexGroups,
+    process_hex.gridPointsToHexPointsCategorical, process_hex.operatorsToHexPoints, process_hex.geojsonToHexOperators,
+    process_hex.geojsonToHexPoints,
+]
+
+# process_hex's tables keyed by function, by name, so a changed entry (not only
+# changed code) reruns the hex stages
+def functionTable(table):
+    return { fn.__name__: value.__name__ if callable(value) else value for fn, value in table.items() }
+
+def hexParams():
+    return {
+        "sumFns": functionTable(process_hex.sumFns),
+        "seriesProps": functionTable(process_hex.seriesProps),
+        "categoricalProps": functionTable(process_hex.categoricalProps),
+        "scale": process_hex.scale,
+        "hexMode": process_hex.hexMode,
+        "hierarchical": process_hex.hierarchical,
+        "engine": process_hex.engine,
+        "resRange": process_hex.resRange,
+        "landUseCategories": process_hex.landUseCategories,
+        "categoryWeighting": process_hex.categoryWeighting,
+        "fractionDigits": process_hex.fractionDigits,
+    }
+
+def scenarioUrl(scenarioId):
+    return apiRoot + "/data/scenario/" + scenarioId + "/unmetdemand"
+
+def stages():
+    elevationFiles = [process_hex.elevationSource]
+
+    return [
+        Stage(
+            "diff",
+            process_hex.writeDiffUnmet,
+            ["diff_unmet_hex_med_res_norm.json"],
+            files=elevationFiles,
+            urls=[apiRoot + "/shapes/demand_units", scenarioUrl(process_hex.scenario), scenarioUrl(process_hex.baseline)],
+            params=lambda: dict(hexParams(), scenario=process_hex.scenario, baseline=process_hex.baseline),
+            code=hexCode + [geoarea, process_hex.avgDiffUnmet, process_hex.sumDiffUnmet, process_hex.diffUnmetFeatures, process_hex.writeDiffUnmet],
+        ),
+        Stage(
+            "landuse",
+            process_hex.writeLandUse,
+            ["landuse_hex_med_res_norm.json"],
+            files=elevationFiles,
+            urls=[apiRoot + "/shapes/demand_units"],
+            params=hexParams,
+            code=hexCode + [process_hex.maxCounter, process_hex.aggLandUse, process_hex.weightedCounts, process_hex.countLandUse,
+                            process_hex.idToVal, process_hex.landUseFeatures, process_hex.writeLandUse],
+        ),
+        Stage(
+            "groundwater",
+            process_hex.writeGroundwater,
+            ["groundwater_hex_med_res_norm.json"],
+            files=elevationFiles + [groundwater.groundwaterFile],
+            params=hexParams,
+            code=hexCode + [groundwater, jsonstream, process_hex.avgGroundwater, process_hex.sumGroundwater, process_hex.writeGroundwater],
+        ),
+        Stage(
+            "temporal",
+            lambda: runpy.run_path("geo_to_temporal.py", run_name="__main__"),
+            ["groundwater_temporal.json"],
+            files=[groundwater.groundwaterFile],
+            code=["geo_to_temporal.py", groundwater, jsonstream],
+        ),
+        Stage(
+            "combine",
+            lambda: process_combine.combineLayers(process_combine.layers, outputFormats=process_combine.outputFormats, chunkSize=process_combine.chunkSize,
+                                                  dtype=process_combine.binaryDtype, percentiles=process_combine.statsPercentiles,
+                                                  levels=process_combine.temporalLevels),
+            combineOutputs(),
+            files=[path for path, _ in process_combine.layers],
+            params=lambda: {
+                "layers": process_combine.layers,
+                "outputFormats": process_combine.outputFormats,
+                "chunkSize": process_combine.chunkSize,
+                "binaryDtype": process_combine.binaryDtype,
+                "statsPercentiles": process_combine.statsPercentiles,
+                "temporalLevels": process_combine.temporalLevels,
+            },
+            code=[process_combine, binary_export, layerstats, pyramid, jsonstream],
+        ),
+    ]
+
+def combineOutputs():
+    name = process_combine.outputName
+    outputs = { "json": name + ".json", "binary": name, "chunks": name + "_chunks" }
+    return [outputs[f] for f in process_combine.outputFormats] + [name + "_stats.json", name + "_layer_stats.json"]
+
+# /**
+#  *
+#  * runs the selected stages in order, returns [{ stage, status, seconds }]
+#  *
+#  * only: names of the stages to consider, None for all
+#  * force: names of the stages to rerun even if up to date, True for all
+#  */
+def runStages(allStages, only=None, force=()):
+    digests = FileDigests(os.path.join(stateDir, "files.json"))
+    summary = []
+
+    try:
+        for stage in allStages:
+            if only is not None and stage.name not in only:
+                continue
+
+            start = time.perf_counter()
+            current, inputs = fingerprint(stage, digests)
+            forced = force is True or stage.name in force
+
+            if not forced and upToDate(stage, loadState(stage), current, digests):
+                summary.append({ "stage": stage.name, "status": "skipped", "seconds": time.perf_counter() - start })
+                continue
+
+            try:
+                stage.run()
+            except Exception:
+                summary.append({ "stage": stage.name, "status": "failed", "seconds": time.perf_counter() - start })
+                raise
+
+            seconds = time.perf_counter() - start
+            state = {
+                "fingerprint": current,
+                "inputs": inputs,
+                "outputs": { path: digests.digest(path) for path in stage.outputs },
+                "seconds": seconds,
+                "finishedAt": time.time(),
+            }
+
+            os.makedirs(stateDir, exist_ok=True)
+            with open(statePath(stage), "w") as outfile:
+                ujson.dump(state, outfile, indent=2)
+
+            summary.append({ "stage": stage.name, "status": "forced" if forced else "ran", "seconds": seconds })
+    finally:
+        digests.save()
+        printSummary(summary)
+
+    return summary
+
+def printSummary(summary):
+    if len(summary) == 0:
+        return
+
+    width = max(len(row["stage"]) for row in summary)
+    print("%-*s  %-8s  %9s" % (width, "stage", "status", "seconds"))
+    for row in summary:
+        print("%-*s  %-8s  %9.2f" % (width, row["stage"], row["status"], row["seconds"]))
+    print("%-*s  %-8s  %9.2f" % (width, "total", "", sum(row["seconds"] for row in summary)))
+
+def main():
+    allStages = stages()
+    names = [stage.name for stage in allStages]
+
+    parser = argparse.ArgumentParser(description="runs the processing stages whose inputs changed")
+    parser.add_argument("--only", nargs="+", choices=names, help="run only these stages")
+    parser.add_argument("--force", nargs="*", choices=names, help="rerun these stages (all selected stages if none given) even if up to date")
+    parser.add_argument("--list", action="store_true", help="show whether each stage is up to date and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        digests = FileDigests(os.path.join(stateDir, "files.json"))
+        for stage in allStages:
+            current, _ = fingerprint(stage, digests)
+            print("%-12s %s" % (stage.name, "up to date" if upToDate(stage, loadState(stage), current, digests) else "stale"))
+        digests.save()
+        return
+
+    force = () if args.force is None else (args.force or True)
+    runStages(allStages, args.only, force)
+
+if __name__ == '__main__':
+    main()
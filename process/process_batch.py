@@ -0,0 +1,160 @@
+import argparse
+import numpy as np
+import ujson
+from fetch import fetchJson, fetchScenarios, apiRoot
+from weights import operatorMeans
+from elevation import openSampler
+from geoarea import demandUnitAreas
+import process_hex
+
+# Batch version of the UnmetDemand / Difference layer of process_hex.py for one
+# baseline and many scenarios. Everything that depends only on the geometry
+# (demand unit areas, rasterization, hex operators) is computed once; each
+# scenario then only adds its slice of one stacked
+#
+#   (scenarios x demand units x timesteps)
+#
+# array, normalized by area in one broadcast, and one sparse product per
+# resolution for all scenarios sharing the same set of demand units.
+#
+#   python process_batch.py CS3_BL bl_h000 other_scenario ... [--stacked]
+#
+# resRange, hexMode, hierarchical and elevationSource are process_hex.py's
+# settings, read when a batch runs.
+
+# /**
+#  *
+#  * returns (demand units x timesteps) matrix of a scenario payload
+#  * { DU_ID: { timestep: value } }, NaN for demand units it lacks
+#  */
+def scenarioMatrix(temporal_object, duIds, timesteps):
+    matrix = np.full((len(duIds), len(timesteps)), np.nan)
+
+    for d, idd in enumerate(duIds):
+        if idd in temporal_object:
+            series = temporal_object[idd]
+            matrix[d] = [series[t] for t in timesteps]
+
+    return matrix
+
+# /**
+#  *
+#  * returns (scenarios x demand units x timesteps) UnmetDemand and Difference;
+#  * like diffUnmetFeatures, raises KeyError for demand units of a scenario the
+#  * baseline lacks, which would otherwise be written as NaN
+#  */
+def normalizeScenarios(scenarioObjects, baselineObject, duIds, timesteps, areas):
+    missing = [idd for idd in duIds if idd not in baselineObject and any(idd in obj for obj in scenarioObjects)]
+    if missing:
+        raise KeyError("%d demand units of the scenarios are missing from the baseline: %s" % (len(missing), ", ".join(missing[:20])))
+
+    stacked = np.stack([scenarioMatrix(obj, duIds, timesteps) for obj in scenarioObjects])
+    base = scenarioMatrix(baselineObject, duIds, timesteps)
+
+    unmet = stacked / areas[None, :, None]
+    difference = (stacked - base[None]) / areas[None, :, None]
+
+    return unmet, difference
+
+# /**
+#  *
+#  * returns { scenarioId: [ {hexId: {UnmetDemand, Difference, Elevation}}, ... ] }
+#  * with the same per-resolution layout as diff_unmet_hex_med_res_norm.json
+#  */
+def batchHexPoints(region_object, baselineObject, scenarioObjects):
+    sampler = openSampler(process_hex.elevationSource)
+
+    du_fs = [f for f in region_object["features"] if f["properties"]["DU_ID"]]
+    duIds = list(dict.fromkeys(f["properties"]["DU_ID"] for f in du_fs))
+    duIndex = { idd: d for d, idd in enumerate(duIds) }
+    featureDu = np.array([duIndex[f["properties"]["DU_ID"]] for f in du_fs], dtype=np.int64)
+
+    scenarioIds = list(scenarioObjects)
+    objects = [scenarioObjects[sid] for sid in scenarioIds]
+
+    first = next(obj[idd] for obj in objects for idd in duIds if idd in obj)
+    timesteps = list(first)
+
+    areas = demandUnitAreas(du_fs, duIds)
+    unmet, difference = normalizeScenarios(objects, baselineObject, duIds, timesteps, areas)
+
+    # scenarios covering the same demand units share one subset operator
+    groups = {}
+    for s, obj in enumerate(objects):
+        key = tuple(idd in obj for idd in duIds)
+        groups.setdefault(key, []).append(s)
+
+    operators = process_hex.geojsonToHexOperators(du_fs, process_hex.resRange, process_hex.hexMode, process_hex.hierarchical)
+    out = { sid: [] for sid in scenarioIds }
+
+    for hexIds, W in operators:
+        elevations = sampler.hexElevations(hexIds).tolist()
+        resPoints = { sid: {} for sid in scenarioIds }
+
+        for key, members in groups.items():
+            featureInds = np.flatnonzero(np.asarray(key)[featureDu])
+            Wsub = W[:, featureInds]
+            keep = np.flatnonzero(Wsub.getnnz(axis=1))
+            Wsub = Wsub[keep]
+
+            # all scenarios of the group side by side: (features x scenarios * timesteps)
+            cols = [m[members][:, featureDu[featureInds]] for m in (unmet, difference)]
+            wide = np.concatenate([c.transpose(1, 0, 2).reshape(len(featureInds), -1) for c in cols], axis=1)
+            means = operatorMeans(Wsub, wide).reshape(len(keep), 2, len(members), len(timesteps))
+
+            for i, s in enumerate(members):
+                points = resPoints[scenarioIds[s]]
+                unmetRows = means[:, 0, i].tolist()
+                diffRows = means[:, 1, i].tolist()
+
+                for k, h in enumerate(keep.tolist()):
+                    points[hexIds[h]] = {
+                        "UnmetDemand": unmetRows[k],
+                        "Difference": diffRows[k],
+                        "Elevation": elevations[h],
+                    }
+
+        for sid in scenarioIds:
+            out[sid].append(resPoints[sid])
+
+    return out
+
+# single file holding all scenarios,
+# [ {hexId: {UnmetDemand: {scenarioId: series}, Difference: {...}, Elevation}} ]
+def stackHexPoints(batch):
+    stacked = []
+
+    for r in range(len(next(iter(batch.values()), []))):
+        points = {}
+        for sid, resPoints in batch.items():
+            for hexId, obj in resPoints[r].items():
+                entry = points.setdefault(hexId, { "UnmetDemand": {}, "Difference": {}, "Elevation": obj["Elevation"] })
+                entry["UnmetDemand"][sid] = obj["UnmetDemand"]
+                entry["Difference"][sid] = obj["Difference"]
+        stacked.append(points)
+
+    return stacked
+
+def main():
+    parser = argparse.ArgumentParser(description="UnmetDemand / Difference hex layers for many scenarios against one baseline")
+    parser.add_argument("baseline")
+    parser.add_argument("scenarios", nargs="+")
+    parser.add_argument("--stacked", action="store_true", help="write one diff_unmet_hex_med_res_norm_batch.json instead of one file per scenario")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    region_object = fetchJson(apiRoot + "/shapes/demand_units")
+    fetched, _ = fetchScenarios([args.baseline] + args.scenarios, workers=args.workers)
+
+    batch = batchHexPoints(region_object, fetched[args.baseline], { sid: fetched[sid] for sid in args.scenarios })
+
+    if args.stacked:
+        with open("diff_unmet_hex_med_res_norm_batch.json", "w") as outfile:
+            ujson.dump(stackHexPoints(batch), outfile)
+    else:
+        for sid, hex_object in batch.items():
+            with open("diff_unmet_hex_med_res_norm_%s.json" % sid, "w") as outfile:
+                ujson.dump(hex_object, outfile)
+
+if __name__ == '__main__':
+    main()
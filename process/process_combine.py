@@ -1,30 +1,192 @@
-import urllib.request, ujson, shapely, h3
-from functools import reduce
-import math
-from PIL import Image
-
-# Opening JSON file
-with open("groundwater_hex_med_res_norm.json") as water_file, \
-    open("diff_unmet_hex_med_res_norm.json") as difference_scenario_file, \
-    open("landuse_hex_med_res_norm.json") as landuse_file:
- 
-    # Reading from json file
-    water_object = ujson.load(water_file)
-    difference_scenario_object = ujson.load(difference_scenario_file)
-    landuse_object = ujson.load(landuse_file)
-
-    for i, water_res in enumerate(water_object):
-        if i < len(difference_scenario_object):
-            diff_scen_res = difference_scenario_object[i]
-            landuse_res = landuse_object[i]
-
-            for hexId in water_res:
-                if hexId in diff_scen_res:
-                    water_res[hexId]["UnmetDemand"] = diff_scen_res[hexId]["UnmetDemand"]
-                    water_res[hexId]["Difference"] = diff_scen_res[hexId]["Difference"]
-                if hexId in landuse_res:
-                    water_res[hexId]["LandUse"] = landuse_res[hexId]["LandUse"]
-    
-    
-    with open("combine_hex_med_res_norm.json", "w") as outfile:
-        ujson.dump(water_object, outfile)
\ No newline at end of file
+import argparse
+import contextlib
+import os
+import ujson
+import instrument
+from jsonstream import iterJson
+from binary_export import hexItems, resolutionOf, presentLayers, newManifest, newIndex, writeBinaryResolution, writeChunkResolution, writeManifest
+from layerstats import newLayerStats, addResolutionStats, finishLayerStats
+import pyramid
+
+# Merges per-resolution hex layers (the [ {hexId: obj}, ... ] files written by
+# process_hex.py) by hex id. The files are read in lockstep, one resolution at a
+# time, so only one resolution of the base layer and of one other layer are in
+# memory at once, and every output is written as soon as a resolution is merged.
+
+# layers to merge: (file, properties copied from it, None for all of them). The
+# first layer is the base: its hexes are the ones written, hexes only found in
+# the other layers are counted as "extra" in the stats and dropped
+layers = [
+    ("groundwater_hex_med_res_norm.json", None),
+    ("diff_unmet_hex_med_res_norm.json", ["UnmetDemand", "Difference"]),
+    ("landuse_hex_med_res_norm.json", ["LandUse", "LandUseFractions", "LandUseDominant"]),
+]
+
+outputName = "combine_hex_med_res_norm"
+
+# "json" writes combine_hex_med_res_norm.json, "binary" writes the manifest and
+# per-layer buffers of binary_export.py to combine_hex_med_res_norm/, "chunks"
+# writes time-chunked buffers to combine_hex_med_res_norm_chunks/. Only "json"
+# by default, the others are opted into (e.g. --formats json binary chunks)
+formatNames = ["json", "binary", "chunks"]
+outputFormats = ["json"]
+
+# timesteps per chunk for the "chunks" format
+chunkSize = 120
+
+# "float32" or "float16" buffers for the binary format
+binaryDtype = "float32"
+
+# temporal levels of detail of the series layers written with the binary and
+# chunked formats, [(name, months per step), ...], see pyramid.py; [] for none
+temporalLevels = pyramid.levels
+
+# base hexes missing from a layer listed per resolution in the stats file
+missingSample = 20
+
+# percentiles of every numeric layer in <outputName>_layer_stats.json (and in the
+# binary manifest / chunk index), see layerstats.py
+statsPercentiles = [1, 5, 25, 50, 75, 95, 99]
+
+def iterResolutions(infile):
+    for resObject in iterJson(infile):
+        yield dict(hexItems(resObject))
+
+# /**
+#  *
+#  * copies props of layerRes into the base hexes of merged, returns the stats
+#  * { matched, missing, extra, missingSample }
+#  */
+def joinResolution(merged, layerRes, props):
+    stats = { "matched": 0, "missing": 0, "extra": 0, "missingSample": [] }
+
+    for hexId, obj in merged.items():
+        src = layerRes.get(hexId)
+
+        if src is None:
+            stats["missing"] += 1
+            if len(stats["missingSample"]) < missingSample:
+                stats["missingSample"].append(hexId)
+            continue
+
+        stats["matched"] += 1
+        for prop in (src if props is None else props):
+            if prop in src:
+                obj[prop] = src[prop]
+
+    stats["extra"] = len(layerRes) - stats["matched"]
+
+    return stats
+
+# /**
+#  *
+#  * yields (merged resolution, stats) in resolution order
+#  *
+#  * layerSpecs: [(file, props), ...], the first one is the base layer
+#  */
+def joinLayers(layerSpecs):
+    with contextlib.ExitStack() as stack:
+        streams = [iterResolutions(stack.enter_context(open(path, "rb"))) for path, _ in layerSpecs]
+
+        for merged in streams[0]:
+            stats = { "resolution": resolutionOf(merged), "hexes": len(merged), "layers": {} }
+
+            for (path, props), stream in zip(layerSpecs[1:], streams[1:]):
+                layerRes = next(stream, None)
+
+                if layerRes is None:
+                    # the layer has fewer resolutions than the base
+                    stats["layers"][path] = { "matched": 0, "missing": len(merged), "extra": 0, "missingSample": list(merged)[:missingSample] }
+                    continue
+
+                stats["layers"][path] = joinResolution(merged, layerRes, props)
+                del layerRes
+
+            yield merged, stats
+
+# /**
+#  *
+#  * joins layerSpecs and writes each resolution to every output format as soon
+#  * as it is merged, returns the per-resolution stats (also written next to
+#  * the outputs as <outputName>_stats.json)
+#  *
+#  * the layer statistics (value extents, percentiles, per-timestep extents) are
+#  * written as <outputName>_layer_stats.json and embedded in the manifest and
+#  * index as "stats"
+#  */
+def combineLayers(layerSpecs, outputName=outputName, outputFormats=outputFormats, chunkSize=chunkSize, dtype=binaryDtype, percentiles=statsPercentiles,
+                  levels=temporalLevels):
+    with instrument.run(outputName + ".json"):
+        binaryDir, chunksDir = outputName, outputName + "_chunks"
+        manifest, index = newManifest(), newIndex(chunkSize)
+        layerStats = newLayerStats(percentiles)
+        outLayers = None
+        allStats = []
+
+        with contextlib.ExitStack() as stack:
+            outfile = stack.enter_context(open(outputName + ".json", "w")) if "json" in outputFormats else None
+
+            for i, (merged, stats) in enumerate(joinLayers(layerSpecs)):
+                if outfile is not None:
+                    with instrument.span("json"):
+                        outfile.write("[" if i == 0 else ",")
+                        ujson.dump(merged, outfile)
+
+                if outLayers is None:
+                    # taken from the first resolution, later ones are written with the same buffers
+                    outLayers = presentLayers([merged])
+
+                if "binary" in outputFormats:
+                    os.makedirs(binaryDir, exist_ok=True)
+                    with instrument.span("binary"):
+                        writeBinaryResolution(merged, binaryDir, outLayers, manifest, dtype, levels)
+
+                if "chunks" in outputFormats:
+                    os.makedirs(chunksDir, exist_ok=True)
+                    with instrument.span("chunks"):
+                        writeChunkResolution(merged, chunksDir, chunkSize, outLayers, index, dtype, levels)
+
+                with instrument.span("layerStats"):
+                    addResolutionStats(layerStats, merged, outLayers)
+
+                instrument.setCounter("hexes", [s["hexes"] for s in allStats + [stats]])
+                allStats.append(stats)
+                del merged
+
+            if outfile is not None:
+                outfile.write("[]" if len(allStats) == 0 else "]")
+
+        finishLayerStats(layerStats)
+
+        with open(outputName + "_layer_stats.json", "w") as statsfile:
+            ujson.dump(layerStats, statsfile)
+
+        if "binary" in outputFormats:
+            os.makedirs(binaryDir, exist_ok=True)
+            manifest["stats"] = layerStats
+            writeManifest(manifest, binaryDir)
+
+        if "chunks" in outputFormats:
+            os.makedirs(chunksDir, exist_ok=True)
+            index["stats"] = layerStats
+            writeManifest(index, chunksDir, "index.json")
+
+        with open(outputName + "_stats.json", "w") as statsfile:
+            ujson.dump(allStats, statsfile, indent=2)
+
+        return allStats
+
+def main():
+    parser = argparse.ArgumentParser(description="merges the hex layers into " + outputName)
+    parser.add_argument("--formats", nargs="+", choices=formatNames, default=outputFormats, help="outputs to write (default: %(default)s)")
+    args = parser.parse_args()
+
+    allStats = combineLayers(layers, outputFormats=args.formats)
+
+    for stats in allStats:
+        for path, layerStats in stats["layers"].items():
+            if layerStats["missing"] or layerStats["extra"]:
+                print("resolution %s, %s: %d of %d hexes missing, %d extra" % (stats["resolution"], path, layerStats["missing"], stats["hexes"], layerStats["extra"]))
+
+if __name__ == '__main__':
+    main()
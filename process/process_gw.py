@@ -1,17 +1,9 @@
-import urllib.request, ujson, shapely, h3
+import ujson, shapely, h3
 from functools import reduce
-import math
-from PIL import Image
-
-def latlngToMerc(lat, lon):
-    z = 5
-
-    latRad = lat * 3.141593 / 180
-    n = pow(2, z)
-    xTile = n * ((lon + 180) / 360)
-    yTile = n * (1-(math.log(math.tan(latRad) + 1 / math.cos(latRad)) / 3.141593)) / 2
-
-    return xTile - math.floor(xTile), yTile - math.floor(yTile)
+from raster import geojsonToGridPointsVectorized
+from elevation import openSampler
+from groundwater import readGroundwater, referenceSeries
+import instrument
 
 # function avg(arr) {
 #   return arr.reduce((a, b) => a + b) / arr.length
@@ -74,7 +66,7 @@ def avgObject(arrObjs):
     # return avgObj
 
     return {
-        "Groundwater": avgArrOfArr([ [obj["Groundwater"][k] for k in obj["Groundwater"]] for obj in arrObjs]),
+        "Groundwater": avgArrOfArr([ referenceSeries(obj["Groundwater"]) for obj in arrObjs]),
     }
 
 # function flatten(arr) {  
@@ -128,6 +120,12 @@ def geoContains(poly, coord):
     # print([(polycoord[0], polycoord[1]) for polycoord in poly])
     return poly.contains(point)
 
+# lattice points per degree used when sampling polygons
+scale = 10
+
+# resolutions written to Groundwater_small_elev.json
+resRange = [5, 5]
+
 def polygonToPoints(dataFeature):
     points = []
 
@@ -144,7 +142,6 @@ def polygonToPoints(dataFeature):
     # print(minLat)
     # print(maxLat)
 
-    scale = 10
     stepSize = 1 / scale
 
     poly = shapely.geometry.polygon.Polygon([(polycoord[0], polycoord[1]) for polycoord in flattenedCoords])
@@ -230,22 +227,17 @@ def gridPointsToHexPoints(dataFeatures, gridPoints, averageFn, resRange):
 
     minRes, maxRes = resRange
 
-    im = Image.open('elev.png', 'r').convert("RGB")
-    imwidth, imheight = im.size
-    pixel_values = list(im.getdata())
+    sampler = openSampler('elev.png', "red")
+
+    # each grid point's elevation is looked up once and reused at every resolution
+    elevs = sampler.sample([point[1] for point in gridPoints], [point[0] for point in gridPoints]).tolist()
 
     for res in range(minRes, maxRes + 1):
         binnedPoints = {}
         binnedHeights = {}
 
-        for point in gridPoints:
+        for point, elev in zip(gridPoints, elevs):
             lat, lon = point[1], point[0]
-            x, y = latlngToMerc(lat, lon)
-
-            x = math.floor(x * imwidth)
-            y = math.floor(y * imheight)
-
-            elev = pixel_values[imwidth * y + x][0]
 
             hexId = h3.latlng_to_cell(lat, lon, res)
 
@@ -286,37 +278,40 @@ def gridPointsToHexPoints(dataFeatures, gridPoints, averageFn, resRange):
 # }
 
 def geojsonToHexPoints(dataFeatures, avgFn, resRange):
-    gridPoints = geojsonToGridPoints(dataFeatures)
+    gridPoints = geojsonToGridPointsVectorized(dataFeatures, scale)
     hexPoints = gridPointsToHexPoints(dataFeatures, gridPoints, avgFn, resRange)
 
     return hexPoints
  
-# Opening JSON file
-with open("../Baseline_Groundwater.json") as region_file:
- 
-    # Reading from json file
-    region_object = ujson.load(region_file)
-    # temporal_object = ujson.load(temporal_file)
+def main():
+    with instrument.run("Groundwater_small_elev.json"):
+        # Streamed one feature at a time, Groundwater series go straight into a matrix (see groundwater.py)
+        with instrument.span("readGroundwater"):
+            region_object = { "features": readGroundwater() }
+        # temporal_object = ujson.load(temporal_file)
+
+        # for b in temporal_object:
+        #     cop = {}
+        #     i = 1
+        #     for num in temporal_object[b]:
+        #         cop[str(i)] = str(num)
+        #         i += 1
+        # new_fs = [f for f in region_object["features"] if f["properties"]["DU_ID"] and f["properties"]["DU_ID"] in temporal_object]
 
-    # for b in temporal_object:
-    #     cop = {}
-    #     i = 1
-    #     for num in temporal_object[b]:
-    #         cop[str(i)] = str(num)
-    #         i += 1
-    # new_fs = [f for f in region_object["features"] if f["properties"]["DU_ID"] and f["properties"]["DU_ID"] in temporal_object]
+        # for f in new_fs:
+        #     idd = f["properties"]["DU_ID"]
+        #     f["properties"]["UnmetDemand"] = temporal_object[idd]
 
-    # for f in new_fs:
-    #     idd = f["properties"]["DU_ID"]
-    #     f["properties"]["UnmetDemand"] = temporal_object[idd]
+        # region_object["features"] = new_fs
 
-    # region_object["features"] = new_fs
 
-        
-    with open("Groundwater_small_elev.json", "w") as outfile:
+        with open("Groundwater_small_elev.json", "w") as outfile:
 
-        hex_object = geojsonToHexPoints(region_object["features"], avgObject, [5, 5])
+            with instrument.span("geojsonToHexPoints"):
+                hex_object = geojsonToHexPoints(region_object["features"], avgObject, resRange)
 
-        ujson.dump(hex_object, outfile)
+            with instrument.span("dump"):
+                ujson.dump(hex_object, outfile)
 
-    
\ No newline at end of file
+if __name__ == '__main__':
+    main()
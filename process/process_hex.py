@@ -1,27 +1,29 @@
-import urllib.request, ujson, shapely, h3
+import ujson, shapely, h3
 from functools import reduce
-import math
-import area
-from PIL import Image
+import numpy as np
+from raster import geojsonToGridPointsVectorized, geojsonToGridArrays
+from coverage import geojsonToHexCoverage
+from rollup import hierarchicalHexSums, finalizeSums
+from columnar import seriesValues, featureMatrix, binLattice, binnedToArrays, groupedSums, rollupSums
+from categorical import latticeCellAreas, categoryCounts, categoryFirstSeen, categoryValues, rollupCounts
+from fetch import fetchJson, apiRoot
+from groundwater import FeatureList, readGroundwater, referenceSeries
+from geoarea import demandUnitAreas
+from elevation import openSampler
+from parallel import geojsonToGridArraysParallel, geojsonToGridPointsParallel, binLatticeParallel
+import instrument
+from weights import operatorDir, hexOperators, rollupOperator, subsetOperator, operatorMeans, operatorCategories, operatorFirstSeen
 import string
 
-def latlngToMerc(lat, lon):
-    z = 5
-
-    latRad = lat * 3.141593 / 180
-    n = pow(2, z)
-    xTile = n * ((lon + 180) / 360)
-    yTile = n * (1-(math.log(math.tan(latRad) + 1 / math.cos(latRad)) / 3.141593)) / 2
-
-    return xTile - math.floor(xTile), yTile - math.floor(yTile)
-
 # function avg(arr) {
 #   return arr.reduce((a, b) => a + b) / arr.length
 # }
 
-def avg(arr): 
+def avg(arr, weights=None): 
     if len(arr) == 0:
         return 0
+    if weights is not None:
+        return reduce(lambda a, b: a + b, [a * w for a, w in zip(arr, weights)]) / reduce(lambda a, b: a + b, weights)
     return reduce(lambda a, b: a + b, arr) / len(arr) 
 
 
@@ -35,7 +37,7 @@ def avg(arr):
 #     return avgArr
 # }
 
-def avgArrOfArr(arr):
+def avgArrOfArr(arr, weights=None):
     
     avgArr = []
 
@@ -43,16 +45,16 @@ def avgArrOfArr(arr):
         for j in range(0, len(arr[0])):
             if j != 1201:
                 # print(j)
-                avgArr.append(avg([float(a[j]) for a in arr]))
+                avgArr.append(avg([float(a[j]) for a in arr], weights))
 
     return avgArr
 
-def maxCounter(arr):
+def maxCounter(arr, weights=None):
     keeptrack = {}
-    for a in arr:
+    for i, a in enumerate(arr):
         if a not in keeptrack:
             keeptrack[a] = 0
-        keeptrack[a] += 1
+        keeptrack[a] += 1 if weights is None else weights[i]
     
     sorteds = [k for k, _ in sorted(keeptrack.items(), key=lambda item: item[1], reverse=True)]
     return sorteds
@@ -73,20 +75,79 @@ def maxCounter(arr):
 
 #   return avgObj
 # }
-def avgGroundwater(arrObjs):
+def avgGroundwater(arrObjs, weights=None):
+    return {
+        "Groundwater": avgArrOfArr([ referenceSeries(obj["Groundwater"]) for obj in arrObjs], weights),
+    }
+def avgDiffUnmet(arrObjs, weights=None):
+    return {
+        "UnmetDemand": avgArrOfArr([ obj["UnmetDemand"] for obj in arrObjs], weights),
+        "Difference": avgArrOfArr([ obj["Difference"] for obj in arrObjs], weights),
+    }
+def aggLandUse(arrObjs, weights=None):
+    return {
+        "LandUse": maxCounter([ obj["LandUse"] for obj in arrObjs], weights),
+    }
+
+# summing counterparts of the functions above, used when coarser resolutions are
+# rolled up from the finest one (see rollup.py); finalizeSums turns their output
+# back into what the averaging function would have returned
+
+def sumArrOfArr(arr, weights=None):
+
+    sumArr = []
+
+    if len(arr) != 0:
+        for j in range(0, len(arr[0])):
+            if j != 1201:
+                col = [float(a[j]) for a in arr]
+                if weights is not None:
+                    col = [c * w for c, w in zip(col, weights)]
+                sumArr.append(reduce(lambda a, b: a + b, col))
+
+    return sumArr
+
+def weightedCounts(arr, weights=None):
+    keeptrack = {}
+    for i, a in enumerate(arr):
+        if a not in keeptrack:
+            keeptrack[a] = 0
+        keeptrack[a] += 1 if weights is None else weights[i]
+
+    return keeptrack
+
+def sumGroundwater(arrObjs, weights=None):
     return {
-        "Groundwater": avgArrOfArr([ [obj["Groundwater"][k] for k in obj["Groundwater"]] for obj in arrObjs]),
+        "Groundwater": sumArrOfArr([ referenceSeries(obj["Groundwater"]) for obj in arrObjs], weights),
     }
-def avgDiffUnmet(arrObjs):
+def sumDiffUnmet(arrObjs, weights=None):
     return {
-        "UnmetDemand": avgArrOfArr([ obj["UnmetDemand"] for obj in arrObjs]),
-        "Difference": avgArrOfArr([ obj["Difference"] for obj in arrObjs]),
+        "UnmetDemand": sumArrOfArr([ obj["UnmetDemand"] for obj in arrObjs], weights),
+        "Difference": sumArrOfArr([ obj["Difference"] for obj in arrObjs], weights),
     }
-def aggLandUse(arrObjs):
+def countLandUse(arrObjs, weights=None):
     return {
-        "LandUse": maxCounter([ obj["LandUse"] for obj in arrObjs]),
+        "LandUse": weightedCounts([ obj["LandUse"] for obj in arrObjs], weights),
     }
 
+sumFns = {
+    avgGroundwater: sumGroundwater,
+    avgDiffUnmet: sumDiffUnmet,
+    aggLandUse: countLandUse,
+}
+
+# series properties averaged by each function, for the columnar engine
+seriesProps = {
+    avgGroundwater: ["Groundwater"],
+    avgDiffUnmet: ["UnmetDemand", "Difference"],
+}
+
+# categorical property ranked by each function, for the columnar and operator
+# engines (see categorical.py)
+categoricalProps = {
+    aggLandUse: "LandUse",
+}
+
 # function flatten(arr) {  
 #   return [].concat.apply([], arr)
 # }
@@ -138,6 +199,51 @@ def geoContains(poly, coord):
     # print([(polycoord[0], polycoord[1]) for polycoord in poly])
     return poly.contains(point)
 
+# lattice points per degree used when sampling polygons
+scale = 50
+
+# how polygons are turned into hexes, see geojsonToHexPoints; of the coverage
+# modes prefer "coverage-weighted", "coverage" weighs every feature equally
+hexMode = "lattice"
+
+# APPROXIMATE: roll coarser resolutions up from the finest one instead of
+# re-binning per level. H3 children are not nested in their parents (see
+# rollup.py), so the coarser levels gain / lose hexes along hex edges against
+# per-level binning; only the finest resolution is exact. Runs with it record
+# the rolled up resolutions as "approximateResolutions" in their report
+hierarchical = False
+
+# "reference", "columnar" or "operator", see geojsonToHexPoints
+engine = "operator"
+
+# processes used to rasterize features and bin lattice points, 1 runs serially
+# (see parallel.py, results are identical either way)
+workers = 1
+
+# resolutions written to the *_hex_med_res_norm.json layers
+resRange = [5, 6]
+
+# where engine "operator" caches its operators (see weights.py)
+operatorCache = operatorDir
+
+# LandUse categories idToVal returns, the width of LandUseFractions
+landUseCategories = 4
+
+# what LandUseFractions are shares of in the columnar engine: "count" of lattice
+# points, or "area" they stand for (lattice cells shrink with latitude); the
+# coverage-weighted hexMode is already area based
+categoryWeighting = "count"
+
+# decimals LandUseFractions are rounded to, None for full precision
+fractionDigits = 4
+
+# scenario whose unmet demand is shown, and the scenario Difference is taken against
+scenario = "bl_h000"
+baseline = "CS3_BL"
+
+# terrain-RGB image, or a directory of z/x/y terrain tiles (see elevation.py)
+elevationSource = 'elevcorr.png'
+
 def polygonToPoints(dataFeature):
     points = []
 
@@ -157,15 +263,19 @@ def polygonToPoints(dataFeature):
     # print(minLat)
     # print(maxLat)
 
-    scale = 50
     stepSize = 1 / scale
 
     poly = shapely.geometry.polygon.Polygon([(polycoord[0], polycoord[1]) for polycoord in flattenedCoords])
-    for lat in range(int(scale * minLat), int(scale * (maxLat + 1)), int(scale * stepSize)):
-        for lon in range(int(scale * minLon), int(scale * (maxLon + 1)), int(scale * stepSize)):
+    latRange = range(int(scale * minLat), int(scale * (maxLat + 1)), int(scale * stepSize))
+    lonRange = range(int(scale * minLon), int(scale * (maxLon + 1)), int(scale * stepSize))
+    for lat in latRange:
+        for lon in lonRange:
             if geoContains(poly, [lon / scale, lat / scale]):
                 points.append([lon / scale, lat / scale])
 
+    instrument.count("latticePointsTested", len(latRange) * len(lonRange))
+    instrument.count("pointsKept", len(points))
+
     return points
 
 # /**
@@ -238,49 +348,98 @@ def geojsonToGridPoints(dataFeatures):
 #   return resPoints
 # }
 
-def gridPointsToHexPoints(dataFeatures, gridPoints, averageFn, resRange):
+def binGridPoints(gridPoints, res):
+    binnedPoints = {}
+
+    for point in gridPoints:
+        lat, lon = point[1], point[0]
+
+        hexId = h3.latlng_to_cell(lat, lon, res)
+
+        if hexId in binnedPoints:
+            binnedPoints[hexId].append(point[2])
+        else:
+            binnedPoints[hexId] = [ point[2] ]
+
+    return binnedPoints
+
+# coverage: optional output of geojsonToHexCoverage; when given, the binned
+# feature indices (and weights) are taken from it instead of from gridPoints
+def gridPointsToHexPoints(dataFeatures, gridPoints, averageFn, resRange, coverage=None):
     resPoints = []
 
     minRes, maxRes = resRange
 
-    im = Image.open('elevcorr.png', 'r')
-    imwidth, imheight = im.size
-    pixel_values = list(im.getdata())
-    
+    sampler = openSampler(elevationSource)
+
     for res in range(minRes, maxRes + 1):
         binnedPoints = {}
+        binnedWeights = None
 
-        for point in gridPoints:
-            lat, lon = point[1], point[0]
+        if coverage is not None:
+            binnedPoints, binnedWeights = coverage[res - minRes]
 
-            hexId = h3.latlng_to_cell(lat, lon, res)
+        with instrument.span("latlng_to_cell"):
+            for point in gridPoints:
+                lat, lon = point[1], point[0]
 
-            if hexId in binnedPoints:
-                binnedPoints[hexId].append(point[2])
-            else:
-                binnedPoints[hexId] = [ point[2] ]
+                hexId = h3.latlng_to_cell(lat, lon, res)
+
+                if hexId in binnedPoints:
+                    binnedPoints[hexId].append(point[2])
+                else:
+                    binnedPoints[hexId] = [ point[2] ]
 
         points = {}
 
         idd = 0
 
-        for hexId in binnedPoints:
-            lat, lon = h3.cell_to_latlng(hexId)
-            x, y = latlngToMerc(lat, lon)
+        with instrument.span("elevation"):
+            elevations = sampler.hexElevations(list(binnedPoints)).tolist()
 
-            x = math.floor(x * imwidth)
-            y = math.floor(y * imheight)
+        with instrument.span("average"):
+            for hexId, elev in zip(binnedPoints, elevations):
+                props = [dataFeatures[ind]["properties"] for ind in binnedPoints[hexId]]
+
+                if binnedWeights is None:
+                    avgObj = averageFn(props)
+                else:
+                    avgObj = averageFn(props, binnedWeights[hexId])
+
+                avgObj["Elevation"] = elev
+                
+                points[hexId] = avgObj
+
+                idd += 1
+
+        resPoints.append(points)
+
+    return resPoints
+
+# same output as gridPointsToHexPoints, but features are only binned and summed at
+# the finest resolution; coarser resolutions merge children into their parents
+def gridPointsToHexPointsHierarchical(dataFeatures, gridPoints, sumFn, resRange, coverage=None):
+    minRes, maxRes = resRange
 
-            (r, g, b, _) = pixel_values[imwidth * y + x]
-            elev = ((r * 256 + g * 1 + b * 1 / 256) - 32768)
-            
-            avgObj = averageFn([dataFeatures[ind]["properties"] for ind in binnedPoints[hexId]])
+    sampler = openSampler(elevationSource)
 
+    if coverage is not None:
+        binnedPoints, binnedWeights = coverage[-1]
+    else:
+        binnedPoints, binnedWeights = binGridPoints(gridPoints, maxRes), None
+
+    resPoints = []
+
+    for hexSums in hierarchicalHexSums(dataFeatures, binnedPoints, sumFn, resRange, binnedWeights):
+        points = {}
+
+        elevations = sampler.hexElevations(list(hexSums)).tolist()
+
+        for (hexId, (sumObj, count)), elev in zip(hexSums.items(), elevations):
+            avgObj = finalizeSums(sumObj, count)
             avgObj["Elevation"] = elev
-            
-            points[hexId] = avgObj
 
-            idd += 1
+            points[hexId] = avgObj
 
         resPoints.append(points)
 
@@ -320,96 +479,329 @@ def idToVal(idStr):
 #   return hexPoints
 # }
 
-def geojsonToHexPoints(dataFeatures, avgFn, resRange):
-    gridPoints = geojsonToGridPoints(dataFeatures)
-    hexPoints = gridPointsToHexPoints(dataFeatures, gridPoints, avgFn, resRange)
+# same output as gridPointsToHexPoints for the series layers (seriesProps), but each
+# property is loaded once into a (features x timesteps) matrix and every resolution
+# is a grouped sum divided by counts
+#
+# gridArrays: (lons, lats, inds) from geojsonToGridArrays
+def gridPointsToHexPointsColumnar(dataFeatures, gridArrays, props, resRange, coverage=None, hierarchical=False, dtype=np.float64):
+    minRes, maxRes = resRange
 
-    return hexPoints
- 
-# Opening JSON file
-with urllib.request.urlopen("http://infovis.cs.ucdavis.edu/geospatial/api/shapes/demand_units") as region_file, \
-    urllib.request.urlopen("http://infovis.cs.ucdavis.edu/geospatial/api/data/scenario/bl_h000/unmetdemand") as temporal_file, \
-    urllib.request.urlopen("http://infovis.cs.ucdavis.edu/geospatial/api/data/scenario/CS3_BL/unmetdemand") as temporal_file_bl:
- 
-    # Reading from json file
-    region_object = ujson.load(region_file)
-    temporal_object = ujson.load(temporal_file)
-    temporal_bl_object = ujson.load(temporal_file_bl)
+    sampler = openSampler(elevationSource)
 
-    new_fs = [f for f in region_object["features"] if f["properties"]["DU_ID"] and f["properties"]["DU_ID"] in temporal_object]
-    
-    tot_areas = {}
-    
-    for f in new_fs:
-        idd = f["properties"]["DU_ID"]
+    matrices = [featureMatrix(dataFeatures, prop, dtype) for prop in props]
 
-        if idd not in tot_areas:
-            tot_areas[idd] = 0
+    binned = binResolutions(gridArrays, resRange, coverage, hierarchical)
 
-        tot_areas[idd] += area.area(f["geometry"]) / 6e8
+    def aggregate(res):
+        hexIds, groups, inds, weights = hexGroups(gridArrays, resRange, res, coverage, binned)
 
+        # counts are the same for every property
+        sums = [groupedSums(matrix, groups, inds, len(hexIds), weights) for matrix in matrices]
+        return hexIds, [s for s, _ in sums], sums[0][1]
 
-    for f in new_fs:
-        idd = f["properties"]["DU_ID"]
-        rea = tot_areas[idd]
-        f["properties"]["UnmetDemand"] = [(temporal_object[idd][i]) / rea for i in temporal_object[idd]]
-        f["properties"]["Difference"] = [(temporal_object[idd][i] - temporal_bl_object[idd][i]) / rea for i in temporal_object[idd]]
+    if hierarchical:
+        resSums = [aggregate(maxRes)]
+        for res in range(maxRes - 1, minRes - 1, -1):
+            childIds, childSums, childCounts = resSums[0]
+            rolled = [rollupSums(childIds, sums, childCounts, res) for sums in childSums]
+            resSums.insert(0, (rolled[0][0], [r[1] for r in rolled], rolled[0][2]))
+    else:
+        resSums = [aggregate(res) for res in range(minRes, maxRes + 1)]
+
+    resPoints = []
+
+    for hexIds, propSums, counts in resSums:
+        means = [(sums / counts[:, None]).tolist() for sums in propSums]
+        elevations = sampler.hexElevations(hexIds).tolist()
+        points = {}
+
+        for code, hexId in enumerate(hexIds):
+            avgObj = { prop: means[p][code] for p, prop in enumerate(props) }
+            avgObj["Elevation"] = elevations[code]
+
+            points[hexId] = avgObj
+
+        resPoints.append(points)
+
+    return resPoints
+
+# lattice points binned ahead on the process pool, { res: (hexIds, groups) }
+def binResolutions(gridArrays, resRange, coverage, hierarchical):
+    minRes, maxRes = resRange
+
+    if coverage is not None or workers <= 1:
+        return {}
+
+    resolutions = [maxRes] if hierarchical else list(range(minRes, maxRes + 1))
+    return dict(zip(resolutions, binLatticeParallel(gridArrays[0], gridArrays[1], resolutions, workers)))
+
+# /**
+#  *
+#  * returns (hexIds, groups, inds, weights) of the (point, feature) pairs at res,
+#  * weights None for plain lattice points
+#  */
+def hexGroups(gridArrays, resRange, res, coverage=None, binned=None):
+    if coverage is not None:
+        # coverage only holds maxRes when rolling up
+        return binnedToArrays(*coverage[len(coverage) - 1 - (resRange[1] - res)])
+
+    lons, lats, inds = gridArrays
+    hexIds, groups = binned[res] if binned and res in binned else binLattice(lons, lats, res)
+    return hexIds, groups, inds, None
+
+# same hexes as gridPointsToHexPoints for the categorical layers
+# (categoricalProps): every resolution is one grouped count over the features'
+# category codes, written with fractions and the dominant category (see
+# categorical.py); with hierarchical, coarser resolutions sum their children's counts
+def gridPointsToHexPointsCategorical(dataFeatures, gridArrays, prop, resRange, coverage=None, hierarchical=False, weighting="count"):
+    minRes, maxRes = resRange
+
+    sampler = openSampler(elevationSource)
+
+    codes = [feature["properties"][prop] for feature in dataFeatures]
+    nCategories = max(landUseCategories, max(codes, default=0) + 1)
+
+    binned = binResolutions(gridArrays, resRange, coverage, hierarchical)
+
+    def aggregate(res):
+        hexIds, groups, inds, weights = hexGroups(gridArrays, resRange, res, coverage, binned)
+        if weights is None and weighting == "area":
+            weights = latticeCellAreas(gridArrays[1], scale)
 
-    region_object["features"] = new_fs
+        return (hexIds, categoryCounts(codes, groups, inds, len(hexIds), nCategories, weights),
+                categoryFirstSeen(codes, groups, inds, len(hexIds), nCategories))
 
-        
-    with open("diff_unmet_hex_med_res_norm.json", "w") as outfile:
+    if hierarchical:
+        resCounts = [aggregate(maxRes)]
+        for res in range(maxRes - 1, minRes - 1, -1):
+            resCounts.insert(0, rollupCounts(*resCounts[0], res))
+    else:
+        resCounts = [aggregate(res) for res in range(minRes, maxRes + 1)]
 
-        hex_object = geojsonToHexPoints(region_object["features"], avgDiffUnmet, [5, 6])
+    resPoints = []
+
+    for hexIds, counts, firstSeen in resCounts:
+        points = {}
+
+        for hexId, avgObj, elev in zip(hexIds, categoryValues(counts, firstSeen, prop, fractionDigits), sampler.hexElevations(hexIds).tolist()):
+            avgObj["Elevation"] = elev
+            points[hexId] = avgObj
+
+        resPoints.append(points)
+
+    return resPoints
+
+# same output as gridPointsToHexPoints, computed from precomputed sparse
+# (hexes x features) operators (see weights.py), one [hexIds, W] per resolution
+def operatorsToHexPoints(dataFeatures, operators, averageFn):
+    sampler = openSampler(elevationSource)
+
+    props = seriesProps.get(averageFn, [])
+    matrices = [featureMatrix(dataFeatures, prop) for prop in props]
+
+    resPoints = []
 
-        ujson.dump(hex_object, outfile)
+    for hexIds, W in operators:
+        if averageFn in categoricalProps:
+            prop = categoricalProps[averageFn]
+            codes = [feature["properties"][prop] for feature in dataFeatures]
+            nCategories = max(landUseCategories, max(codes, default=0) + 1)
+            counts = operatorCategories(W, codes, nCategories)
+            # categories present in each hex ranked like maxCounter (ties by first
+            # appearance), with their fractions
+            values = categoryValues(counts, operatorFirstSeen(W, codes, nCategories), prop, fractionDigits)
+        else:
+            means = [operatorMeans(W, matrix).tolist() for matrix in matrices]
+            values = [{ prop: means[p][code] for p, prop in enumerate(props) } for code in range(len(hexIds))]
 
-# Opening JSON file
-with urllib.request.urlopen("http://infovis.cs.ucdavis.edu/geospatial/api/shapes/demand_units") as region_file, \
-    urllib.request.urlopen("http://infovis.cs.ucdavis.edu/geospatial/api/data/scenario/bl_h000/unmetdemand") as temporal_file, \
-    urllib.request.urlopen("http://infovis.cs.ucdavis.edu/geospatial/api/data/scenario/CS3_BL/unmetdemand") as temporal_file_bl:
+        points = {}
+
+        for hexId, avgObj, elev in zip(hexIds, values, sampler.hexElevations(hexIds).tolist()):
+            avgObj["Elevation"] = elev
+            points[hexId] = avgObj
+
+        resPoints.append(points)
+
+    return resPoints
+
+def geojsonToHexOperators(dataFeatures, resRange, mode="lattice", hierarchical=False):
+    if not hierarchical:
+        return hexOperators(dataFeatures, resRange, mode, scale, operatorCache, workers)
+
+    operators = hexOperators(dataFeatures, [resRange[1], resRange[1]], mode, scale, operatorCache, workers)
+    for res in range(resRange[1] - 1, resRange[0] - 1, -1):
+        operators.insert(0, rollupOperator(*operators[0], res))
+
+    return operators
+
+# mode: "lattice" samples each polygon on the `scale` lattice and bins the points,
+#       "coverage" takes each polygon's H3 cells directly from its geometry,
+#       every feature with weight 1 in each cell whose center it holds (a
+#       sliver over the center counts as much as a feature filling the cell),
+#       "coverage-weighted" also weights features by the fraction of each cell
+#       they cover, the recommended coverage mode
+# hierarchical: aggregate only at the finest resolution and roll coarser ones up,
+#               approximate at the coarser ones (see the hierarchical setting)
+# engine: "reference" runs avgFn per hex, "columnar" aggregates the series and
+#         categorical layers with NumPy grouped reductions, "operator" multiplies
+#         cached sparse hex x feature operators; both add LandUseFractions and
+#         LandUseDominant to the categorical layers
+# operators: optional precomputed operators for engine "operator", e.g. a subset of
+#            the operators of a larger feature collection (subsetOperator)
+def geojsonToHexPoints(dataFeatures, avgFn, resRange, mode="lattice", hierarchical=False, engine="reference", operators=None):
+    instrument.setCounter("features", len(dataFeatures))
+    if hierarchical:
+        instrument.setCounter("approximateResolutions", list(range(resRange[0], resRange[1])))
+    if avgFn in seriesProps and len(dataFeatures) != 0:
+        instrument.setCounter("seriesLength", len(seriesValues(dataFeatures[0]["properties"][seriesProps[avgFn][0]])))
+
+    if engine == "operator":
+        if operators is None:
+            with instrument.span("operators"):
+                operators = geojsonToHexOperators(dataFeatures, resRange, mode, hierarchical)
+        with instrument.span("aggregate"):
+            hexPoints = operatorsToHexPoints(dataFeatures, operators, avgFn)
+
+        instrument.setCounter("hexes", [len(points) for points in hexPoints])
+        return hexPoints
+
+    gridPoints, coverage = [], None
+
+    gridArrays = None
+    columnar = engine == "columnar" and (avgFn in seriesProps or avgFn in categoricalProps)
+
+    with instrument.span("rasterize"):
+        if mode == "lattice":
+            if columnar:
+                gridArrays = geojsonToGridArraysParallel(dataFeatures, scale, workers) if workers > 1 else geojsonToGridArrays(dataFeatures, scale)
+            else:
+                gridPoints = geojsonToGridPointsParallel(dataFeatures, scale, workers) if workers > 1 else geojsonToGridPointsVectorized(dataFeatures, scale)
+        else:
+            coverageRange = [resRange[1], resRange[1]] if hierarchical else resRange
+            coverage = geojsonToHexCoverage(dataFeatures, coverageRange, weighted=(mode == "coverage-weighted"))
+
+    with instrument.span("aggregate"):
+        if columnar and avgFn in categoricalProps:
+            hexPoints = gridPointsToHexPointsCategorical(dataFeatures, gridArrays, categoricalProps[avgFn], resRange, coverage, hierarchical, categoryWeighting)
+        elif columnar:
+            hexPoints = gridPointsToHexPointsColumnar(dataFeatures, gridArrays, seriesProps[avgFn], resRange, coverage, hierarchical)
+        elif hierarchical:
+            hexPoints = gridPointsToHexPointsHierarchical(dataFeatures, gridPoints, sumFns[avgFn], resRange, coverage)
+        else:
+            hexPoints = gridPointsToHexPoints(dataFeatures, gridPoints, avgFn, resRange, coverage)
+
+    # per resolution, from resRange[0] up
+    instrument.setCounter("hexes", [len(points) for points in hexPoints])
+    return hexPoints
  
-    # Reading from json file
-    region_object = ujson.load(region_file)
-    temporal_object = ujson.load(temporal_file)
-    temporal_bl_object = ujson.load(temporal_file_bl)
+# demand units with the scenario's UnmetDemand and its Difference from the
+# baseline, both normalized by the demand unit's total area (geoarea.py). The
+# series are normalized as one (DU_ID x timesteps) matrix, and each feature's
+# properties are rows of the returned FeatureList's matrices
+def diffUnmetFeatures(region_object, temporal_object, temporal_bl_object):
+    new_fs = [f for f in region_object["features"] if f["properties"]["DU_ID"] and f["properties"]["DU_ID"] in temporal_object]
 
-    new_fs = [f for f in region_object["features"] if f["properties"]["DU_ID"]]
-    
-    tot_areas = {}
-    
-    for f in new_fs:
-        idd = f["properties"]["DU_ID"]
+    duIds = list(dict.fromkeys(f["properties"]["DU_ID"] for f in new_fs))
+    duIndex = { idd: d for d, idd in enumerate(duIds) }
+    featureDu = np.array([duIndex[f["properties"]["DU_ID"]] for f in new_fs], dtype=np.int64)
+
+    with instrument.span("area"):
+        tot_areas = demandUnitAreas(new_fs, duIds)
+
+    with instrument.span("normalize"):
+        # each demand unit's series in the order of its own timestep keys
+        unmet = np.array([[temporal_object[idd][i] for i in temporal_object[idd]] for idd in duIds], dtype=np.float64).reshape(len(duIds), -1)
+        baseline = np.array([[temporal_bl_object[idd][i] for i in temporal_object[idd]] for idd in duIds], dtype=np.float64).reshape(len(duIds), -1)
 
-        if idd not in tot_areas:
-            tot_areas[idd] = 0
+        difference = (unmet - baseline) / tot_areas[:, None]
+        unmet /= tot_areas[:, None]
 
-        tot_areas[idd] += area.area(f["geometry"]) / 6e8
+        matrices = { "UnmetDemand": unmet[featureDu], "Difference": difference[featureDu] }
 
+        for ind, f in enumerate(new_fs):
+            f["properties"]["UnmetDemand"] = matrices["UnmetDemand"][ind]
+            f["properties"]["Difference"] = matrices["Difference"][ind]
+
+    return FeatureList(new_fs, matrices)
+
+# demand units with their LandUse category
+def landUseFeatures(region_object):
+    new_fs = [f for f in region_object["features"] if f["properties"]["DU_ID"]]
 
     for f in new_fs:
         idd = f["properties"]["DU_ID"]
         f["properties"]["LandUse"] = idToVal(idd)
 
-    region_object["features"] = new_fs
+    return new_fs
 
-        
-    with open("landuse_hex_med_res_norm.json", "w") as outfile:
+def noteApproximate(path):
+    if hierarchical and resRange[0] < resRange[1]:
+        print("%s: resolutions %d-%d rolled up from %d (hierarchical), approximate along hex edges" % (path, resRange[0], resRange[1] - 1, resRange[1]))
 
-        hex_object = geojsonToHexPoints(region_object["features"], aggLandUse, [5, 6])
+def writeDiffUnmet(path="diff_unmet_hex_med_res_norm.json"):
+    noteApproximate(path)
+    with instrument.run(path):
+        # Reading from json file (cached, see fetch.py)
+        with instrument.span("fetch"):
+            region_object = fetchJson(apiRoot + "/shapes/demand_units")
+            temporal_object = fetchJson(apiRoot + "/data/scenario/" + scenario + "/unmetdemand")
+            temporal_bl_object = fetchJson(apiRoot + "/data/scenario/" + baseline + "/unmetdemand")
 
-        ujson.dump(hex_object, outfile)
+        du_fs = [f for f in region_object["features"] if f["properties"]["DU_ID"]]
 
-# Opening JSON file
-with open("../Baseline_Groundwater.json") as region_file:
- 
-    # Reading from json file
-    region_object = ujson.load(region_file)
+        # operators over all demand units are shared with the land use layer
+        operators = None
+        if engine == "operator":
+            new_inds = [i for i, f in enumerate(du_fs) if f["properties"]["DU_ID"] in temporal_object]
+            with instrument.span("operators"):
+                operators = [subsetOperator(hexIds, W, new_inds) for hexIds, W in geojsonToHexOperators(du_fs, resRange, hexMode, hierarchical)]
+
+        region_object["features"] = diffUnmetFeatures(region_object, temporal_object, temporal_bl_object)
+
+
+        with open(path, "w") as outfile:
+
+            hex_object = geojsonToHexPoints(region_object["features"], avgDiffUnmet, resRange, hexMode, hierarchical, engine, operators)
+
+            with instrument.span("dump"):
+                ujson.dump(hex_object, outfile)
+
+def writeLandUse(path="landuse_hex_med_res_norm.json"):
+    noteApproximate(path)
+    with instrument.run(path):
+        # Reading from json file (cached, see fetch.py)
+        with instrument.span("fetch"):
+            region_object = fetchJson(apiRoot + "/shapes/demand_units")
+
+        region_object["features"] = landUseFeatures(region_object)
+
+
+        with open(path, "w") as outfile:
+
+            hex_object = geojsonToHexPoints(region_object["features"], aggLandUse, resRange, hexMode, hierarchical, engine)
+
+            with instrument.span("dump"):
+                ujson.dump(hex_object, outfile)
+
+def writeGroundwater(path="groundwater_hex_med_res_norm.json"):
+    noteApproximate(path)
+    with instrument.run(path):
+        # Streamed one feature at a time, Groundwater series go straight into a matrix (see groundwater.py)
+        with instrument.span("readGroundwater"):
+            groundwater_fs = readGroundwater()
+
+        with open(path, "w") as outfile:
+
+            hex_object = geojsonToHexPoints(groundwater_fs, avgGroundwater, resRange, hexMode, hierarchical, engine)
 
-        
-    with open("groundwater_hex_med_res_norm.json", "w") as outfile:
+            with instrument.span("dump"):
+                ujson.dump(hex_object, outfile)
 
-        hex_object = geojsonToHexPoints(region_object["features"], avgGroundwater, [5, 6])
+def main():
+    writeDiffUnmet()
+    writeLandUse()
+    writeGroundwater()
 
-        ujson.dump(hex_object, outfile)
-    
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import argparse
+from fetch import fetchJson, apiRoot
+from groundwater import readGroundwater
+from elevation import openSampler
+from partition import partitionedHexPoints
+from process_hex import diffUnmetFeatures, landUseFeatures, scenario, baseline, elevationSource, landUseCategories, fractionDigits
+
+# High resolution (county level) versions of the process_hex.py layers, built
+# out of core one parent cell at a time (see partition.py).
+#
+#   python process_highres.py diff landuse groundwater --res 8 9 [--format binary]
+
+# lattice points per degree; res 9 hexes are ~0.1 km2, so the res 5-6 lattice
+# (scale 50, ~2 km spacing) would leave most of them empty
+scale = 1000
+
+# res 3 parents hold ~120k res 9 hexes, too many 1200-step series at once
+partitionRes = 4
+
+outputNames = {
+    "diff": "diff_unmet_hex_high_res_norm",
+    "landuse": "landuse_hex_high_res_norm",
+    "groundwater": "groundwater_hex_high_res_norm",
+}
+
+def layerInput(layer):
+    if layer == "groundwater":
+        return readGroundwater(), ["Groundwater"], None
+
+    region_object = fetchJson(apiRoot + "/shapes/demand_units")
+
+    if layer == "landuse":
+        return landUseFeatures(region_object), [], "LandUse"
+
+    temporal_object = fetchJson(apiRoot + "/data/scenario/" + scenario + "/unmetdemand")
+    temporal_bl_object = fetchJson(apiRoot + "/data/scenario/" + baseline + "/unmetdemand")
+    return diffUnmetFeatures(region_object, temporal_object, temporal_bl_object), ["UnmetDemand", "Difference"], None
+
+def main():
+    parser = argparse.ArgumentParser(description="high resolution hex layers, aggregated one parent cell at a time")
+    parser.add_argument("layers", nargs="+", choices=list(outputNames))
+    parser.add_argument("--res", type=int, nargs=2, default=[8, 9], metavar=("MIN", "MAX"))
+    parser.add_argument("--scale", type=int, default=scale)
+    parser.add_argument("--partition-res", type=int, default=partitionRes)
+    parser.add_argument("--format", choices=["json", "binary"], default="json")
+    parser.add_argument("--dtype", default="float32", help="numeric type of binary output")
+    parser.add_argument("--workdir", default="partitions", help="where point spills and shards are kept while running")
+    parser.add_argument("--keep", action="store_true", help="keep the shards after stitching")
+    args = parser.parse_args()
+
+    sampler = openSampler(elevationSource)
+
+    for layer in args.layers:
+        dataFeatures, props, categoryProp = layerInput(layer)
+        outPath = outputNames[layer] + (".json" if args.format == "json" else "")
+
+        partitionedHexPoints(dataFeatures, props, args.res, outPath, args.workdir + "/" + layer, categoryProp, sampler,
+                             args.scale, args.partition_res, args.format, args.dtype, args.keep,
+                             landUseCategories, fractionDigits)
+
+if __name__ == '__main__':
+    main()
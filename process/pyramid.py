@@ -0,0 +1,77 @@
+import numpy as np
+
+# Temporal levels of detail of the monthly series, for playback when zoomed out
+# or scrubbing fast. A level groups every factor consecutive months (the series
+# start in October, so seasons and years are water-year aligned),
+#
+#   monthly    1    1200 steps
+#   seasonal   3     400
+#   annual     12    100
+#   decadal    120    10
+#
+# and keeps the mean, min and max of each group. All of them come from one
+# reshape of the (hexes x months) matrix to (hexes x groups x factor); a last,
+# shorter group is padded with NaN, and NaN (missing) months are skipped.
+
+levels = [
+    ("seasonal", 3),
+    ("annual", 12),
+    ("decadal", 120),
+]
+
+levelStats = ["mean", "min", "max"]
+
+def levelLength(timesteps, factor):
+    return -(-timesteps // factor)
+
+# /**
+#  *
+#  * returns { mean, min, max } (hexes x ceil(timesteps / factor)) of matrix
+#  * grouped by factor timesteps, NaN where a group has no values
+#  */
+def downsample(matrix, factor):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    rows, timesteps = matrix.shape
+    groups = levelLength(timesteps, factor)
+
+    padded = np.full((rows, groups * factor), np.nan)
+    padded[:, :timesteps] = matrix
+    blocks = padded.reshape(rows, groups, factor)
+
+    present = ~np.isnan(blocks)
+    counts = present.sum(axis=2)
+    sums = np.where(present, blocks, 0).sum(axis=2)
+
+    mean = np.full((rows, groups), np.nan)
+    np.divide(sums, counts, out=mean, where=counts > 0)
+
+    return {
+        "mean": mean,
+        # fmin / fmax skip NaN, a group of NaN stays NaN
+        "min": np.fmin.reduce(blocks, axis=2),
+        "max": np.fmax.reduce(blocks, axis=2),
+    }
+
+# /**
+#  *
+#  * returns { level name: downsample(matrix, factor) } for every level
+#  */
+def temporalPyramid(matrix, levels=levels):
+    return { name: downsample(matrix, factor) for name, factor in levels }
+
+# /**
+#  *
+#  * returns the coarsest of a layer's levels (the "levels" of its manifest /
+#  * index entry, monthly included) whose steps are no longer than
+#  * monthsPerFrame, so a client advancing monthsPerFrame months per frame
+#  * skips no group it shows
+#  */
+def levelForRate(layerLevels, monthsPerFrame):
+    fitting = [level for level in layerLevels if level["factor"] <= monthsPerFrame]
+    if not fitting:
+        return layerLevels[0]
+    return max(fitting, key=lambda level: level["factor"])
+
+def levelIndex(timesteps, levels=levels):
+    return [{ "name": "monthly", "factor": 1, "timesteps": timesteps }] + [
+        { "name": name, "factor": factor, "timesteps": levelLength(timesteps, factor) } for name, factor in levels]
@@ -0,0 +1,87 @@
+import h3
+
+# Hierarchical aggregation: features are binned and summed only at the finest
+# resolution, and every coarser level is built by merging each hex's children
+# into its h3.cell_to_parent. A partial aggregate is [sumObj, count] where sumObj
+# maps a property to either a list of per-timestep sums or a {category: weight}
+# dict (see sumDiffUnmet / sumGroundwater / countLandUse in process_hex.py).
+#
+# The result is APPROXIMATE: H3 children are not exactly nested inside their
+# parents, so a point near a parent's edge can roll up into a neighbour of the
+# hex latlng_to_cell would give at the coarser resolution, and the coarser hex
+# sets differ from per-level binning along hex edges (golden.py reports how much
+# as "nonNested"). Values at the finest resolution are unchanged.
+
+def copySums(sumObj):
+    return { prop: (dict(val) if isinstance(val, dict) else list(val)) for prop, val in sumObj.items() }
+
+def mergeSums(into, sumObj):
+    for prop, val in sumObj.items():
+        if prop not in into:
+            into[prop] = dict(val) if isinstance(val, dict) else list(val)
+        elif isinstance(val, dict):
+            acc = into[prop]
+            for k, w in val.items():
+                acc[k] = acc.get(k, 0) + w
+        else:
+            acc = into[prop]
+            for j, v in enumerate(val):
+                acc[j] += v
+
+    return into
+
+def finalizeSums(sumObj, count):
+    avgObj = {}
+
+    for prop, val in sumObj.items():
+        if isinstance(val, dict):
+            avgObj[prop] = [k for k, _ in sorted(val.items(), key=lambda item: item[1], reverse=True)]
+        else:
+            avgObj[prop] = [v / count for v in val]
+
+    return avgObj
+
+# /**
+#  *
+#  * returns { parentId1: [sumObj1, count1], ... } at resolution res
+#  */
+def rollupToParents(hexSums, res):
+    parents = {}
+
+    for hexId, (sumObj, count) in hexSums.items():
+        parentId = h3.cell_to_parent(hexId, res)
+
+        if parentId in parents:
+            mergeSums(parents[parentId][0], sumObj)
+            parents[parentId][1] += count
+        else:
+            parents[parentId] = [copySums(sumObj), count]
+
+    return parents
+
+# /**
+#  *
+#  * returns array of { hexId: [sumObj, count] }, ordered by resolution like
+#  * gridPointsToHexPoints, computed from the finest resolution's bins
+#  *
+#  * binnedPoints: { hexId: [ind1, ind2, ...] } at resolution maxRes
+#  * binnedWeights: optional { hexId: [w1, w2, ...] } matching binnedPoints
+#  */
+def hierarchicalHexSums(dataFeatures, binnedPoints, sumFn, resRange, binnedWeights=None):
+    minRes, maxRes = resRange
+
+    finest = {}
+
+    for hexId in binnedPoints:
+        props = [dataFeatures[ind]["properties"] for ind in binnedPoints[hexId]]
+        weights = None if binnedWeights is None else binnedWeights[hexId]
+        count = len(props) if weights is None else sum(weights)
+
+        finest[hexId] = [sumFn(props, weights), count]
+
+    resSums = [finest]
+
+    for res in range(maxRes - 1, minRes - 1, -1):
+        resSums.insert(0, rollupToParents(resSums[0], res))
+
+    return resSums
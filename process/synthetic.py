@@ -0,0 +1,193 @@
+import math
+import random
+import string
+import h3
+
+# Synthetic inputs for bench.py and golden.py, shaped like the real ones so the
+# pipeline runs offline:
+#
+#   demand units   polygons with DU_ID, UnmetDemand / Difference series and a
+#                  LandUse category (DU_ID suffixes as idToVal reads them)
+#   groundwater    polygons with a Groundwater dict { "0": "12.3", ..., "": id }
+#                  holding `timesteps` values and the id after them
+#   tied land use  pairs of equal squares sharing a hex, so LandUse ties have to
+#                  be broken by first appearance as maxCounter does
+#   hex objects    merged per-resolution layers as process_combine.py writes
+#                  them, for the binary export and the temporal levels
+#
+# Everything is drawn from a seeded random.Random, so a (seed, size) pair always
+# gives the same features.
+
+# where the polygons are scattered, roughly the Central Valley
+center = (-121.0, 38.0)
+spread = 2.0
+
+duSuffixes = ["SA", "SU", "XA", "PA", "PU", "PR", "NA"]
+
+def ring(rnd, cx, cy, radius, vertices):
+    points = []
+    for j in range(vertices):
+        angle = 2 * math.pi * j / vertices
+        r = radius * rnd.uniform(0.6, 1.0)
+        points.append([cx + r * math.cos(angle), cy + r * math.sin(angle)])
+    points.append(points[0])
+    return points
+
+# /**
+#  *
+#  * returns a polygon geometry with `vertices` outer vertices and, if holes,
+#  * a hexagonal hole in every third polygon
+#  */
+def polygonGeometry(rnd, ind, vertices=12, holes=False, minRadius=0.05, maxRadius=0.3):
+    cx = center[0] + rnd.uniform(-spread, spread)
+    cy = center[1] + rnd.uniform(-spread, spread)
+    radius = rnd.uniform(minRadius, maxRadius)
+
+    coordinates = [ring(rnd, cx, cy, radius, vertices)]
+    if holes and ind % 3 == 0:
+        coordinates.append(ring(rnd, cx, cy, radius * 0.2, 6))
+
+    return { "type": "Polygon", "coordinates": coordinates }
+
+def series(rnd, timesteps, scale=1.0, offset=0.0):
+    return [offset + rnd.random() * scale for _ in range(timesteps)]
+
+def demandUnitId(rnd, ind):
+    return "%02d_%s%d" % (ind % 100, rnd.choice(duSuffixes), ind)
+
+# /**
+#  *
+#  * returns demand unit features with UnmetDemand, Difference and LandUse, the
+#  * properties process_hex.diffUnmetFeatures / landUseFeatures add
+#  */
+def demandUnitFeatures(n, seed=0, vertices=12, holes=False, timesteps=1200):
+    rnd = random.Random(seed)
+    features = []
+
+    for ind in range(n):
+        geometry = polygonGeometry(rnd, ind, vertices, holes)
+        duId = demandUnitId(rnd, ind)
+        features.append({
+            "type": "Feature",
+            "geometry": geometry,
+            "properties": {
+                "DU_ID": duId,
+                "UnmetDemand": series(rnd, timesteps),
+                "Difference": series(rnd, timesteps, 1.0, -0.5),
+                "LandUse": landUseOf(duId),
+            },
+        })
+
+    return features
+
+def landUseOf(duId):
+    # same mapping as process_hex.idToVal
+    lastPart = duId.rstrip(string.digits)[-2:]
+    return { "SA": 0, "SU": 0, "XA": 1, "PA": 2, "PU": 2, "PR": 2 }.get(lastPart, 3)
+
+# /**
+#  *
+#  * returns groundwater features whose Groundwater dicts look like the ones in
+#  * Baseline_Groundwater.json (string values, "" id after the timesteps)
+#  */
+def groundwaterFeatures(n, seed=0, vertices=4, holes=False, timesteps=1201):
+    rnd = random.Random(seed)
+    features = []
+
+    for ind in range(n):
+        geometry = polygonGeometry(rnd, ind, vertices, holes, 0.03, 0.15)
+        groundwater = { str(t): str(round(rnd.uniform(0, 200), 3)) for t in range(timesteps) }
+        groundwater[""] = str(ind)
+        features.append({ "type": "Feature", "geometry": geometry, "properties": { "Groundwater": groundwater } })
+
+    return features
+
+def rectangleGeometry(x0, y0, x1, y1):
+    return { "type": "Polygon", "coordinates": [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]] }
+
+# /**
+#  *
+#  * returns pairs of demand unit features with equal weight in one res-5 hex:
+#  * two mirrored squares around the hex's center (edges between lattice lines,
+#  * so both get the same lattice points and coverage), the first one in a
+#  * higher LandUse category than the second. With `pairs` given, they are
+#  * (first, second) categories, else they are drawn from seed
+#  */
+def tiedLandUseFeatures(n, seed=0, timesteps=1200, pairs=None, scale=50):
+    rnd = random.Random(seed)
+    features, cells = [], set()
+
+    while len(cells) < n:
+        cell = h3.latlng_to_cell(center[1] + rnd.uniform(-spread, spread), center[0] + rnd.uniform(-spread, spread), 5)
+        # neighbouring squares would share hexes
+        if cell in cells or any(neighbor in cells for neighbor in h3.grid_disk(cell, 1)):
+            continue
+        cells.add(cell)
+
+        lat, lon = h3.cell_to_latlng(cell)
+        lat, lon = round(lat * scale) / scale, round(lon * scale) / scale
+
+        if pairs is not None:
+            first, second = pairs[len(cells) - 1]
+        else:
+            second, first = sorted(rnd.sample(range(4), 2))
+
+        for category, x0 in ((first, lon - 0.05), (second, lon + 0.01)):
+            ind = len(features)
+            features.append({
+                "type": "Feature",
+                "geometry": rectangleGeometry(x0, lat - 0.01, x0 + 0.04, lat + 0.03),
+                "properties": {
+                    "DU_ID": "%02d_T%d" % (ind % 100, ind),
+                    "UnmetDemand": series(rnd, timesteps),
+                    "Difference": series(rnd, timesteps, 1.0, -0.5),
+                    "LandUse": category,
+                },
+            })
+
+    return features
+
+def featureCollection(features):
+    return { "type": "FeatureCollection", "features": features }
+
+# { DU_ID: { timestep: value } } payloads like the scenario API's unmetdemand
+def scenarioPayload(features, seed=0, timesteps=1200, coverage=1.0):
+    rnd = random.Random(seed)
+    payload = {}
+
+    for feature in features:
+        duId = feature["properties"]["DU_ID"]
+        if rnd.random() < coverage:
+            payload[duId] = { str(t): rnd.random() * 100 for t in range(timesteps) }
+
+    return payload
+
+# /**
+#  *
+#  * returns [{hexId: obj}, ...], one per resolution, of hex objects like the
+#  * ones process_combine.py writes (Groundwater, Elevation, LandUse and
+#  * LandUseFractions); the second hex of each lacks a land use, the third one
+#  * groundwater
+#  */
+def combinedHexObjects(resolutions=(5, 6), seed=0, timesteps=1200):
+    rnd = random.Random(seed)
+    resObjects = []
+
+    for res in resolutions:
+        objects = {}
+
+        for i, hexId in enumerate(sorted(h3.grid_disk(h3.latlng_to_cell(center[1], center[0], res), 1))):
+            obj = { "Groundwater": series(rnd, timesteps, 250, -50), "Elevation": rnd.uniform(0, 1000) }
+
+            if i != 1:
+                weights = [rnd.random() for _ in range(4)]
+                obj["LandUseFractions"] = [w / sum(weights) for w in weights]
+                obj["LandUse"] = sorted(range(4), key=lambda c: -weights[c])
+            if i == 2:
+                del obj["Groundwater"]
+
+            objects[hexId] = obj
+
+        resObjects.append(objects)
+
+    return resObjects
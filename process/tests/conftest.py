@@ -0,0 +1,13 @@
+import os
+import sys
+import pytest
+
+# the processing scripts import each other as top-level modules and read
+# elevcorr.png / elev.png relative to their own directory
+processDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, processDir)
+
+@pytest.fixture(autouse=True)
+def inProcessDir(monkeypatch):
+    monkeypatch.chdir(processDir)
+
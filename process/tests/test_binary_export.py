@@ -0,0 +1,79 @@
+import numpy as np
+import binary_export
+import synthetic
+
+timesteps = 250
+
+def resObjects():
+    return synthetic.combinedHexObjects(seed=0, timesteps=timesteps)
+
+def expectedMatrix(objects, layer):
+    if layer == "LandUse":
+        return np.array([[obj[layer][0] if layer in obj else binary_export.missingCategory] for obj in objects.values()])
+    if layer == "Elevation":
+        return np.array([[obj[layer]] for obj in objects.values()], dtype=np.float32)
+
+    width = timesteps if layer == "Groundwater" else 4
+    return np.array([obj[layer] if layer in obj else [np.nan] * width for obj in objects.values()], dtype=np.float32)
+
+def test_binary_round_trip(tmp_path):
+    data = resObjects()
+    manifest = binary_export.writeBinary(data, str(tmp_path))
+
+    assert list(manifest["layers"]) == ["Groundwater", "Elevation", "LandUse", "LandUseFractions"]
+    assert manifest["layers"]["LandUse"]["dtype"] == "uint8"
+
+    for r, objects in enumerate(data):
+        entry = manifest["resolutions"][r]
+        assert entry["resolution"] == 5 + r
+        assert entry["hexIds"] == list(objects)
+
+        for layer in manifest["layers"]:
+            decoded = binary_export.readLayer(str(tmp_path), manifest, layer, r)
+            assert decoded.shape[0] == len(objects)
+            # NaN (missing) in the same places
+            assert np.array_equal(decoded, expectedMatrix(objects, layer), equal_nan=True)
+
+def test_float16_buffers(tmp_path):
+    data = resObjects()
+    manifest = binary_export.writeBinary(data, str(tmp_path), ["Groundwater"], dtype="float16")
+
+    decoded = binary_export.readLayer(str(tmp_path), manifest, "Groundwater", 0)
+    assert decoded.dtype == np.float16
+    assert np.allclose(decoded, expectedMatrix(data[0], "Groundwater"), rtol=1e-3, equal_nan=True)
+
+def test_stream_writes_the_same_buffers(tmp_path):
+    data = resObjects()
+    layers = binary_export.presentLayers(data)
+    whole = binary_export.writeBinary(data, str(tmp_path / "whole"), layers)
+
+    # every resolution in batches of two hexes
+    batches = [(5 + r, list(objects.items())[i:i + 2]) for r, objects in enumerate(data) for i in range(0, len(objects), 2)]
+    streamed = binary_export.writeBinaryStream(batches, str(tmp_path / "streamed"), layers)
+
+    assert streamed == whole
+    for r in range(len(data)):
+        for layer in layers:
+            assert np.array_equal(binary_export.readLayer(str(tmp_path / "streamed"), streamed, layer, r),
+                                  binary_export.readLayer(str(tmp_path / "whole"), whole, layer, r), equal_nan=True)
+
+def test_time_chunks_round_trip(tmp_path):
+    data = resObjects()
+    index = binary_export.writeTimeChunks(data, str(tmp_path), chunkSize=100)
+
+    assert index["layers"]["Groundwater"]["timesteps"] == timesteps
+
+    for r, objects in enumerate(data):
+        chunks = index["resolutions"][r]["chunks"]["Groundwater"]
+        # the last chunk is the shorter remainder
+        assert [(c["start"], c["end"]) for c in chunks] == [(0, 100), (100, 200), (200, 250)]
+
+        decoded = np.concatenate([binary_export.readChunk(str(tmp_path), index, "Groundwater", c) for c in chunks], axis=1)
+        assert np.array_equal(decoded, expectedMatrix(objects, "Groundwater"), equal_nan=True)
+
+        assert binary_export.chunkForTimestep(index, "Groundwater", r, 199) is chunks[1]
+        assert binary_export.chunkForTimestep(index, "Groundwater", r, timesteps) is None
+
+        # the other layers are written whole, readable like a manifest
+        for layer in ["Elevation", "LandUse", "LandUseFractions"]:
+            assert np.array_equal(binary_export.readLayer(str(tmp_path), index, layer, r), expectedMatrix(objects, layer), equal_nan=True)
@@ -0,0 +1,62 @@
+import h3
+import numpy as np
+import ujson
+import process_hex
+from categorical import NOT_SEEN, categoryCounts, categoryFirstSeen, categoryValues, rankedCategories, rollupCounts
+from partition import partitionedHexPoints
+import synthetic
+
+def test_equal_weights_rank_by_first_appearance():
+    # one hex, feature 0 in category 3 and feature 1 in category 0, two points each
+    codes = [3, 0]
+    groups = np.array([0, 0, 0, 0])
+    inds = np.array([0, 0, 1, 1])
+
+    counts = categoryCounts(codes, groups, inds, 1, 4)
+    firstSeen = categoryFirstSeen(codes, groups, inds, 1, 4)
+
+    assert counts.tolist() == [[2, 0, 0, 2]]
+    assert firstSeen.tolist() == [[1, NOT_SEEN, NOT_SEEN, 0]]
+    assert rankedCategories(counts, firstSeen) == [process_hex.maxCounter([3, 3, 0, 0])]
+    assert categoryValues(counts, firstSeen, "LandUse") == [{ "LandUse": [3, 0], "LandUseFractions": [0.5, 0, 0, 0.5], "LandUseDominant": 3 }]
+
+def test_ranking_matches_maxCounter():
+    rnd = np.random.default_rng(0)
+    codes = rnd.integers(0, 4, 30)
+    groups = rnd.integers(0, 12, 200)
+    inds = rnd.integers(0, 30, 200)
+    weights = rnd.integers(1, 3, 200).astype(np.float64)
+
+    counts = categoryCounts(codes, groups, inds, 12, 4, weights)
+    firstSeen = categoryFirstSeen(codes, groups, inds, 12, 4)
+
+    for g, ranked in enumerate(rankedCategories(counts, firstSeen)):
+        # the reference sees a hex's features in index order
+        members = np.flatnonzero(groups == g)
+        members = members[np.argsort(inds[members], kind="stable")]
+        assert ranked == process_hex.maxCounter(codes[inds[members]].tolist(), weights[members].tolist())
+
+def test_rollup_keeps_first_appearance():
+    lat, lon = h3.cell_to_latlng(h3.latlng_to_cell(37.5, -120.5, 5))
+    children = h3.cell_to_children(h3.latlng_to_cell(lat, lon, 5), 6)[:2]
+
+    counts = np.array([[0, 0, 0, 2], [2, 0, 0, 0]], dtype=np.float64)
+    firstSeen = np.array([[NOT_SEEN, NOT_SEEN, NOT_SEEN, 0], [1, NOT_SEEN, NOT_SEEN, NOT_SEEN]])
+
+    parentIds, parentCounts, parentFirst = rollupCounts(children, counts, firstSeen, 5)
+
+    assert parentIds == [h3.latlng_to_cell(lat, lon, 5)]
+    assert rankedCategories(parentCounts, parentFirst) == [[3, 0]]
+
+def test_partitioned_ties_match_reference(tmp_path):
+    features = synthetic.tiedLandUseFeatures(1, pairs=[(3, 0)])
+    outPath = str(tmp_path / "landuse.json")
+
+    partitionedHexPoints(features, [], [5, 6], outPath, str(tmp_path / "work"), categoryProp="LandUse", nCategories=4)
+    reference = process_hex.geojsonToHexPoints(features, process_hex.aggLandUse, [5, 6], "lattice", False, "reference")
+
+    with open(outPath) as infile:
+        partitioned = ujson.load(infile)
+
+    for refPoints, points in zip(reference, partitioned):
+        assert { hexId: obj["LandUse"] for hexId, obj in points.items() } == { hexId: obj["LandUse"] for hexId, obj in refPoints.items() }
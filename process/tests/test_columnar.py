@@ -0,0 +1,30 @@
+import numpy as np
+import ujson
+import synthetic
+from columnar import featureMatrix, seriesValues
+from groundwater import readGroundwater
+
+def test_series_paths_agree_past_1201(tmp_path):
+    features = synthetic.groundwaterFeatures(3, timesteps=1300)
+    expected = np.array([[float(series[str(t)]) for t in range(1300)] for series in (f["properties"]["Groundwater"] for f in features)])
+
+    # dict series, read feature by feature
+    assert np.array_equal(featureMatrix(features, "Groundwater"), expected)
+
+    # the same file streamed into a matrix
+    path = str(tmp_path / "groundwater.json")
+    with open(path, "w") as outfile:
+        ujson.dump(synthetic.featureCollection(features), outfile)
+    streamed = readGroundwater(path)
+
+    assert np.array_equal(featureMatrix(streamed, "Groundwater"), expected)
+    # and from its rows, without the FeatureList's matrix
+    assert np.array_equal(featureMatrix(list(streamed), "Groundwater"), expected)
+    assert [f["properties"]["GroundwaterId"] for f in streamed] == [str(i) for i in range(3)]
+
+def test_only_the_id_entry_is_dropped():
+    values = list(range(1300))
+    assert seriesValues(values) == values
+    assert seriesValues({ str(t): t for t in values } | { "": "id" }) == values
+    # wherever the id entry sits
+    assert seriesValues({ "0": 0, "": "id", "1": 1 }) == [0, 1]
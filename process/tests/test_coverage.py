@@ -0,0 +1,31 @@
+import h3
+import pytest
+import shapely
+import shapely.geometry
+from coverage import featureGeometry, featureToCells
+
+res = 7
+
+invalidGeometries = {
+    # a hole reaching out of its shell, repaired into a MultiPolygon
+    "hole": { "type": "Polygon", "coordinates": [
+        [[-120, 37], [-119.6, 37], [-119.6, 37.4], [-120, 37.4], [-120, 37]],
+        [[-119.8, 37.1], [-119.4, 37.1], [-119.4, 37.3], [-119.8, 37.3], [-119.8, 37.1]],
+    ] },
+    # a zero width spike, repaired into a Polygon and a LineString
+    "spike": { "type": "Polygon", "coordinates": [
+        [[-120, 37], [-119.6, 37], [-119.6, 37.4], [-119.6, 37.8], [-119.6, 37.4], [-120, 37.4], [-120, 37]],
+    ] },
+}
+
+@pytest.mark.parametrize("name", sorted(invalidGeometries))
+def test_unweighted_cells_follow_repaired_geometry(name):
+    feature = { "type": "Feature", "geometry": invalidGeometries[name], "properties": {} }
+    geom = featureGeometry(feature)
+    assert geom.is_valid
+
+    # every cell around the feature whose center the repaired geometry holds
+    around = h3.geo_to_cells(shapely.geometry.box(*geom.buffer(0.05).bounds), res)
+    expected = { hexId for hexId in around if geom.contains(shapely.geometry.Point(*reversed(h3.cell_to_latlng(hexId)))) }
+
+    assert set(featureToCells(feature, res)) == expected
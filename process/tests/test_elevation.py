@@ -0,0 +1,118 @@
+import json
+import math
+import os
+import numpy as np
+import pytest
+import ujson
+from PIL import Image
+import process_hex
+import synthetic
+from elevation import RasterSampler, TileMosaic, openSampler, missingElevation
+
+# small synthetic terrain-rgb tiles, written as {z}/{x}/{y}.png
+
+zoom = 5
+size = 16
+# the zoom 5 tile over the Central Valley
+tileX, tileY = 5, 12
+
+def encodeTerrainRgb(elevations):
+    values = np.asarray(elevations, dtype=np.int64) + 32768
+    pixels = np.zeros(values.shape + (3,), dtype=np.uint8)
+    pixels[..., 0] = values // 256
+    pixels[..., 1] = values % 256
+    return pixels
+
+def writeTile(tileDir, x, y, elevations):
+    path = os.path.join(tileDir, str(zoom), str(x), "%d.png" % y)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.fromarray(encodeTerrainRgb(elevations)).save(path)
+    return path
+
+# lat / lng of global pixel coordinates at zoom
+def pixelToLatLng(px, py):
+    n = pow(2, zoom) * size
+    lngs = np.asarray(px, dtype=np.float64) / n * 360 - 180
+    lats = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * np.asarray(py, dtype=np.float64) / n))))
+    return lats, lngs
+
+def test_mosaic_matches_raster_on_one_tile(tmp_path):
+    elevations = np.random.default_rng(0).integers(-100, 3000, (size, size))
+    path = writeTile(str(tmp_path), tileX, tileY, elevations)
+
+    mosaic = openSampler(str(tmp_path))
+    raster = openSampler(path)
+    assert isinstance(mosaic, TileMosaic) and mosaic.zoom == zoom
+    assert isinstance(raster, RasterSampler)
+
+    # pixel centers of the whole tile
+    lx, ly = np.meshgrid(np.arange(size) + 0.5, np.arange(size) + 0.5)
+    lats, lngs = pixelToLatLng(tileX * size + lx.ravel(), tileY * size + ly.ravel())
+
+    assert mosaic.sample(lats, lngs).tolist() == elevations.ravel().tolist()
+    assert raster.sample(lats, lngs).tolist() == elevations.ravel().tolist()
+
+    # between pixel centers, away from the tile edge where the raster clamps
+    # and the mosaic reads the (missing) neighbour
+    lx, ly = np.meshgrid(np.arange(1, size - 2) + 0.75, np.arange(1, size - 2) + 0.25)
+    lats, lngs = pixelToLatLng(tileX * size + lx.ravel(), tileY * size + ly.ravel())
+
+    assert np.allclose(mosaic.sample(lats, lngs, bilinear=True), raster.sample(lats, lngs, bilinear=True))
+
+def test_mosaic_samples_across_tile_boundary(tmp_path):
+    writeTile(str(tmp_path), tileX, tileY, np.full((size, size), 100))
+    writeTile(str(tmp_path), tileX + 1, tileY, np.full((size, size), 200))
+    mosaic = TileMosaic(str(tmp_path), zoom)
+
+    # a quarter pixel either side of the shared edge, and on it
+    edge = (tileX + 1) * size
+    lats, lngs = pixelToLatLng([edge - 0.25, edge + 0.25, edge], [tileY * size + 8] * 3)
+
+    assert mosaic.sample(lats, lngs).tolist() == [100, 200, 200]
+    assert np.allclose(mosaic.sample(lats, lngs, bilinear=True), [125, 175, 150])
+
+    # the tile beyond them is missing
+    lats, lngs = pixelToLatLng([(tileX + 2) * size + 8], [tileY * size + 8])
+    assert mosaic.sample(lats, lngs).tolist() == [missingElevation]
+
+def test_mosaic_evicts_least_recently_used_tile(tmp_path):
+    for i in range(3):
+        writeTile(str(tmp_path), tileX + i, tileY, np.full((size, size), i))
+    mosaic = TileMosaic(str(tmp_path), zoom, maxTiles=2)
+
+    def sampleTile(i):
+        lats, lngs = pixelToLatLng([(tileX + i) * size + 8], [tileY * size + 8])
+        return mosaic.sample(lats, lngs).tolist()
+
+    assert sampleTile(0) == [0]
+    assert sampleTile(1) == [1]
+    assert sampleTile(0) == [0]
+    # tile 1 is now the least recently used
+    assert sampleTile(2) == [2]
+    assert list(mosaic.tiles) == [(tileX, tileY), (tileX + 2, tileY)]
+
+    # an evicted tile is read again
+    assert sampleTile(1) == [1]
+    assert list(mosaic.tiles) == [(tileX + 2, tileY), (tileX + 1, tileY)]
+
+@pytest.mark.parametrize("engine", ["reference", "columnar", "operator"])
+def test_missing_tiles_write_valid_json(engine, tmp_path, monkeypatch):
+    # a mosaic holding one tile far away from the features
+    tileDir = str(tmp_path / "tiles")
+    writeTile(tileDir, 0, 0, np.full((size, size), 500))
+    monkeypatch.setattr(process_hex, "elevationSource", tileDir)
+    monkeypatch.setattr(process_hex, "operatorCache", str(tmp_path))
+
+    features = synthetic.demandUnitFeatures(3, timesteps=4)
+    output = tmp_path / "diff.json"
+    with open(output, "w") as outfile:
+        ujson.dump(process_hex.geojsonToHexPoints(features, process_hex.avgDiffUnmet, [5, 6], "lattice", False, engine), outfile)
+
+    def rejectConstant(name):
+        raise ValueError("%s is not JSON" % name)
+
+    with open(output) as infile:
+        resPoints = json.load(infile, parse_constant=rejectConstant)
+
+    assert all(len(points) for points in resPoints)
+    assert all(obj["Elevation"] == missingElevation for points in resPoints for obj in points.values())
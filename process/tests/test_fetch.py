@@ -0,0 +1,305 @@
+import email.utils
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import ujson
+import fetch
+
+# Local stand-in for the scenario API. Every route is
+#
+#   { "body": bytes, "etag": str or None, "lastModified": str or None,
+#     "failures": how many 503s to answer with first,
+#     "delay": seconds to wait before answering }
+#
+# and the server records every request it sees, the most requests it answered at
+# once, and how many connections were opened and are still open.
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.opened += 1
+            self.server.open += 1
+
+    def finish(self):
+        super().finish()
+        with self.server.lock:
+            self.server.open -= 1
+
+    def send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        route = server.routes.get(self.path)
+
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            server.inFlight += 1
+            server.maxInFlight = max(server.maxInFlight, server.inFlight)
+
+        try:
+            self.answer(route)
+        finally:
+            with server.lock:
+                server.inFlight -= 1
+
+    def answer(self, route):
+        server = self.server
+
+        if route is None:
+            return self.send(404)
+
+        with server.lock:
+            failing = route.get("failures", 0) > 0
+            if failing:
+                route["failures"] -= 1
+
+        time.sleep(route.get("delay", 0))
+
+        if failing:
+            return self.send(503)
+
+        headers = {}
+        if route.get("etag"):
+            headers["ETag"] = route["etag"]
+        if route.get("lastModified"):
+            headers["Last-Modified"] = route["lastModified"]
+
+        if route.get("etag") and self.headers.get("If-None-Match") == route["etag"]:
+            return self.send(304, headers=headers)
+        if route.get("lastModified") and self.headers.get("If-Modified-Since") == route["lastModified"]:
+            return self.send(304, headers=headers)
+
+        self.send(200, route["body"], headers)
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.routes = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.opened = 0
+        self.open = 0
+
+    def url(self, path):
+        return "http://127.0.0.1:%d%s" % (self.server_address[1], path)
+
+@pytest.fixture
+def server(monkeypatch):
+    # urllib would route localhost through a proxy taken from the environment
+    monkeypatch.setenv("no_proxy", "127.0.0.1,localhost")
+    monkeypatch.delenv("PROCESS_OFFLINE", raising=False)
+
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    stopServer(server)
+
+def stopServer(server):
+    server.shutdown()
+    server.server_close()
+
+def test_etag_revalidation(server, tmp_path):
+    server.routes["/shapes"] = { "body": b'{"a": 1}', "etag": '"v1"' }
+    url = server.url("/shapes")
+
+    assert fetch.fetchBytes(url, cacheDir=str(tmp_path)) == b'{"a": 1}'
+    assert fetch.fetchBytes(url, cacheDir=str(tmp_path)) == b'{"a": 1}'
+
+    first, second = [headers for _, headers in server.requests]
+    assert "If-None-Match" not in first
+    assert second["If-None-Match"] == '"v1"'
+
+    # a changed payload replaces the cached one
+    server.routes["/shapes"] = { "body": b'{"a": 2}', "etag": '"v2"' }
+    assert fetch.fetchJson(url, cacheDir=str(tmp_path)) == { "a": 2 }
+    assert fetch.readEntry(url, str(tmp_path))["etag"] == '"v2"'
+
+def test_last_modified_revalidation(server, tmp_path):
+    lastModified = email.utils.formatdate(0, usegmt=True)
+    server.routes["/data"] = { "body": b"[1, 2]", "lastModified": lastModified }
+    url = server.url("/data")
+
+    assert fetch.fetchJson(url, cacheDir=str(tmp_path)) == [1, 2]
+    assert fetch.fetchJson(url, cacheDir=str(tmp_path)) == [1, 2]
+
+    assert server.requests[1][1]["If-Modified-Since"] == lastModified
+    assert "If-None-Match" not in server.requests[1][1]
+
+def test_offline_miss_raises(server, tmp_path):
+    with pytest.raises(fetch.CacheMiss):
+        fetch.fetchBytes(server.url("/missing"), offline=True, cacheDir=str(tmp_path))
+    assert server.requests == []
+
+def test_offline_hit_skips_network(server, tmp_path, monkeypatch):
+    server.routes["/shapes"] = { "body": b"{}", "etag": '"v1"' }
+    url = server.url("/shapes")
+    fetch.fetchBytes(url, cacheDir=str(tmp_path))
+
+    monkeypatch.setenv("PROCESS_OFFLINE", "1")
+    assert fetch.fetchBytes(url, cacheDir=str(tmp_path)) == b"{}"
+    assert len(server.requests) == 1
+
+def test_server_error_falls_back_to_cache(server, tmp_path):
+    server.routes["/shapes"] = { "body": b'{"a": 1}', "etag": '"v1"' }
+    url = server.url("/shapes")
+    fetch.fetchBytes(url, cacheDir=str(tmp_path))
+
+    server.routes["/shapes"]["failures"] = 1
+    assert fetch.fetchBytes(url, cacheDir=str(tmp_path)) == b'{"a": 1}'
+    assert len(server.requests) == 2
+
+def test_server_error_without_cache_raises(server, tmp_path):
+    server.routes["/shapes"] = { "body": b"{}", "failures": 1 }
+
+    with pytest.raises(fetch.urllib.error.HTTPError):
+        fetch.fetchBytes(server.url("/shapes"), cacheDir=str(tmp_path))
+
+def test_network_error_falls_back_to_cache(server, tmp_path):
+    server.routes["/shapes"] = { "body": b'{"a": 1}' }
+    url = server.url("/shapes")
+    fetch.fetchBytes(url, cacheDir=str(tmp_path))
+
+    stopServer(server)
+    assert fetch.fetchBytes(url, cacheDir=str(tmp_path)) == b'{"a": 1}'
+
+    with pytest.raises(OSError):
+        fetch.fetchBytes(server.url("/other"), cacheDir=str(tmp_path))
+
+def scenarioRoutes(server, count, **route):
+    bodies = {}
+    for i in range(count):
+        scenarioId = "s%d" % i
+        bodies[scenarioId] = { "DU_%d" % i: [i, i + 0.5], "note": "scénario %d" % i }
+        server.routes["/data/scenario/%s/unmetdemand" % scenarioId] = dict(route, body=ujson.dumps(bodies[scenarioId], ensure_ascii=False).encode())
+    return bodies
+
+def waitForClosed(server, seconds=2):
+    deadline = time.time() + seconds
+    while server.open and time.time() < deadline:
+        time.sleep(0.01)
+    return server.open
+
+def test_scenarios_run_concurrently_over_kept_alive_connections(server, tmp_path, monkeypatch):
+    bodies = scenarioRoutes(server, 8, delay=0.1)
+
+    # hold on to the connections so only an explicit close (not collection) ends them
+    created = []
+    class RecordingPool(fetch.ConnectionPool):
+        def get(self, parts):
+            conn = super().get(parts)
+            created.append(conn)
+            return conn
+    monkeypatch.setattr(fetch, "ConnectionPool", RecordingPool)
+
+    results, timings = fetch.fetchScenarios(list(bodies), workers=3, cacheDir=str(tmp_path), root=server.url(""))
+
+    assert results == bodies
+    assert [t["status"] for t in timings] == [200] * 8
+    assert 1 < server.maxInFlight <= 3
+    # every worker reuses its connection, and all of them are closed at the end
+    assert server.opened <= 3
+    assert all(conn.sock is None for conn in created)
+    assert waitForClosed(server) == 0
+
+def test_scenarios_revalidate_from_cache(server, tmp_path):
+    bodies = scenarioRoutes(server, 2, etag='"v1"')
+    root = server.url("")
+
+    fetch.fetchScenarios(list(bodies), workers=2, cacheDir=str(tmp_path), root=root)
+    results, timings = fetch.fetchScenarios(list(bodies), workers=2, cacheDir=str(tmp_path), root=root)
+
+    assert results == bodies
+    assert [t["status"] for t in timings] == [304, 304]
+
+def test_scenario_retries_server_errors(server, tmp_path):
+    bodies = scenarioRoutes(server, 1, failures=2)
+
+    results, timings = fetch.fetchScenarios(list(bodies), retries=3, backoff=0.01, cacheDir=str(tmp_path), root=server.url(""))
+
+    assert results == bodies
+    assert timings[0]["status"] == 200
+    assert timings[0]["attempts"] == 3
+    assert len(server.requests) == 3
+
+def test_scenario_retries_exhausted(server, tmp_path):
+    bodies = scenarioRoutes(server, 1)
+    root = server.url("")
+    fetch.fetchScenarios(list(bodies), cacheDir=str(tmp_path), root=root)
+
+    # with a cached copy the last good payload is returned
+    server.routes["/data/scenario/s0/unmetdemand"]["failures"] = 5
+    results, timings = fetch.fetchScenarios(list(bodies), retries=1, backoff=0.01, cacheDir=str(tmp_path), root=root)
+    assert results == bodies
+    assert timings[0]["status"] == "stale"
+    assert timings[0]["attempts"] == 2
+
+    # without one the failure is raised, or only reported when not strict
+    server.routes["/data/scenario/s0/unmetdemand"]["failures"] = 5
+    with pytest.raises(fetch.RetryableStatus):
+        fetch.fetchScenarios(list(bodies), retries=1, backoff=0.01, cacheDir=str(tmp_path / "empty"), root=root)
+
+    server.routes["/data/scenario/s0/unmetdemand"]["failures"] = 5
+    results, timings = fetch.fetchScenarios(list(bodies), retries=1, backoff=0.01, cacheDir=str(tmp_path / "empty"), root=root, strict=False)
+    assert results == {}
+    assert timings[0]["status"] == "error"
+    assert waitForClosed(server) == 0
+
+def test_stream_decode_across_chunks(server, tmp_path):
+    bodies = scenarioRoutes(server, 1)
+    url = fetch.scenarioUrl("s0", server.url(""))
+    body = server.routes["/data/scenario/s0/unmetdemand"]["body"]
+
+    connections = fetch.ConnectionPool()
+    try:
+        # 5 byte chunks split the two byte "é" and every token of the payload
+        status, obj, nbytes, _ = fetch.streamRequest(url, None, str(tmp_path), connections, chunkSize=5)
+    finally:
+        connections.close()
+
+    assert status == 200
+    assert obj == bodies["s0"]
+    assert nbytes == len(body)
+    assert fetch.readObject(fetch.readEntry(url, str(tmp_path)), str(tmp_path)) == body
+
+def test_concurrent_writes_of_one_path(tmp_path):
+    path = str(tmp_path / "objects" / "shared")
+    bodies = [bytes([i]) * 200000 for i in range(8)]
+    errors = []
+
+    def write(body):
+        try:
+            for _ in range(10):
+                fetch.writeAtomic(path, body)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(body,)) for body in bodies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # one writer's body, whole, and no temporary files left behind
+    with open(path, "rb") as infile:
+        assert infile.read() in bodies
+    assert os.listdir(tmp_path / "objects") == ["shared"]
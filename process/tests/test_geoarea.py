@@ -0,0 +1,43 @@
+import area
+import numpy as np
+import synthetic
+from geoarea import areaUnit, demandUnitAreas, geodesicAreas
+
+def test_areas_match_area_package():
+    features = synthetic.demandUnitFeatures(20, seed=3, vertices=9, holes=True, timesteps=1)
+    geometries = [f["geometry"] for f in features]
+
+    # a multipolygon, a collection, positions with altitude and a degenerate ring
+    geometries.append({ "type": "MultiPolygon", "coordinates": [geometries[0]["coordinates"], geometries[1]["coordinates"]] })
+    geometries.append({ "type": "GeometryCollection", "geometries": [geometries[2], geometries[3]] })
+    geometries.append({ "type": "Polygon", "coordinates": [[p + [12.5] for p in ring] for ring in geometries[4]["coordinates"]] })
+    geometries.append({ "type": "Polygon", "coordinates": [[[-120.0, 37.0], [-120.0, 37.0]]] })
+
+    expected = [area.area(g) for g in geometries]
+    assert np.allclose(geodesicAreas(geometries, cache={}), expected, rtol=1e-9)
+
+def test_cached_areas_are_reused():
+    geometries = [synthetic.rectangleGeometry(-121, 37, -120, 38), synthetic.rectangleGeometry(-121, 37, -120.5, 38)]
+    cache = {}
+
+    first = geodesicAreas(geometries, cache)
+    assert len(cache) == 2
+    # same coordinates hit the cache, a new geometry is measured
+    geometries.append(synthetic.rectangleGeometry(-121, 37, -120.75, 38))
+    second = geodesicAreas(geometries, cache)
+
+    assert second[:2].tolist() == first.tolist()
+    assert len(cache) == 3
+    assert np.isclose(second[2], area.area(geometries[2]), rtol=1e-9)
+
+def test_demand_unit_areas_sum_features():
+    features = synthetic.demandUnitFeatures(6, seed=1, holes=True, timesteps=1)
+    # two features of the first demand unit, and a demand unit without features
+    features[1]["properties"]["DU_ID"] = features[0]["properties"]["DU_ID"]
+    duIds = list(dict.fromkeys(f["properties"]["DU_ID"] for f in features)) + ["99_NA99"]
+
+    expected = { idd: 0 for idd in duIds }
+    for f in features:
+        expected[f["properties"]["DU_ID"]] += area.area(f["geometry"]) / areaUnit
+
+    assert np.allclose(demandUnitAreas(features, duIds), [expected[idd] for idd in duIds], rtol=1e-9)
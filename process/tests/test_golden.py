@@ -0,0 +1,30 @@
+import golden
+import synthetic
+
+def test_parse_candidate_modes():
+    assert golden.parseCandidate("operator+coverage-weighted+workers=2") == { "engine": "operator", "mode": "coverage-weighted", "hierarchical": False, "workers": 2 }
+    assert golden.parseCandidate("columnar")["mode"] == "lattice"
+
+def test_tied_land_use_passes_every_mode(tmp_path):
+    features = synthetic.tiedLandUseFeatures(4, seed=1, timesteps=4)
+    candidates = ["columnar", "operator", "columnar+coverage", "operator+coverage", "columnar+coverage-weighted", "operator+coverage-weighted"]
+
+    results = golden.checkLayer("landuse-ties", features, [5, 6], candidates, 1e-9, 1e-7, str(tmp_path))
+
+    assert [result["candidate"] for result in results if not result["passed"]] == []
+
+def test_coverage_candidates_skip_gw(tmp_path):
+    results = golden.checkLayer("gw", [], [5, 5], ["operator+coverage"], 1e-9, 1e-7, str(tmp_path))
+    assert results[0]["skipped"]
+
+def test_hierarchical_candidates_compare_rolled_up(tmp_path):
+    assert not any(golden.parseCandidate(spec)["hierarchical"] for spec in golden.defaultCandidates)
+
+    features = synthetic.demandUnitFeatures(6, timesteps=4)
+    results = golden.checkLayer("diff", features, [5, 6], ["columnar+hierarchical", "operator+hierarchical"], 1e-9, 1e-7, str(tmp_path))
+
+    assert all(result["passed"] for result in results)
+    # the finest level is binned directly, only coarser ones can differ
+    for result in results:
+        assert [r["resolution"] for r in result["nonNested"]] == [5, 6]
+        assert result["nonNested"][1]["onlyPerLevel"] == result["nonNested"][1]["onlyRolledUp"] == 0
@@ -0,0 +1,57 @@
+import copy
+import numpy as np
+import ujson
+import incremental
+import process_hex
+import synthetic
+from elevation import openSampler
+
+def payload(duIds, seed, timesteps=6):
+    rnd = np.random.default_rng(seed)
+    return { idd: { str(t): float(v) for t, v in enumerate(rnd.uniform(0, 50, timesteps)) } for idd in duIds }
+
+def fullRebuild(region, temporal_object, temporal_bl_object):
+    region = copy.deepcopy(region)
+    region["features"] = process_hex.diffUnmetFeatures(region, temporal_object, temporal_bl_object)
+    return process_hex.geojsonToHexPoints(region["features"], process_hex.avgDiffUnmet, process_hex.resRange, process_hex.hexMode, False, "operator")
+
+def test_update_matches_full_rebuild(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_hex, "operatorCache", str(tmp_path / "operators"))
+    region = synthetic.featureCollection(synthetic.demandUnitFeatures(8, timesteps=6))
+    duIds = [f["properties"]["DU_ID"] for f in region["features"]]
+    sampler = openSampler(process_hex.elevationSource)
+
+    baseline = payload(duIds, 0)
+    before = payload(duIds[:-1], 1)
+
+    state = incremental.buildState(copy.deepcopy(region), before, baseline)
+    output = str(tmp_path / "diff.json")
+    with open(output, "w") as outfile:
+        ujson.dump(incremental.hexValues(state, sampler=sampler), outfile)
+    state.save(str(tmp_path / "state"))
+
+    # two revised, one removed and one added demand unit
+    after = copy.deepcopy(before)
+    after[duIds[0]] = payload([duIds[0]], 2)[duIds[0]]
+    after[duIds[1]] = payload([duIds[1]], 3)[duIds[1]]
+    del after[duIds[2]]
+    after[duIds[-1]] = payload([duIds[-1]], 4)[duIds[-1]]
+
+    state = incremental.DiffState.load(str(tmp_path / "state"))
+    duInds = incremental.changedUnits(state, after, baseline)
+    assert sorted(duInds.tolist()) == [0, 1, 2, len(duIds) - 1]
+
+    affected = incremental.applyChanges(state, duInds, after, baseline)
+    incremental.patchOutput(output, incremental.hexValues(state, affected), sampler)
+
+    with open(output) as infile:
+        patched = ujson.load(infile)
+    expected = fullRebuild(region, after, baseline)
+
+    assert len(patched) == len(expected)
+    for points, expectedPoints in zip(patched, expected):
+        assert sorted(points) == sorted(expectedPoints)
+        for hexId, obj in expectedPoints.items():
+            assert points[hexId]["Elevation"] == obj["Elevation"]
+            for prop in incremental.props:
+                assert np.allclose(points[hexId][prop], obj[prop], rtol=1e-12, atol=1e-12)
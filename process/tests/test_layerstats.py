@@ -0,0 +1,67 @@
+import numpy as np
+import synthetic
+from layerstats import numericStats, categoryStats, vectorStats, computeLayerStats
+
+def test_numeric_stats_skip_missing():
+    nan = np.nan
+    matrix = [[1.0, nan, 4.0], [3.0, nan, nan], [2.0, nan, 0.0]]
+
+    stats = numericStats(matrix, [0, 50, 100], perTimestep=True)
+
+    assert stats == {
+        "count": 5, "min": 0.0, "max": 4.0, "mean": 2.0, "percentiles": [0.0, 2.0, 4.0],
+        # no hex has the second timestep
+        "timestepMin": [1.0, None, 0.0], "timestepMax": [3.0, None, 4.0],
+    }
+
+    assert numericStats([[nan, nan]], [50]) == { "count": 0, "min": None, "max": None, "mean": None, "percentiles": [None] }
+    assert numericStats(np.empty((0, 2)), [50], perTimestep=True)["timestepMax"] == [None, None]
+
+def test_category_and_vector_stats():
+    codes = np.array([[2], [255], [0], [2]], dtype=np.uint8)
+    assert categoryStats(codes, 255) == { "count": 3, "classes": { "0": 1, "2": 2 } }
+
+    fractions = [[0.5, 0.5], [np.nan, np.nan], [0.25, 0.75]]
+    assert vectorStats(fractions) == { "count": 2, "min": [0.25, 0.5], "max": [0.5, 0.75], "mean": [0.375, 0.625] }
+    assert vectorStats([[np.nan, np.nan]])["min"] == [None, None]
+
+def test_layer_stats_match_hex_objects():
+    resObjects = synthetic.combinedHexObjects(seed=2, timesteps=6)
+    # process_gw.py writes [[hexId, obj], ...]
+    resObjects[1] = [[hexId, obj] for hexId, obj in resObjects[1].items()]
+
+    stats = computeLayerStats(resObjects, percentiles=[1, 50, 99])
+
+    assert [r["resolution"] for r in stats["resolutions"]] == [5, 6]
+    assert { layer: entry["kind"] for layer, entry in stats["layers"].items() } == { "Groundwater": "series", "Elevation": "scalar", "LandUse": "category", "LandUseFractions": "vector" }
+
+    groundwater, elevation = [], []
+    for hexObjects, resEntry in zip(resObjects, stats["resolutions"]):
+        objs = [obj for _, obj in (hexObjects.items() if isinstance(hexObjects, dict) else hexObjects)]
+        assert resEntry["hexes"] == len(objs)
+
+        rows = np.array([obj["Groundwater"] for obj in objs if "Groundwater" in obj])
+        gwStats = resEntry["layers"]["Groundwater"]
+        assert gwStats["count"] == rows.size
+        assert np.allclose([gwStats["min"], gwStats["max"], gwStats["mean"]], [rows.min(), rows.max(), rows.mean()])
+        assert np.allclose(gwStats["percentiles"], np.percentile(rows, [1, 50, 99]))
+        assert np.allclose(gwStats["timestepMin"], rows.min(axis=0))
+        assert np.allclose(gwStats["timestepMax"], rows.max(axis=0))
+
+        dominant = [obj["LandUse"][0] for obj in objs if "LandUse" in obj]
+        assert resEntry["layers"]["LandUse"] == { "count": len(dominant), "classes": { str(c): dominant.count(c) for c in set(dominant) } }
+
+        fractions = np.array([obj["LandUseFractions"] for obj in objs if "LandUseFractions" in obj])
+        assert np.allclose(resEntry["layers"]["LandUseFractions"]["mean"], fractions.mean(axis=0))
+
+        groundwater.append(rows)
+        elevation.append([obj["Elevation"] for obj in objs])
+
+    # extents span every resolution
+    assert np.allclose(stats["layers"]["Groundwater"]["extent"], [min(r.min() for r in groundwater), max(r.max() for r in groundwater)])
+    assert np.allclose(stats["layers"]["Elevation"]["extent"], [min(map(min, elevation)), max(map(max, elevation))])
+    assert np.allclose(stats["layers"]["Groundwater"]["robustExtent"], [
+        min(np.percentile(r, 1) for r in groundwater),
+        max(np.percentile(r, 99) for r in groundwater),
+    ])
+    assert "extent" not in stats["layers"]["LandUse"]
@@ -0,0 +1,24 @@
+import copy
+import numpy as np
+from parallel import geojsonToGridArraysParallel, polygonCoords
+from raster import geojsonToGridArrays
+import synthetic
+
+def withAltitude(features):
+    features = copy.deepcopy(features)
+    for feature in features:
+        for ring in feature["geometry"]["coordinates"]:
+            for position in ring:
+                position.append(12.5)
+    return features
+
+def test_altitude_is_dropped():
+    features = synthetic.demandUnitFeatures(3, holes=True)
+    featuresZ = withAltitude(features)
+
+    for feature, featureZ in zip(features, featuresZ):
+        assert polygonCoords(featureZ).tolist() == polygonCoords(feature).tolist()
+
+    expected = geojsonToGridArrays(features)
+    for got, want in zip(geojsonToGridArraysParallel(featuresZ, workers=2), expected):
+        assert np.array_equal(got, want)
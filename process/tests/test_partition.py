@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import ujson
+import binary_export
+import process_hex
+import synthetic
+from elevation import openSampler
+from partition import partitionedHexPoints, shardsDir
+
+def test_partitioned_series_match_reference(tmp_path):
+    features = synthetic.demandUnitFeatures(6, timesteps=5)
+    sampler = openSampler(process_hex.elevationSource)
+    outPath = str(tmp_path / "diff.json")
+    workDir = str(tmp_path / "work")
+
+    # small partitions, so features and hexes straddle several of them
+    partitionedHexPoints(features, ["UnmetDemand", "Difference"], [5, 6], outPath, workDir, sampler=sampler, partitionRes=4, keep=True)
+    assert len({ name.split("_")[0] for name in os.listdir(shardsDir(workDir)) }) > 1
+
+    reference = process_hex.geojsonToHexPoints(features, process_hex.avgDiffUnmet, [5, 6], "lattice", False, "reference")
+    with open(outPath) as infile:
+        partitioned = ujson.load(infile)
+
+    assert len(partitioned) == len(reference)
+    for refPoints, points in zip(reference, partitioned):
+        assert sorted(points) == sorted(refPoints)
+        for hexId, obj in refPoints.items():
+            assert points[hexId]["Elevation"] == obj["Elevation"]
+            for prop in ("UnmetDemand", "Difference"):
+                assert np.allclose(points[hexId][prop], obj[prop], rtol=1e-12, atol=0)
+
+def test_binary_output_matches_json(tmp_path):
+    features = synthetic.demandUnitFeatures(4, timesteps=5)
+    jsonPath, binaryDir = str(tmp_path / "landuse.json"), str(tmp_path / "landuse")
+
+    for outPath, outputFormat in ((jsonPath, "json"), (binaryDir, "binary")):
+        partitionedHexPoints(features, ["UnmetDemand"], [5, 6], outPath, str(tmp_path / "work"), categoryProp="LandUse",
+                             partitionRes=4, outputFormat=outputFormat, nCategories=4)
+
+    with open(jsonPath) as infile:
+        resObjects = ujson.load(infile)
+    with open(os.path.join(binaryDir, "manifest.json")) as infile:
+        manifest = ujson.load(infile)
+
+    for r, objects in enumerate(resObjects):
+        assert manifest["resolutions"][r]["hexIds"] == list(objects)
+        for layer in ("UnmetDemand", "LandUse", "LandUseFractions"):
+            assert np.array_equal(binary_export.readLayer(binaryDir, manifest, layer, r), binary_export.layerMatrix(objects, layer, np.float32))
@@ -0,0 +1,21 @@
+import process_hex
+import pipeline
+
+def test_hex_tables_are_fingerprinted(monkeypatch):
+    params = pipeline.hexParams()
+    assert params["seriesProps"]["avgDiffUnmet"] == ["UnmetDemand", "Difference"]
+    assert params["sumFns"]["aggLandUse"] == "countLandUse"
+    assert params["categoricalProps"] == { "aggLandUse": "LandUse" }
+
+    changes = [
+        (process_hex.seriesProps, process_hex.avgDiffUnmet, ["UnmetDemand"]),
+        (process_hex.sumFns, process_hex.avgDiffUnmet, process_hex.sumGroundwater),
+        (process_hex.categoricalProps, process_hex.aggLandUse, "LandUseCode"),
+    ]
+
+    for table, fn, value in changes:
+        with monkeypatch.context() as m:
+            m.setitem(table, fn, value)
+            assert pipeline.hexParams() != params
+
+    assert pipeline.hexParams() == params
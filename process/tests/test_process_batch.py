@@ -0,0 +1,51 @@
+import copy
+import h3
+import numpy as np
+import pytest
+import process_batch
+import process_hex
+import synthetic
+
+def scenarioObject(features, seed, timesteps=6, skip=()):
+    rnd = np.random.default_rng(seed)
+    return { f["properties"]["DU_ID"]: { str(t): float(v) for t, v in enumerate(rnd.uniform(0, 50, timesteps)) }
+             for f in features if f["properties"]["DU_ID"] not in skip }
+
+@pytest.fixture
+def region(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_hex, "operatorCache", str(tmp_path))
+    return synthetic.featureCollection(synthetic.demandUnitFeatures(5, timesteps=6))
+
+def test_batch_matches_process_hex(region):
+    features = region["features"]
+    baseline = scenarioObject(features, 0)
+    scenarios = { "a": scenarioObject(features, 1), "b": scenarioObject(features, 2, skip=[features[0]["properties"]["DU_ID"]]) }
+
+    batch = process_batch.batchHexPoints(copy.deepcopy(region), baseline, scenarios)
+
+    for sid, scenario in scenarios.items():
+        regionCopy = copy.deepcopy(region)
+        regionCopy["features"] = process_hex.diffUnmetFeatures(regionCopy, scenario, baseline)
+        expected = process_hex.geojsonToHexPoints(regionCopy["features"], process_hex.avgDiffUnmet, process_hex.resRange, "lattice", False, "operator")
+
+        assert len(batch[sid]) == len(expected)
+        for points, expectedPoints in zip(batch[sid], expected):
+            assert sorted(points) == sorted(expectedPoints)
+            for hexId, obj in expectedPoints.items():
+                for prop in ("UnmetDemand", "Difference"):
+                    assert np.allclose(points[hexId][prop], obj[prop], rtol=1e-12, atol=0)
+
+def test_du_missing_from_baseline_raises(region):
+    features = region["features"]
+    baseline = scenarioObject(features, 0, skip=[features[1]["properties"]["DU_ID"]])
+
+    with pytest.raises(KeyError, match="missing from the baseline"):
+        process_batch.batchHexPoints(region, baseline, { "a": scenarioObject(features, 1) })
+
+def test_settings_read_at_call_time(region, monkeypatch):
+    features = region["features"]
+    monkeypatch.setattr(process_hex, "resRange", [6, 6])
+
+    batch = process_batch.batchHexPoints(region, scenarioObject(features, 0), { "a": scenarioObject(features, 1) })
+    assert len(batch["a"]) == 1
+    assert all(h3.get_resolution(hexId) == 6 for hexId in batch["a"][0])
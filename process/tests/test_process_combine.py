@@ -0,0 +1,67 @@
+import os
+import h3
+import ujson
+import process_combine
+
+def writeLayer(path, resObjects):
+    with open(path, "w") as outfile:
+        ujson.dump(resObjects, outfile)
+
+def hexes(res, n):
+    return sorted(h3.grid_disk(h3.latlng_to_cell(37.5, -120.5, res), 1))[:n]
+
+def writeLayers(directory):
+    a, b, c, d = hexes(5, 4)
+    layerSpecs = [
+        (os.path.join(directory, "gw.json"), None),
+        (os.path.join(directory, "diff.json"), ["UnmetDemand"]),
+        (os.path.join(directory, "landuse.json"), ["LandUse"]),
+    ]
+    fine = hexes(6, 2)
+
+    writeLayer(layerSpecs[0][0], [
+        { hexId: { "Groundwater": [1.0, 2.0], "Elevation": 10.0 } for hexId in (a, b, c) },
+        { hexId: { "Groundwater": [3.0, 4.0], "Elevation": 20.0 } for hexId in fine },
+    ])
+    # c missing, d extra
+    writeLayer(layerSpecs[1][0], [
+        { hexId: { "UnmetDemand": [0.5, 0.5], "Difference": [0, 0] } for hexId in (a, b, d) },
+        { hexId: { "UnmetDemand": [0.25, 0.25] } for hexId in fine },
+    ])
+    # only one resolution
+    writeLayer(layerSpecs[2][0], [{ a: { "LandUse": [2], "Other": 1 } }])
+
+    return layerSpecs, (a, b, c, d), fine
+
+def test_join_counts_missing_and_extra(tmp_path):
+    layerSpecs, (a, b, c, d), fine = writeLayers(str(tmp_path))
+    output = str(tmp_path / "combined")
+
+    allStats = process_combine.combineLayers(layerSpecs, output)
+
+    diff, landuse = layerSpecs[1][0], layerSpecs[2][0]
+    assert [stats["hexes"] for stats in allStats] == [3, 2]
+    assert allStats[0]["layers"][diff] == { "matched": 2, "missing": 1, "extra": 1, "missingSample": [c] }
+    assert allStats[0]["layers"][landuse] == { "matched": 1, "missing": 2, "extra": 0, "missingSample": [b, c] }
+    # a layer with fewer resolutions misses every hex of the others
+    assert allStats[1]["layers"][landuse] == { "matched": 0, "missing": 2, "extra": 0, "missingSample": fine }
+
+    with open(output + ".json") as infile:
+        merged = ujson.load(infile)
+    assert merged[0][a] == { "Groundwater": [1.0, 2.0], "Elevation": 10.0, "UnmetDemand": [0.5, 0.5], "LandUse": [2] }
+    assert d not in merged[0]
+    assert "UnmetDemand" not in merged[0][c]
+
+    with open(output + "_stats.json") as infile:
+        assert ujson.load(infile) == allStats
+
+def test_only_json_by_default(tmp_path):
+    layerSpecs, _, _ = writeLayers(str(tmp_path))
+    output = str(tmp_path / "combined")
+
+    process_combine.combineLayers(layerSpecs, output)
+    assert sorted(os.listdir(tmp_path)) == ["combined.json", "combined_layer_stats.json", "combined_report.json", "combined_stats.json", "diff.json", "gw.json", "landuse.json"]
+
+    process_combine.combineLayers(layerSpecs, output, outputFormats=["json", "binary", "chunks"])
+    assert os.path.exists(os.path.join(output, "manifest.json"))
+    assert os.path.exists(os.path.join(output + "_chunks", "index.json"))
@@ -0,0 +1,33 @@
+import pytest
+import ujson
+import instrument
+import process_hex
+import synthetic
+
+@pytest.mark.parametrize("engine", ["operator", "columnar"])
+@pytest.mark.parametrize("mode", ["lattice", "coverage", "coverage-weighted"])
+def test_engines_rank_ties_like_reference(engine, mode, tmp_path, monkeypatch):
+    monkeypatch.setattr(process_hex, "operatorCache", str(tmp_path))
+    features = synthetic.tiedLandUseFeatures(1, pairs=[(3, 0)])
+
+    reference = process_hex.geojsonToHexPoints(features, process_hex.aggLandUse, [5, 5], mode, False, "reference")
+    candidate = process_hex.geojsonToHexPoints(features, process_hex.aggLandUse, [5, 5], mode, False, engine)
+
+    assert [list(points) for points in candidate] == [list(points) for points in reference]
+    for hexId, obj in reference[0].items():
+        assert obj["LandUse"] == [3, 0]
+        assert candidate[0][hexId]["LandUse"] == [3, 0]
+        assert candidate[0][hexId]["LandUseDominant"] == 3
+        assert candidate[0][hexId]["LandUseFractions"] == [0.5, 0, 0, 0.5]
+
+def test_hierarchical_runs_are_labelled_approximate(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_hex, "operatorCache", str(tmp_path))
+    features = synthetic.demandUnitFeatures(3, timesteps=4)
+    output = str(tmp_path / "diff.json")
+
+    with instrument.run(output):
+        process_hex.geojsonToHexPoints(features, process_hex.avgDiffUnmet, [4, 6], "lattice", True, "operator")
+
+    with open(instrument.reportPath(output)) as infile:
+        report = ujson.load(infile)
+    assert report["counters"]["approximateResolutions"] == [4, 5]
@@ -0,0 +1,57 @@
+import warnings
+import numpy as np
+import binary_export
+import pyramid
+import synthetic
+
+def naiveDownsample(matrix, factor):
+    out = { stat: [] for stat in pyramid.levelStats }
+    for row in matrix:
+        groups = [row[start:start + factor] for start in range(0, len(row), factor)]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            out["mean"].append([np.nanmean(g) for g in groups])
+            out["min"].append([np.nanmin(g) for g in groups])
+            out["max"].append([np.nanmax(g) for g in groups])
+    return { stat: np.array(rows) for stat, rows in out.items() }
+
+def test_downsample_skips_missing_months():
+    matrix = np.random.default_rng(0).uniform(0, 10, (3, 26))
+    matrix[0, 3:6] = np.nan       # a whole group missing
+    matrix[1, [0, 25]] = np.nan   # partly missing, also in the shorter last group
+
+    for factor in (3, 12):
+        got = pyramid.downsample(matrix, factor)
+        expected = naiveDownsample(matrix, factor)
+
+        assert got["mean"].shape == (3, pyramid.levelLength(26, factor))
+        for stat in pyramid.levelStats:
+            assert np.allclose(got[stat], expected[stat], equal_nan=True)
+
+    assert np.isnan(pyramid.downsample(matrix, 3)["mean"][0, 1])
+
+def test_level_for_rate():
+    levels = pyramid.levelIndex(1201)
+    assert [level["timesteps"] for level in levels] == [1201, 401, 101, 11]
+
+    assert pyramid.levelForRate(levels, 1)["name"] == "monthly"
+    assert pyramid.levelForRate(levels, 12)["name"] == "annual"
+    assert pyramid.levelForRate(levels, 60)["name"] == "annual"
+    assert pyramid.levelForRate(levels, 500)["name"] == "decadal"
+
+def test_written_levels_decode(tmp_path):
+    data = synthetic.combinedHexObjects(timesteps=250)
+    manifest = binary_export.writeBinary(data, str(tmp_path / "binary"), levels=pyramid.levels)
+    index = binary_export.writeTimeChunks(data, str(tmp_path / "chunks"), levels=pyramid.levels)
+
+    assert manifest["layers"]["Groundwater"]["levels"] == pyramid.levelIndex(250)
+    assert "levels" not in manifest["layers"]["Elevation"]
+
+    for r, objects in enumerate(data):
+        expected = pyramid.temporalPyramid(binary_export.layerMatrix(objects, "Groundwater", np.float32))
+
+        for outDir, written in ((tmp_path / "binary", manifest), (tmp_path / "chunks", index)):
+            for name, _ in pyramid.levels:
+                for stat in pyramid.levelStats:
+                    decoded = binary_export.readLevel(str(outDir), written, "Groundwater", r, name, stat)
+                    assert np.allclose(decoded, expected[name][stat], rtol=1e-6, equal_nan=True)
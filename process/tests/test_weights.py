@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+import process_hex
+import synthetic
+import weights
+
+def test_operator_means_match_reference(tmp_path):
+    features = synthetic.demandUnitFeatures(4, timesteps=5)
+    reference = process_hex.geojsonToHexPoints(features, process_hex.avgDiffUnmet, [5, 6], "lattice", False, "reference")
+
+    operators = weights.hexOperators(features, [5, 6], cacheDir=str(tmp_path))
+    matrix = np.array([feature["properties"]["UnmetDemand"] for feature in features], dtype=np.float64)
+
+    for (hexIds, W), points in zip(operators, reference):
+        assert sorted(hexIds) == sorted(points)
+        means = weights.operatorMeans(W, matrix)
+        for hexId, row in zip(hexIds, means):
+            assert np.allclose(row, points[hexId]["UnmetDemand"], rtol=1e-12, atol=0)
+
+def test_cached_operators_reload(tmp_path, monkeypatch):
+    features = synthetic.demandUnitFeatures(3, timesteps=2)
+    built = weights.hexOperators(features, [5, 6], cacheDir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 2
+
+    # a second call only loads
+    monkeypatch.setattr(weights, "buildHexOperators", None)
+    loaded = weights.hexOperators(features, [5, 6], cacheDir=str(tmp_path))
+
+    for (builtIds, builtW), (loadedIds, loadedW) in zip(built, loaded):
+        assert builtIds == loadedIds
+        assert (builtW != loadedW).nnz == 0
+
+def test_failed_save_leaves_nothing(tmp_path, monkeypatch):
+    hexIds, W = weights.buildHexOperator(synthetic.demandUnitFeatures(2, timesteps=2), 5)
+    path = str(tmp_path / "operator.npz")
+
+    def interrupted(outfile, **arrays):
+        outfile.write(b"PK\x03\x04 truncated")
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(weights.np, "savez_compressed", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            weights.saveOperator(path, hexIds, W)
+    assert os.listdir(tmp_path) == []
+
+    weights.saveOperator(path, hexIds, W)
+    assert os.listdir(tmp_path) == ["operator.npz"]
+    assert weights.loadOperator(path)[0] == hexIds
@@ -0,0 +1,165 @@
+import hashlib
+import os
+import tempfile
+import h3
+import numpy as np
+import scipy.sparse
+import ujson
+from raster import geojsonToGridArrays
+from coverage import geojsonToHexCoverage
+from columnar import binLattice, binnedToArrays
+from parallel import geojsonToGridArraysParallel, binLatticeParallel
+from categorical import categoryFirstSeen
+
+# Sparse (hexes x features) weight operators. Entry (h, f) is how much feature f
+# contributes to hex h at one resolution: the number of lattice points of f that
+# fall in h, or f's coverage weight (coverage.py). Once built for a geometry
+# source, any per-feature attribute matrix is aggregated with one product,
+#
+#   hex means = (W @ X) / row sums of W
+#
+# so new layers and new scenarios skip the geometry step entirely. Operators are
+# saved under operatorDir keyed by a hash of the geometries and sampling params.
+
+operatorDir = "operators"
+
+def geometryKey(dataFeatures, res, mode="lattice", scale=50):
+    digest = hashlib.sha1()
+    digest.update(ujson.dumps([res, mode, scale]).encode())
+    for feature in dataFeatures:
+        digest.update(ujson.dumps(feature["geometry"], sort_keys=True).encode())
+
+    return digest.hexdigest()
+
+def toOperator(hexIds, groups, inds, weights, nFeatures):
+    W = scipy.sparse.csr_matrix((weights, (groups, inds)), shape=(len(hexIds), nFeatures))
+    W.sum_duplicates()
+    return W
+
+# /**
+#  *
+#  * returns array of (hexIds, W), one (hexes x features) operator per resolution
+#  * in resolutions; the lattice is rasterized once for all of them, on a
+#  * process pool when workers > 1 (see parallel.py)
+#  */
+def buildHexOperators(dataFeatures, resolutions, mode="lattice", scale=50, workers=1):
+    operators = []
+
+    if mode == "lattice":
+        if workers > 1:
+            lons, lats, inds = geojsonToGridArraysParallel(dataFeatures, scale, workers)
+            binned = binLatticeParallel(lons, lats, resolutions, workers)
+        else:
+            lons, lats, inds = geojsonToGridArrays(dataFeatures, scale)
+            binned = [binLattice(lons, lats, res) for res in resolutions]
+
+        weights = np.ones(len(inds))
+        for hexIds, groups in binned:
+            operators.append((hexIds, toOperator(hexIds, groups, inds, weights, len(dataFeatures))))
+    else:
+        for res in resolutions:
+            coverage = geojsonToHexCoverage(dataFeatures, [res, res], weighted=(mode == "coverage-weighted"))
+            hexIds, groups, inds, weights = binnedToArrays(*coverage[0])
+            operators.append((hexIds, toOperator(hexIds, groups, inds, weights, len(dataFeatures))))
+
+    return operators
+
+# /**
+#  *
+#  * returns hex ids and their (hexes x features) operator at resolution res
+#  */
+def buildHexOperator(dataFeatures, res, mode="lattice", scale=50, workers=1):
+    return buildHexOperators(dataFeatures, [res], mode, scale, workers)[0]
+
+# written to a temporary file next to path and renamed into place (like
+# fetch.writeAtomic), so a killed or concurrent run never leaves a truncated .npz
+def saveOperator(path, hexIds, W):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    outfile = tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False)
+    try:
+        with outfile:
+            np.savez_compressed(outfile, hexIds=np.asarray(hexIds), data=W.data, indices=W.indices, indptr=W.indptr, shape=np.asarray(W.shape))
+        os.replace(outfile.name, path)
+    except BaseException:
+        if os.path.exists(outfile.name):
+            os.remove(outfile.name)
+        raise
+
+def loadOperator(path):
+    with np.load(path) as f:
+        W = scipy.sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+        return f["hexIds"].tolist(), W
+
+# cached buildHexOperator
+def hexOperator(dataFeatures, res, mode="lattice", scale=50, cacheDir=operatorDir, workers=1):
+    return hexOperators(dataFeatures, [res, res], mode, scale, cacheDir, workers)[0]
+
+# /**
+#  *
+#  * returns array of [hexIds, W], ordered by resolution; only resolutions
+#  * missing from cacheDir are built, all in one buildHexOperators call
+#  */
+def hexOperators(dataFeatures, resRange, mode="lattice", scale=50, cacheDir=operatorDir, workers=1):
+    minRes, maxRes = resRange
+    paths = { res: os.path.join(cacheDir, geometryKey(dataFeatures, res, mode, scale) + ".npz") for res in range(minRes, maxRes + 1) }
+
+    missing = [res for res, path in paths.items() if not os.path.exists(path)]
+    built = dict(zip(missing, buildHexOperators(dataFeatures, missing, mode, scale, workers))) if missing else {}
+
+    operators = []
+
+    for res, path in paths.items():
+        if res in built:
+            saveOperator(path, *built[res])
+            operators.append(built[res])
+        else:
+            operators.append(loadOperator(path))
+
+    return operators
+
+# operator of a coarser resolution from a finer one, by merging child rows into
+# their h3.cell_to_parent (see rollup.py for the caveat at hex edges)
+def rollupOperator(hexIds, W, res):
+    codes = {}
+    groups = np.asarray([codes.setdefault(h3.cell_to_parent(hexId, res), len(codes)) for hexId in hexIds], dtype=np.int64)
+
+    P = scipy.sparse.csr_matrix((np.ones(len(hexIds)), (groups, np.arange(len(hexIds)))), shape=(len(codes), len(hexIds)))
+    return list(codes), (P @ W).tocsr()
+
+# restricts an operator to a subset of its features (columns), dropping hexes no
+# longer covered by any of them
+def subsetOperator(hexIds, W, featureInds):
+    W = W[:, featureInds]
+    keep = np.flatnonzero(W.getnnz(axis=1))
+
+    return [hexIds[i] for i in keep], W[keep].tocsr()
+
+# /**
+#  *
+#  * returns (hexes x timesteps) weighted means of the feature rows of matrix
+#  */
+def operatorMeans(W, matrix):
+    totals = np.asarray(W.sum(axis=1)).ravel()
+    return (W @ matrix) / totals[:, None]
+
+# /**
+#  *
+#  * returns (hexes x categories) total weight per category, given an integer
+#  * category code per feature
+#  */
+def operatorCategories(W, codes, nCategories):
+    codes = np.asarray(codes, dtype=np.int64)
+    onehot = scipy.sparse.csr_matrix((np.ones(len(codes)), (np.arange(len(codes)), codes)), shape=(len(codes), nCategories))
+    return (W @ onehot).toarray()
+
+# /**
+#  *
+#  * returns (hexes x categories) lowest feature index of each category in each
+#  * hex (categorical.categoryFirstSeen), for ranking ties like maxCounter
+#  */
+def operatorFirstSeen(W, codes, nCategories):
+    W = W.tocoo()
+    nonzero = W.data != 0
+    return categoryFirstSeen(codes, W.row[nonzero].astype(np.int64), W.col[nonzero], W.shape[0], nCategories)